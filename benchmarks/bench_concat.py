@@ -0,0 +1,120 @@
+"""
+TS片段拼接方式对比
+
+生成N个片段文件后，用每种方式把它们依次拼接成一个输出文件，报告吞吐（GB/s）和
+拼接过程中进程峰值内存（RSS）的增量。"read"是原来的拼接方式（整段read()后write()），其余是
+picget.append_file支持的方式。每种方式在独立的子进程中运行，峰值内存互不影响；
+片段文件在第一轮之后通常已在页缓存中，结果反映的是拷贝本身的开销。
+
+用法:
+    python benchmarks/bench_concat.py [--segments 1000] [--size-mb 2] [--dir /tmp] [--rounds 3]
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from picget import COPY_METHODS, append_file  # noqa: E402
+
+
+def concat(method, paths, out_path):
+    """
+    用指定方式拼接paths，返回耗时秒数
+    """
+    begin = time.perf_counter()
+    with open(out_path, 'wb') as out:
+        for path in paths:
+            if method == "read":
+                with open(path, 'rb') as f:
+                    out.write(f.read())
+            else:
+                append_file(out, path, method)
+    return time.perf_counter() - begin
+
+
+def rss(field):
+    """
+    读取/proc/self/status中的内存字段（KB）：VmRSS为当前值，VmHWM为峰值；
+    读不到/proc时退回到getrusage的峰值RSS
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Linux上单位是KB
+
+
+def worker(method, directory, out_path):
+    """
+    子进程入口：拼接后输出 "耗时 峰值RSS增量(KB)"
+    """
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # 把峰值RSS重置为当前值，排除import阶段的峰值
+    except OSError:
+        pass
+    baseline = rss("VmRSS")
+    elapsed = concat(method, paths, out_path)
+    peak = rss("VmHWM")
+    print(elapsed, max(0, peak - baseline))
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        worker(*sys.argv[2:])
+        return
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=1000)
+    parser.add_argument("--size-mb", type=float, default=2, help="每个片段的大小（MB）")
+    parser.add_argument("--dir", default=None, help="临时文件目录（默认系统临时目录）")
+    parser.add_argument("--rounds", type=int, default=3, help="每种方式的运行次数，取最快一次")
+    args = parser.parse_args()
+    
+    work = tempfile.mkdtemp(prefix="bench_concat_", dir=args.dir)
+    segment_dir = os.path.join(work, "segments")
+    out_path = os.path.join(work, "out.mp4")
+    os.makedirs(segment_dir)
+    try:
+        size = int(args.size_mb * 1024 * 1024)
+        block = os.urandom(size)
+        for i in range(args.segments):
+            with open(os.path.join(segment_dir, f"{i:06d}.ts"), 'wb') as f:
+                f.write(block)
+        total = size * args.segments
+        
+        print(f"{args.segments} 个片段 x {args.size_mb} MB = {total / 1e9:.2f} GB")
+        print(f"{'方式':<18}{'耗时(s)':>10}{'GB/s':>8}{'峰值RSS增量(MB)':>16}")
+        for method in ("read",) + COPY_METHODS:
+            best, peak = None, 0
+            for _ in range(args.rounds):
+                result = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", method, segment_dir, out_path],
+                                        capture_output=True, text=True)
+                if result.returncode != 0:
+                    break
+                elapsed, rss = result.stdout.split()
+                best = float(elapsed) if best is None else min(best, float(elapsed))
+                peak = max(peak, int(rss))
+            ok = best is not None and os.path.getsize(out_path) == total
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            if not ok:
+                print(f"{method:<18}{'不支持':>10}")
+                continue
+            print(f"{method:<18}{best:>10.2f}{total / best / 1e9:>8.2f}{peak / 1024:>16.1f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
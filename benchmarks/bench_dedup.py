@@ -0,0 +1,60 @@
+"""
+去重集合与进度计数器的并发压测
+
+测量picget.ConcurrentHashSet在不同线程数下的吞吐，
+并检查高并发下是否出现重复登记或计数丢失。
+
+用法:
+    python benchmarks/bench_dedup.py [--ops 200000] [--threads 1,10,50,100]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from picget import AtomicCounter, ConcurrentHashSet  # noqa: E402
+
+
+def run(threads, ops):
+    """
+    用threads个线程对同一个集合执行ops次add_if_absent（一半键重复）
+
+    返回:
+        (耗时秒数, 登记成功次数, 计数器结果)
+    """
+    dedup = ConcurrentHashSet()
+    added = AtomicCounter()
+    keys = [f"{i % (ops // 2):032x}" for i in range(ops)]
+    per_thread = ops // threads
+
+    def worker(start):
+        for key in keys[start:start + per_thread]:
+            if dedup.add_if_absent(key):
+                added.increment()
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(0, per_thread * threads, per_thread)))
+    return time.perf_counter() - begin, added.value, per_thread * threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=200000)
+    parser.add_argument("--threads", default="1,10,50,100")
+    args = parser.parse_args()
+
+    print(f"{'线程':>6}{'耗时(s)':>10}{'ops/s':>12}{'登记':>10}")
+    for threads in (int(t) for t in args.threads.split(",")):
+        elapsed, added, total = run(threads, args.ops)
+        unique = len({i % (args.ops // 2) for i in range(total)})
+        status = "OK" if added == unique else f"错误(期望{unique})"
+        print(f"{threads:>6}{elapsed:>10.3f}{total / elapsed:>12.0f}{added:>10} {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,3029 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, font as tkfont
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from collections import deque
 import time
 import random
 import os
+import multiprocessing
+import shutil
 import hashlib
+import json
+import logging
+import mmap
+from logging.handlers import RotatingFileHandler
+import sqlite3
+from contextlib import contextmanager, asynccontextmanager, nullcontext
+from functools import partial
 from urllib.parse import urljoin, urlparse
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
 from urllib.parse import unquote
+from email.utils import parsedate_to_datetime
+
+try:
+    import aiohttp  # 可选依赖：asyncio下载引擎使用
+except ImportError:
+    aiohttp = None
+
+try:
+    from PIL import Image  # 可选依赖：近似重复检测使用
+except ImportError:
+    Image = None
+
+
+# 去重哈希算法：名称 -> 哈希对象工厂
+# 哈希值统一带算法前缀（如 "blake2b:..."），不同算法的结果在索引中不会混淆
+HASH_BACKENDS = {
+    "md5": hashlib.md5,
+    "blake2b": lambda: hashlib.blake2b(digest_size=16),
+    "sha1": hashlib.sha1,
+}
+
+
+def compute_dhash(path):
+    """
+    计算图片的差异哈希（dHash），在进程池中执行
+    缩放为9x8灰度图后比较相邻像素亮度，得到64位指纹；
+    重新压缩或缩放过的同一张图片指纹之间的汉明距离很小
+    
+    参数:
+        path: 图片文件路径
+    返回:
+        64位整数指纹；图片无法解码时返回None
+    """
+    try:
+        with Image.open(path) as img:
+            pixels = list(img.convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming_distance(a, b):
+    """
+    两个指纹之间不同的位数
+    """
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    按汉明距离组织的BK树
+    利用三角不等式剪枝，查找距离不超过阈值的指纹时只需访问很少的节点
+    """
+    
+    def __init__(self):
+        self._root = None  # 节点: [指纹, 附带数据, {距离: 子节点}]
+        self._live = set()  # 仍在树中的附带数据（BK树不便删除节点，已移除的节点查找时跳过）
+        self.size = 0
+    
+    def add(self, value, payload):
+        """
+        添加一个指纹
+        
+        参数:
+            value: 64位指纹
+            payload: 附带数据（如文件路径）
+        """
+        self.size += 1
+        self._live.add(payload)
+        if self._root is None:
+            self._root = [value, payload, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, payload, {}]
+                return
+            node = child
+    
+    def search(self, value, max_distance):
+        """
+        查找距离不超过max_distance的所有指纹
+        
+        返回:
+            [(距离, 附带数据), ...] 按距离升序排列
+        """
+        results = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance and node[1] in self._live:
+                results.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(results, key=lambda item: item[0])
+    
+    def remove(self, payload):
+        """
+        移除附带数据为payload的指纹（之后的查找不再返回它；不在树中时忽略）
+        """
+        if payload not in self._live:
+            return
+        self._live.discard(payload)
+        self.size -= 1
+
+
+class PerceptualDeduper:
+    """
+    近似重复检测
+    图片保存后在进程池中计算dHash，与同一下载根目录下已有的指纹比较，
+    汉明距离不超过阈值的视为近似重复，按设置标记或删除
+    """
+    
+    def __init__(self, index, threshold=6, action="flag"):
+        """
+        参数:
+            index: 下载根目录的HashIndex，指纹和近似重复记录保存在其中
+            threshold: 汉明距离阈值（0-64）
+            action: "flag" 只记录，"drop" 删除新下载的近似重复图片
+        """
+        self.index = index
+        self.threshold = threshold
+        self.action = action
+        self.flagged = 0
+        self.dropped = 0
+        self._tree = BKTree()
+        for path, value in index.load_phashes():
+            self._tree.add(value, path)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._pool = None
+    
+    def submit(self, path, image_hash, on_match=None):
+        """
+        提交一张新保存的图片进行检测（立即返回）
+        
+        参数:
+            path: 图片文件路径
+            image_hash: 图片内容哈希，删除近似重复时把它指向保留的文件
+            on_match: 发现近似重复时的回调 on_match(path, match_path, distance)
+        """
+        with self._lock:
+            if self._pool is None:
+                # 用spawn启动工作进程：fork多线程的Tk进程可能死锁
+                self._pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+            future = self._pool.submit(compute_dhash, path)
+            self._pending.add(future)
+        future.add_done_callback(lambda f: self._on_hashed(f, path, image_hash, on_match))
+    
+    def _on_hashed(self, future, path, image_hash, on_match):
+        """
+        指纹计算完成后查找近似重复并登记
+        """
+        try:
+            value = future.result()
+        except Exception:
+            value = None
+        stale = []
+        with self._lock:
+            self._pending.discard(future)
+            if value is None:
+                return
+            match = None
+            for distance, match_path in self._tree.search(value, self.threshold):
+                if os.path.exists(match_path):
+                    match = (distance, match_path)
+                    break
+                # 已被用户删除或移动的文件：移除过期指纹，不能因为它删掉新下载的图片
+                self._tree.remove(match_path)
+                stale.append(match_path)
+            if match is None:
+                self._tree.add(value, path)
+        for match_path in stale:
+            self.index.remove_phash(match_path)
+        if match is None:
+            self.index.record_phash(path, value)
+            return
+        
+        distance, match_path = match
+        self.index.record_near_duplicate(path, match_path, distance)
+        if self.action == "drop":
+            try:
+                os.remove(path)
+                # 内容哈希改为指向保留的文件，下次遇到同一内容仍会识别为已下载
+                self.index.repoint(image_hash, match_path)
+                with self._lock:
+                    self.dropped += 1
+            except OSError:
+                pass
+        else:
+            with self._lock:
+                self.flagged += 1
+        if on_match:
+            on_match(path, match_path, distance)
+    
+    def wait(self):
+        """
+        等待所有已提交的图片检测完成
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return
+            for future in pending:
+                try:
+                    future.result()
+                except Exception:
+                    pass
+            time.sleep(0.01)  # 等待完成回调执行完毕
+    
+    def close(self):
+        """
+        关闭工作进程池（程序退出时调用），尚未开始的检测直接取消
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def summary(self):
+        """
+        生成检测结果的日志文本
+        """
+        return f"近似重复: 标记 {self.flagged} 张, 删除 {self.dropped} 张 (指纹库 {self._tree.size} 张)"
+
+
+class HostRateLimiter:
+    """
+    每主机令牌桶限速器
+    所有请求发送前先向目标主机的令牌桶预约一个令牌，
+    聚合速率精确等于设定的“请求/秒”，允许短时突发。
+    令牌桶的速率在第一次遇到该主机时确定，之后只有configure()才会改变
+    """
+    
+    def __init__(self):
+        """
+        初始化限速器（默认不限速）
+        """
+        self.default_rate = 0  # 默认速率（请求/秒），0表示不限速
+        self.default_burst = 1  # 默认突发数
+        self.host_rates = {}  # 主机 -> (速率, 突发数)，匹配主机本身及其子域名
+        self._buckets = {}  # 主机 -> [令牌数, 上次补充时间, 速率, 突发数]
+        self._lock = threading.Lock()
+    
+    def configure(self, default_rate, default_burst, host_rates):
+        """
+        更新限速配置（每次开始下载时调用），已有的令牌桶作废，下次请求按新配置重新建立
+        
+        参数:
+            default_rate: 未单独配置的主机使用的速率，0表示不限速
+            default_burst: 默认突发数
+            host_rates: 字典 {主机: (速率, 突发数)}
+        """
+        with self._lock:
+            self.default_rate = default_rate
+            self.default_burst = max(1, default_burst)
+            self.host_rates = dict(host_rates)
+            self._buckets.clear()
+    
+    def _rate_for(self, host, fallback):
+        """
+        查找主机适用的令牌桶和 (速率, 突发数)
+        优先级：主机配置 > 默认速率 > 调用方提供的后备速率
+        
+        返回:
+            (令牌桶键, (速率, 突发数)) 元组；按主机配置匹配时同一配置下的子域名共用一个令牌桶
+        """
+        for pattern, rate in self.host_rates.items():
+            if host == pattern or host.endswith("." + pattern):
+                return pattern, rate
+        if self.default_rate > 0:
+            return host, (self.default_rate, self.default_burst)
+        return host, fallback
+    
+    def reserve(self, url, fallback=None):
+        """
+        为一次请求预约令牌
+        
+        参数:
+            url: 请求URL
+            fallback: 没有配置速率时使用的 (速率, 突发数)，None表示不限速；
+                只在第一次为该主机建立令牌桶时生效，之后其他调用方给出的后备速率不改变它
+        返回:
+            发送请求前需要等待的秒数
+        """
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            key, limit = self._rate_for(host, fallback)
+            now = time.monotonic()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if not limit or limit[0] <= 0:
+                    return 0
+                rate, burst = limit
+                bucket = [burst, now, rate, burst]
+                self._buckets[key] = bucket
+            rate, burst = bucket[2], bucket[3]
+            # 补充令牌到现在，最多补满突发数
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            # 令牌可以预支为负数，等待时间即偿还欠账所需时间，保证先到先得
+            bucket[0] -= 1
+            if bucket[0] >= 0:
+                return 0
+            return -bucket[0] / rate
+    
+    def acquire(self, url, fallback=None):
+        """
+        阻塞等待直到可以向该主机发送请求
+        """
+        wait = self.reserve(url, fallback)
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self, url, fallback=None):
+        """
+        asyncio版本的acquire，等待期间不占用线程
+        """
+        wait = self.reserve(url, fallback)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    目标主机处于熔断状态，请求未发送即失败
+    """
+
+
+class HostCircuitBreaker:
+    """
+    每主机熔断器
+    同一主机连续失败（连接失败、超时、5xx）达到阈值后熔断：冷却期内发往该主机的请求立即失败，
+    不再占用线程等待超时；冷却期结束后半开，只放行一个探测请求，
+    探测成功则恢复，失败则再次熔断并加倍冷却时间。其他主机的请求不受影响
+    """
+    
+    FAILURE_STATUS = frozenset({500, 502, 503, 504})
+    
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=300.0, probe_timeout=120.0):
+        """
+        参数:
+            failure_threshold: 触发熔断的连续失败次数，0表示不熔断
+            cooldown: 第一次熔断的冷却时间（秒）
+            max_cooldown: 冷却时间上限（秒）
+            probe_timeout: 半开探测请求超过该时间没有结果时，允许另一个探测请求
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+        self._circuits = {}  # 主机 -> {"state", "failures", "opened_at", "cooldown", "probe_at"}
+        self._lock = threading.Lock()
+        self.rejected = 0  # 熔断期间被直接拒绝的请求数
+        self.trips = 0  # 熔断次数
+    
+    def configure(self, failure_threshold, cooldown):
+        """
+        更新熔断配置（已熔断的主机保持当前状态）
+        """
+        with self._lock:
+            self.failure_threshold = failure_threshold
+            self.cooldown = cooldown
+            self.max_cooldown = max(self.max_cooldown, cooldown)
+    
+    def allow(self, url):
+        """
+        请求发送前检查目标主机是否可用
+        
+        异常:
+            CircuitOpenError: 主机处于熔断状态
+        """
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit["state"] == "closed":
+                return
+            now = time.monotonic()
+            if circuit["state"] == "open" and now >= circuit["opened_at"] + circuit["cooldown"]:
+                # 冷却结束：当前请求作为探测请求
+                circuit["state"] = "half_open"
+                circuit["probe_at"] = now
+                return
+            if circuit["state"] == "half_open" and now - circuit["probe_at"] > self.probe_timeout:
+                circuit["probe_at"] = now
+                return
+            self.rejected += 1
+            remaining = max(0.0, circuit["opened_at"] + circuit["cooldown"] - now)
+        raise CircuitOpenError(f"{host} 连续失败已熔断，{remaining:.0f} 秒后重新探测")
+    
+    def record_success(self, url):
+        """
+        记录一次成功的请求：清零连续失败次数，半开状态下恢复主机
+        """
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None:
+                return
+            circuit["failures"] = 0
+            if circuit["state"] == "half_open":
+                circuit["state"] = "closed"
+                circuit["cooldown"] = self.cooldown
+    
+    def record_failure(self, url):
+        """
+        记录一次失败的请求，连续失败达到阈值或半开探测失败时熔断
+        """
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            circuit = self._circuits.setdefault(host, {
+                "state": "closed", "failures": 0, "opened_at": 0.0, "cooldown": self.cooldown, "probe_at": 0.0,
+            })
+            circuit["failures"] += 1
+            now = time.monotonic()
+            if circuit["state"] == "half_open":
+                circuit["state"] = "open"
+                circuit["opened_at"] = now
+                circuit["cooldown"] = min(self.max_cooldown, circuit["cooldown"] * 2)
+                self.trips += 1
+            elif (circuit["state"] == "closed" and self.failure_threshold > 0
+                    and circuit["failures"] >= self.failure_threshold):
+                circuit["state"] = "open"
+                circuit["opened_at"] = now
+                circuit["cooldown"] = self.cooldown
+                self.trips += 1
+    
+    def record_response(self, url, status):
+        """
+        按HTTP状态码记录请求结果
+        """
+        if status in self.FAILURE_STATUS:
+            self.record_failure(url)
+        else:
+            self.record_success(url)
+    
+    def record_error(self, url, error):
+        """
+        按异常记录请求结果：只有连接失败、超时和响应体传输中断说明主机有问题
+        """
+        if isinstance(error, CircuitOpenError):
+            return
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError, asyncio.TimeoutError)):
+            self.record_failure(url)
+        elif aiohttp is not None and isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+            self.record_failure(url)
+    
+    def open_hosts(self):
+        """
+        返回当前处于熔断或半开状态的主机列表
+        """
+        with self._lock:
+            return sorted(host for host, circuit in self._circuits.items() if circuit["state"] != "closed")
+
+
+class RetryPolicy:
+    """
+    统一的重试策略
+    把错误分为可重试（连接失败、超时、传输中断、408/425/429/5xx）和不可重试两类；
+    可重试的错误按指数退避加随机抖动等待后重试，服务器给出Retry-After时至少等待该时长。
+    每个主机有独立的重试预算：成功的请求和时间流逝积累预算，每次重试消耗一次，
+    主机大面积故障时预算很快耗尽，避免重试把请求量放大数倍
+    """
+    
+    RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+    
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30.0, max_retry_after=120.0,
+                 budget_ratio=0.2, budget_per_second=1.0, budget_initial=20, budget_max=200):
+        """
+        参数:
+            max_attempts: 每个请求最多尝试的次数（含第一次）
+            base_delay: 第一次重试的退避上限（秒），之后每次翻倍
+            max_delay: 退避上限（秒）
+            max_retry_after: Retry-After最多遵守的时长（秒）
+            budget_ratio: 每个成功的请求为该主机积累的重试次数
+            budget_per_second: 每秒为每个主机恢复的重试次数
+            budget_initial: 每个主机的初始重试预算
+            budget_max: 每个主机最多积累的重试预算
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget_ratio = budget_ratio
+        self.budget_per_second = budget_per_second
+        self.budget_initial = budget_initial
+        self.budget_max = budget_max
+        self._budgets = {}  # 主机 -> [剩余预算, 上次更新时间]
+        self._lock = threading.Lock()
+        self.retries = 0  # 累计重试次数
+        self.gave_up = 0  # 可重试的错误因次数或预算耗尽而放弃的次数
+    
+    @staticmethod
+    def status_of(error):
+        """
+        返回HTTP错误的状态码，不是HTTP状态错误时返回None
+        """
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            return error.response.status_code
+        if aiohttp is not None and isinstance(error, aiohttp.ClientResponseError):
+            return error.status
+        return None
+    
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        解析Retry-After响应头（秒数或HTTP日期）
+        
+        返回:
+            需要等待的秒数；无法解析时返回None
+        """
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError, IndexError):
+            return None
+    
+    def is_retryable(self, error):
+        """
+        判断错误是否值得重试
+        """
+        status = self.status_of(error)
+        if status is not None:
+            return status in self.RETRYABLE_STATUS
+        if isinstance(error, RESUMABLE_ERRORS):
+            return True
+        if aiohttp is not None and isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+            return True
+        return isinstance(error, asyncio.TimeoutError)
+    
+    def backoff(self, attempt, error=None):
+        """
+        计算第attempt次失败后的等待时间：在[0, min(上限, 基数*2^attempt)]内随机取值，
+        错误响应带Retry-After时至少等待该时长
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        headers = None
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            headers = error.response.headers
+        elif aiohttp is not None and isinstance(error, aiohttp.ClientResponseError):
+            headers = error.headers
+        retry_after = self.parse_retry_after(headers.get('retry-after')) if headers else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+    
+    def _budget(self, host, now):
+        """
+        返回主机的预算记录并按经过的时间恢复预算（调用方持有锁）
+        """
+        budget = self._budgets.get(host)
+        if budget is None:
+            budget = [self.budget_initial, now]
+            self._budgets[host] = budget
+        budget[0] = min(self.budget_max, budget[0] + (now - budget[1]) * self.budget_per_second)
+        budget[1] = now
+        return budget
+    
+    def succeeded(self, url):
+        """
+        记录一次成功的请求，为该主机积累重试预算
+        """
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            budget = self._budget(host, time.monotonic())
+            budget[0] = min(self.budget_max, budget[0] + self.budget_ratio)
+    
+    def next_delay(self, url, error, attempt):
+        """
+        第attempt次（从0开始）尝试失败后，判断是否重试
+        
+        返回:
+            重试前需要等待的秒数；不应重试时返回None（调用方应抛出原错误）
+        """
+        if not self.is_retryable(error) or isinstance(error, CircuitOpenError):
+            return None  # 熔断期间不重试，直接失败
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            if attempt + 1 >= self.max_attempts:
+                self.gave_up += 1
+                return None
+            budget = self._budget(host, time.monotonic())
+            if budget[0] < 1:
+                self.gave_up += 1
+                return None
+            budget[0] -= 1
+            self.retries += 1
+        return self.backoff(attempt, error)
+    
+    def wait(self, url, error, attempt):
+        """
+        需要重试时等待退避时间
+        
+        返回:
+            应该重试返回True；返回False时调用方应抛出原错误
+        """
+        delay = self.next_delay(url, error, attempt)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+    
+    async def wait_async(self, url, error, attempt):
+        """
+        asyncio版本的wait，等待期间不占用线程
+        """
+        delay = self.next_delay(url, error, attempt)
+        if delay is None:
+            return False
+        await asyncio.sleep(delay)
+        return True
+    
+    def call(self, url, func):
+        """
+        调用func()，遇到可重试的错误时按策略重试
+        
+        参数:
+            url: 请求URL（用于按主机计算重试预算）
+            func: 无参数的函数
+        返回:
+            func()的返回值
+        """
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                if not self.wait(url, e, attempt):
+                    raise
+                attempt += 1
+
+
+class HttpSessionPool:
+    """
+    共享HTTP连接池会话
+    所有抓取路径（页面、图片、TS切片）共用一个requests.Session，
+    按主机复用keep-alive连接，避免每个请求都重新进行TCP+TLS握手
+    """
+    
+    RETRY = object()  # transfer()的handle返回它表示立即重新请求（消耗一次尝试）
+    
+    def __init__(self, pool_size=10, max_hosts=32):
+        """
+        初始化连接池会话
+        
+        参数:
+            pool_size: 每个主机的连接池大小（通常等于线程数量）
+            max_hosts: 同时保留连接池的主机数量
+        """
+        self.session = requests.Session()
+        self.limiter = HostRateLimiter()  # 所有请求共享的每主机限速器
+        self.retry = RetryPolicy()  # 所有请求共享的重试策略和每主机重试预算
+        self.breaker = HostCircuitBreaker()  # 所有请求共享的每主机熔断器
+        self.max_hosts = max_hosts
+        self.pool_size = 0
+        self._lock = threading.Lock()
+        self._retired_requests = 0  # 已替换适配器上累计的请求数
+        self._retired_connections = 0  # 已替换适配器上累计的新建连接数
+        self.resize(pool_size)
+    
+    def resize(self, pool_size):
+        """
+        按线程数量调整每个主机的连接池大小
+        urllib3连接池的大小不能原地修改，扩大时要换上新的适配器，旧适配器上的
+        keep-alive连接会被关闭（正在使用的连接在请求结束后关闭），之后重新建立；
+        所以只增不减，线程数不超过已有大小时保留现有连接
+        
+        参数:
+            pool_size: 期望的每主机连接数
+        """
+        pool_size = max(1, int(pool_size))
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+            retired = set(self.session.adapters.values())
+            adapter = HTTPAdapter(pool_connections=self.max_hosts, pool_maxsize=pool_size)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+            self.pool_size = pool_size
+            # 累加旧连接池的统计后关闭它，释放其中的socket
+            for old in retired:
+                requests_count, connections_count = self._adapter_counts(old)
+                self._retired_requests += requests_count
+                self._retired_connections += connections_count
+                old.close()
+    
+    def admit(self, url, rate=None):
+        """
+        请求发送前的准入：检查熔断器，再在限速器上等待令牌
+        占用并发名额的调用方应先调用它再进入controller.track()，避免持有名额睡眠
+        
+        异常:
+            CircuitOpenError: 目标主机处于熔断状态
+        """
+        self.breaker.allow(url)
+        self.limiter.acquire(url, rate)
+    
+    def get(self, url, rate=None, admitted=False, **kwargs):
+        """
+        通过共享会话发送GET请求，发送前先经过每主机熔断器和限速器
+        
+        参数:
+            url: 请求URL
+            rate: 没有配置限速时使用的后备 (速率, 突发数)
+            admitted: 调用方已经调用过admit()时为True
+            **kwargs: 透传给requests的参数（headers、timeout、stream等）
+        返回:
+            requests.Response对象
+        异常:
+            CircuitOpenError: 目标主机处于熔断状态
+        """
+        if not admitted:
+            self.admit(url, rate)
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_error(url, e)
+            raise
+        self.breaker.record_response(url, response.status_code)
+        if response.status_code < 400:
+            self.retry.succeeded(url)  # 只有成功的响应积累重试预算，403/404等失败不算
+        return response
+    
+    def fetch(self, url, rate=None, **kwargs):
+        """
+        发送GET请求并检查状态码，遇到可重试的错误时按重试策略重试（用于页面等小响应）
+        
+        参数:
+            同get()
+        返回:
+            状态码为2xx/3xx的requests.Response对象
+        异常:
+            requests.exceptions.RequestException: 不可重试的错误，或重试次数/预算耗尽
+        """
+        def attempt():
+            response = self.get(url, rate=rate, **kwargs)
+            response.raise_for_status()
+            return response
+        return self.retry.call(url, attempt)
+    
+    def transfer(self, url, handle, headers=None, rate=None, controller=None, on_error=None, **kwargs):
+        """
+        发送GET请求并在连接内处理响应，失败时按重试策略退避后重试。
+        每次尝试先在限速器上等待，再占用controller的并发名额；读取响应体时的错误也计入熔断器
+        
+        参数:
+            url: 请求URL
+            handle: handle(response) 在并发名额内处理响应；返回RETRY表示立即重新请求
+            headers: 请求头，或每次尝试前调用的无参函数（续传时Range随已写入的长度变化）
+            rate: 没有配置限速时使用的后备 (速率, 突发数)
+            controller: 可选的自适应并发控制器
+            on_error: 可选，每次失败后、退避前调用的无参函数（如保存续传进度）
+            **kwargs: 透传给requests的参数（timeout、stream等）
+        返回:
+            handle()的返回值；尝试次数用尽时仍要求重新请求则返回None
+        异常:
+            最后一次尝试的错误（不可重试，或重试次数/预算耗尽）
+        """
+        for attempt in range(self.retry.max_attempts):
+            response = None
+            try:
+                request_headers = headers() if callable(headers) else headers
+                self.admit(url, rate)  # 先等令牌，不持有并发名额睡眠
+                with controller.track() if controller else nullcontext() as sample:
+                    response = self.get(url, admitted=True, headers=request_headers, **kwargs)
+                    if sample:
+                        sample.responded(response.status_code)
+                    with response:
+                        result = handle(response)
+            except Exception as e:
+                if response is not None:
+                    self.breaker.record_error(url, e)  # 读取响应体时出错，get()没有记录
+                if on_error:
+                    on_error()
+                if not self.retry.wait(url, e, attempt):
+                    raise
+                continue
+            if result is not self.RETRY:
+                return result
+        return None
+    
+    async def transfer_async(self, session, url, handle, headers=None, rate=None, controller=None, on_error=None, **kwargs):
+        """
+        asyncio版本的transfer，限速和退避等待期间不占用线程
+        先在限速器上等待，再通过session发出请求；session为AsyncBatch时，等待期间不占用批次的并发名额
+        
+        参数:
+            session: aiohttp会话或AsyncBatch
+            handle: 协程函数 handle(response)；返回RETRY表示立即重新请求
+            on_error: 可选，每次失败后、退避前等待的无参协程函数
+            其余同transfer()
+        """
+        for attempt in range(self.retry.max_attempts):
+            try:
+                request_headers = headers() if callable(headers) else headers
+                self.breaker.allow(url)
+                await self.limiter.acquire_async(url, rate)
+                async with controller.track_async() if controller else nullcontext() as sample:
+                    async with session.get(url, headers=request_headers, **kwargs) as response:
+                        if sample:
+                            sample.responded(response.status)
+                        self.breaker.record_response(url, response.status)
+                        if response.status < 400:
+                            self.retry.succeeded(url)
+                        result = await handle(response)
+            except Exception as e:
+                self.breaker.record_error(url, e)
+                if on_error:
+                    await on_error()
+                if not await self.retry.wait_async(url, e, attempt):
+                    raise
+                continue
+            if result is not self.RETRY:
+                return result
+        return None
+    
+    @staticmethod
+    def _adapter_counts(adapter):
+        """
+        统计一个适配器下所有主机连接池的请求数和新建连接数
+        
+        返回:
+            (请求数, 新建连接数) 元组
+        """
+        requests_count = 0
+        connections_count = 0
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_count += pool.num_requests
+            connections_count += pool.num_connections
+        return requests_count, connections_count
+    
+    def stats(self):
+        """
+        统计连接复用情况
+        
+        返回:
+            字典: requests 总请求数, new_connections 新建连接数, reused 复用连接的请求数
+        """
+        with self._lock:
+            requests_count = self._retired_requests
+            connections_count = self._retired_connections
+            for adapter in set(self.session.adapters.values()):
+                r, c = self._adapter_counts(adapter)
+                requests_count += r
+                connections_count += c
+        return {
+            "requests": requests_count,
+            "new_connections": connections_count,
+            "reused": max(0, requests_count - connections_count),
+        }
+    
+    def stats_message(self):
+        """
+        生成连接复用统计的日志文本
+        """
+        stats = self.stats()
+        return (f"连接统计: 请求 {stats['requests']} 次, 新建连接 {stats['new_connections']} 个, 复用 {stats['reused']} 次, "
+                f"重试 {self.retry.retries} 次, 放弃重试 {self.retry.gave_up} 次, "
+                f"熔断 {self.breaker.trips} 次, 熔断拒绝 {self.breaker.rejected} 次")
+
+
+class LatencySample:
+    """
+    一次请求的延迟采样：从占用并发名额到收到响应头的时间
+    响应体的传输时间与文件大小有关，不反映服务端排队，不计入延迟
+    """
+    
+    def __init__(self):
+        self.start = time.monotonic()
+        self.latency = None  # 没有收到2xx响应头时为None
+    
+    def responded(self, status):
+        """
+        收到响应头时调用；只有2xx响应计入延迟（304、错误响应的耗时与正常响应不可比）
+        """
+        if self.latency is None and 200 <= status < 300:
+            self.latency = time.monotonic() - self.start
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD自适应并发控制器
+    延迟和错误率正常时逐步增加并发（加性增），
+    遇到429/503/超时时并发减半（乘性减），线程数量设置作为上限。
+    延迟按收到响应头的时间计算，与最近一段时间内的最低平均延迟比较
+    """
+    
+    CONGESTION_STATUS = (429, 503)  # 表示服务端过载/限流的状态码
+    BASELINE_WINDOW = 100  # 参照延迟取最近多少次采样的平均延迟的最小值
+    
+    def __init__(self, max_limit, min_limit=1, initial_limit=2):
+        """
+        初始化控制器
+        
+        参数:
+            max_limit: 并发上限（线程数量设置）
+            min_limit: 并发下限
+            initial_limit: 初始并发数
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(max(self.min_limit, min(initial_limit, self.max_limit)))
+        self.in_flight = 0
+        self.slow_start = True  # 首次拥塞前每次成功并发加1，之后每轮加1
+        self._latency = None  # 响应头延迟的指数移动平均
+        self._history = deque(maxlen=self.BASELINE_WINDOW)  # 最近的平均延迟，其最小值作为“健康”参照
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+    
+    def acquire(self):
+        """
+        阻塞直到当前并发数低于上限，然后占用一个名额
+        """
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+    
+    def release(self):
+        """
+        释放一个并发名额
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+    
+    @contextmanager
+    def track(self):
+        """
+        占用一个并发名额执行一次请求，并按结果调整并发上限
+        用法: with controller.track() as sample: ...，收到响应头时调用sample.responded(状态码)
+        （with块内抛出的异常会被归类后继续抛出）
+        """
+        self.acquire()
+        sample = LatencySample()
+        try:
+            yield sample
+        except Exception as e:
+            self.record(sample.latency, self.outcome_of(e))
+            raise
+        else:
+            self.record(sample.latency)
+        finally:
+            self.release()
+    
+    @asynccontextmanager
+    async def track_async(self):
+        """
+        asyncio版本的track：并发名额由AsyncDownloadEngine控制，这里只记录结果
+        """
+        sample = LatencySample()
+        try:
+            yield sample
+        except Exception as e:
+            self.record(sample.latency, self.outcome_of(e))
+            raise
+        else:
+            self.record(sample.latency)
+    
+    @classmethod
+    def outcome_of(cls, error):
+        """
+        把请求异常归类为控制器关心的结果
+        
+        参数:
+            error: 请求抛出的异常
+        返回:
+            "congested" 表示服务端过载/超时，"error" 表示与负载无关的失败
+        """
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if status is None:
+            status = getattr(error, "status", None)  # aiohttp.ClientResponseError
+        if status in cls.CONGESTION_STATUS:
+            return "congested"
+        if isinstance(error, (requests.exceptions.Timeout, asyncio.TimeoutError, TimeoutError)):
+            return "congested"
+        return "error"
+    
+    def record(self, latency, outcome="ok"):
+        """
+        记录一次请求结果并调整并发上限
+        
+        参数:
+            latency: 收到响应头的延迟（秒）；None表示没有可用的采样（如304、传输前失败）
+            outcome: "ok" 成功，"congested" 过载/超时，"error" 其他失败（不调整）
+        """
+        with self._cond:
+            now = time.monotonic()
+            # 同一个往返周期内只减一次，避免一次突发把并发压到底
+            can_decrease = now - self._last_decrease >= (self._latency or 1.0)
+            if outcome == "congested":
+                if can_decrease:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+                self.slow_start = False
+                return
+            if outcome != "ok":
+                return
+            
+            queued = False
+            if latency is not None:
+                self._latency = latency if self._latency is None else self._latency * 0.8 + latency * 0.2
+                self._history.append(self._latency)
+                queued = self._latency > min(self._history) * 2
+            
+            if queued:
+                # 延迟明显变高：服务端或链路开始排队，轻微回退
+                if can_decrease:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                    self._last_decrease = now
+                self.slow_start = False
+            elif self.slow_start:
+                self.limit = min(self.max_limit, self.limit + 1)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class IncompleteDownload(IOError):
+    """
+    传输中断或续传响应与已下载部分不一致，可以（从断点）重试
+    """
+
+
+# 可以从断点重试的传输错误
+RESUMABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout, IncompleteDownload)
+
+
+class ResumableFile:
+    """
+    支持断点续传的.part文件
+    传输过程中把服务器的ETag/Last-Modified和总长度记录在旁边的.json元数据里；
+    传输中断时保留.part文件，下次请求用Range从已写入的位置继续，
+    If-Range保证服务器内容变化时返回完整内容而不是拼接出错误的文件
+    """
+    
+    CHUNK_SIZE = 65536  # 流式读取的块大小
+    
+    def __init__(self, url, part_path):
+        """
+        参数:
+            url: 下载URL
+            part_path: .part文件路径（同一URL每次使用相同的路径才能续传）
+        """
+        self.url = url
+        self.part_path = part_path
+        self.meta_path = part_path + ".json"
+        self.offset = 0  # 本次请求的续传起点
+        self.size = 0  # .part文件当前大小
+        self.expected = None  # 完整文件的长度（未知时为None）
+        self._meta = None
+        self._file = None
+        self._load()
+    
+    def _load(self):
+        """
+        读取上次中断时留下的元数据，URL一致且.part文件存在时才续传
+        """
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("url") == self.url and os.path.exists(self.part_path):
+                self._meta = meta
+                self.offset = os.path.getsize(self.part_path)
+        except (OSError, ValueError):
+            self._meta = None
+            self.offset = 0
+    
+    def request_headers(self):
+        """
+        续传时需要附加的请求头
+        
+        返回:
+            字典；没有可续传的部分时为空
+        """
+        if self.offset <= 0 or self._meta is None:
+            return {}
+        headers = {"Range": f"bytes={self.offset}-", "Accept-Encoding": "identity"}
+        validator = self._meta.get("etag") or self._meta.get("last_modified")
+        if validator:
+            headers["If-Range"] = validator
+        return headers
+    
+    def begin(self, status, headers):
+        """
+        根据响应状态打开.part文件：206且范围吻合时追加写入，否则从头写入
+        
+        参数:
+            status: HTTP状态码
+            headers: 响应头
+        异常:
+            IncompleteDownload: 206响应的范围与已下载部分不一致（已删除.part，重试会从头下载）
+        """
+        encoded = headers.get('content-encoding', 'identity').lower() not in ('', 'identity')
+        if status == 206 and self.offset > 0:
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', headers.get('content-range', ''))
+            total = int(match.group(2)) if match and match.group(2) != '*' else None
+            known_total = self._meta.get("length") if self._meta else None
+            if not match or int(match.group(1)) != self.offset or (known_total and total != known_total):
+                self.discard()
+                raise IncompleteDownload(f"续传范围不一致: {headers.get('content-range')}")
+            self._file = open(self.part_path, 'ab')
+            self.size = self.offset
+            self.expected = total
+            self.on_resume()
+        else:
+            # 服务器忽略了Range或内容已变化：从头下载
+            self.offset = 0
+            self.size = 0
+            self._file = open(self.part_path, 'wb')
+            length = headers.get('content-length')
+            self.expected = int(length) if length and length.isdigit() and not encoded else None
+        
+        if encoded:
+            # 压缩传输的内容无法按字节续传
+            self._remove(self.meta_path)
+            self._meta = None
+        else:
+            self._meta = {
+                "url": self.url,
+                "etag": headers.get('etag'),
+                "last_modified": headers.get('last-modified'),
+                "length": self.expected,
+            }
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump(self._meta, f)
+    
+    def on_resume(self):
+        """
+        从断点续传时调用，子类可在此重新处理已下载的部分
+        """
+    
+    def write(self, chunk):
+        """
+        写入一块数据
+        
+        返回:
+            True（子类可以返回False要求中止传输）
+        """
+        if chunk:
+            self._file.write(chunk)
+            self.size += len(chunk)
+        return True
+    
+    def check_complete(self):
+        """
+        确认已收到完整内容
+        
+        异常:
+            IncompleteDownload: 实际长度小于响应声明的长度
+        """
+        if self.expected is not None and self.size < self.expected:
+            raise IncompleteDownload(f"传输中断: {self.size}/{self.expected} 字节")
+    
+    def finish(self):
+        """
+        传输完成：关闭文件并删除续传元数据
+        
+        返回:
+            .part文件路径；没有写入任何数据时返回None（并删除空文件）
+        """
+        self._close()
+        self._remove(self.meta_path)
+        if self.size == 0:
+            self._remove(self.part_path)
+            return None
+        return self.part_path
+    
+    def suspend(self):
+        """
+        传输中断：关闭文件，保留.part和元数据以便续传；不可续传时直接删除
+        """
+        self._close()
+        if self._meta is None:
+            self.discard()
+        else:
+            self.offset = os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+    
+    def discard(self):
+        """
+        放弃下载：删除.part文件和元数据
+        """
+        self._close()
+        self._remove(self.part_path)
+        self._remove(self.meta_path)
+        self._meta = None
+        self.offset = 0
+        self.size = 0
+    
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class JpegStreamWriter(ResumableFile):
+    """
+    流式JPEG写入器
+    先根据响应头判断是否可能是JPEG，再检查首字节的SOI标记（FF D8 FF），
+    判断通过后把数据分块写入保存目录下的.part文件，同时增量计算去重哈希；
+    任一环节不通过即可中止传输。每个下载线程的内存占用只有一个数据块。
+    .part文件名由URL决定，传输中断后可以从断点续传
+    """
+    
+    JPEG_SOI = b"\xff\xd8\xff"  # JPEG文件起始标记
+    
+    def __init__(self, url, save_path, hash_name="md5"):
+        """
+        参数:
+            url: 图片URL（用于判断扩展名）
+            save_path: .part文件所在目录
+            hash_name: 去重哈希算法（HASH_BACKENDS中的名称）
+        """
+        part_name = "." + hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + ".part"
+        super().__init__(url, os.path.join(save_path, part_name))
+        self.save_path = save_path
+        self.hash_name = hash_name
+        self._hash = HASH_BACKENDS[hash_name]()  # 边下载边计算的去重哈希
+        self._head = b""  # 尚未确认SOI标记前缓存的首字节
+        self._head_checked = False
+    
+    def accept_headers(self, headers):
+        """
+        根据响应头判断是否继续下载
+        URL不是.jpg/.jpeg结尾时要求Content-Type为image/jpeg
+        
+        参数:
+            headers: 响应头（requests或aiohttp的大小写不敏感字典）
+        返回:
+            可以继续下载返回True
+        """
+        if headers.get('content-length') == '0':
+            return False
+        if not self.url.lower().split('?')[0].endswith(('.jpg', '.jpeg')):
+            if 'image/jpeg' not in headers.get('content-type', ''):
+                return False
+        return True
+    
+    def begin(self, status, headers):
+        """
+        检查响应头，通过后打开.part文件（续传或从头开始）
+        
+        返回:
+            可以继续下载返回True；响应头不符合要求返回False（调用方应中止传输）
+        """
+        if not self.accept_headers(headers):
+            return False
+        super().begin(status, headers)
+        if self.offset == 0:
+            self._hash = HASH_BACKENDS[self.hash_name]()
+            self._head = b""
+            self._head_checked = False
+        return True
+    
+    def on_resume(self):
+        """
+        续传时重新计算已下载部分的哈希，并确认其以SOI标记开头
+        """
+        self._hash = HASH_BACKENDS[self.hash_name]()
+        with open(self.part_path, 'rb') as f:
+            head = f.read(len(self.JPEG_SOI))
+            self._hash.update(head)
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                self._hash.update(chunk)
+        if not head.startswith(self.JPEG_SOI):
+            self.discard()
+            raise IncompleteDownload("已下载部分不是JPEG")
+        self._head_checked = True
+    
+    def write(self, chunk):
+        """
+        写入一块数据；首块数据需要以JPEG SOI标记开头
+        
+        参数:
+            chunk: 数据块
+        返回:
+            可以继续下载返回True；返回False时调用方应调用discard()并中止传输
+        """
+        if not chunk:
+            return True
+        if not self._head_checked:
+            self._head += chunk
+            if len(self._head) < len(self.JPEG_SOI):
+                return True
+            if not self._head.startswith(self.JPEG_SOI):
+                return False
+            chunk, self._head = self._head, b""
+            self._head_checked = True
+        super().write(chunk)
+        self._hash.update(chunk)
+        return True
+    
+    def finish(self):
+        """
+        结束写入；只收到不足SOI长度的数据时视为空内容
+        
+        返回:
+            .part文件路径；没有写入任何有效数据时返回None
+        """
+        if not self._head_checked:
+            self.discard()
+            return None
+        return super().finish()
+    
+    def content_hash(self):
+        """
+        返回已写入内容的哈希值，格式为 "算法:十六进制摘要"
+        """
+        return f"{self.hash_name}:{self._hash.hexdigest()}"
+    
+    def adopt(self):
+        """
+        接管由SegmentedDownload写好的完整.part文件：重新计算哈希并检查SOI标记
+        
+        异常:
+            IncompleteDownload: 文件不是JPEG（已删除.part）
+        """
+        self.size = os.path.getsize(self.part_path)
+        self.on_resume()
+
+
+class SegmentBuffer:
+    """
+    在内存中接收一个TS片段（片段通常只有几MB），传输中断后从已收到的位置续传
+    续传规则与ResumableFile一致：请求带Range和If-Range，
+    206响应的起点与已收到的长度吻合才拼接，否则从头接收；压缩传输的内容不续传
+    """
+    
+    def __init__(self):
+        self.data = bytearray()
+        self.expected = None  # 完整片段的长度（未知时为None）
+        self.validator = None  # 强ETag或Last-Modified，用于If-Range
+        self.resumable = False
+    
+    def request_headers(self):
+        """
+        续传时需要附加的请求头
+        
+        返回:
+            字典；没有可续传的部分时为空
+        """
+        if not self.data or not self.resumable:
+            return {}
+        headers = {"Range": f"bytes={len(self.data)}-", "Accept-Encoding": "identity"}
+        if self.validator:
+            headers["If-Range"] = self.validator
+        return headers
+    
+    def begin(self, status, headers):
+        """
+        根据响应状态决定续传还是从头接收
+        
+        参数:
+            status: HTTP状态码
+            headers: 响应头（requests或aiohttp的大小写不敏感字典）
+        异常:
+            IncompleteDownload: 206响应的范围与已收到的部分不一致（已清空，重试会从头接收）
+        """
+        if status == 206 and self.data:
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', headers.get('content-range', ''))
+            if not match or int(match.group(1)) != len(self.data) \
+                    or (self.expected is not None and match.group(2) not in ('*', str(self.expected))):
+                self.data.clear()
+                self.resumable = False
+                raise IncompleteDownload(f"续传范围不一致: {headers.get('content-range')}")
+            return
+        # 服务器忽略了Range或内容已变化：从头接收
+        self.data.clear()
+        encoded = headers.get('content-encoding', 'identity').lower() not in ('', 'identity')
+        length = headers.get('content-length', '')
+        self.expected = int(length) if length.isdigit() and not encoded else None
+        etag = headers.get('etag')
+        # 弱ETag不能用于If-Range
+        self.validator = etag if etag and not etag.startswith('W/') else headers.get('last-modified')
+        self.resumable = not encoded
+    
+    def write(self, chunk):
+        """
+        追加一块数据
+        """
+        self.data.extend(chunk)
+    
+    def finish(self):
+        """
+        确认收到完整片段
+        
+        返回:
+            片段内容
+        异常:
+            IncompleteDownload: 实际长度小于响应声明的长度
+        """
+        if self.expected is not None and len(self.data) != self.expected:
+            raise IncompleteDownload(f"片段不完整: {len(self.data)}/{self.expected} 字节")
+        return bytes(self.data)
+
+
+class SegmentSlots:
+    """
+    所有分段下载共用的额外线程名额
+    上限可以在下载进行中调整：正在运行的分段下载归还的名额回到同一个计数，总数不会超出新的上限
+    """
+    
+    def __init__(self, limit):
+        """
+        参数:
+            limit: 额外线程的总数上限
+        """
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+    
+    def try_acquire(self):
+        """
+        领取一个名额（不等待）
+        
+        返回:
+            领到返回True，名额已满返回False
+        """
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+    
+    def release(self):
+        """
+        归还一个名额
+        """
+        with self._lock:
+            self.used -= 1
+    
+    def resize(self, limit):
+        """
+        调整上限；已领出的名额超过新上限时，归还到低于上限后才能再领取
+        """
+        with self._lock:
+            self.limit = limit
+
+
+class SegmentedDownload:
+    """
+    多连接分段下载单个大文件
+    把文件按字节范围切成若干段，用多个连接并发下载，各段直接写入预分配好的.part文件的对应位置；
+    已完成的段记录在.part.segments.json里，中断后只需重新下载未完成的段。
+    请求都带If-Range，服务器内容变化时（返回200而不是206）放弃本次分段下载。
+    调用线程自己下载一路，其余连接的线程从共享的slots里领取，领不到就少开几路
+    """
+    
+    SEGMENT_SIZE = 8 * 1024 * 1024  # 每段的最大长度
+    MIN_SEGMENT_SIZE = 1024 * 1024  # 每段的最小长度
+    
+    def __init__(self, http, url, part_path, size, validator=None, headers=None, connections=4,
+                 rate=None, controller=None, on_progress=None, slots=None):
+        """
+        参数:
+            http: HttpSessionPool对象
+            url: 文件URL
+            part_path: .part文件路径
+            size: 文件总长度
+            validator: ETag或Last-Modified，用于If-Range
+            headers: 基础请求头
+            connections: 并发连接数
+            rate: 没有配置限速时使用的后备 (速率, 突发数)
+            controller: 可选的自适应并发控制器，每段请求占用一个并发名额
+            on_progress: 可选回调 on_progress(已完成字节数, 总字节数)
+            slots: 可选的SegmentSlots，限制所有分段下载额外开启的线程总数（None表示不限制）
+        """
+        self.http = http
+        self.url = url
+        self.part_path = part_path
+        self.meta_path = part_path + ".segments.json"
+        self.size = size
+        self.validator = validator
+        self.headers = dict(headers or {})
+        self.connections = max(1, connections)
+        self.rate = rate
+        self.controller = controller
+        self.on_progress = on_progress
+        self.slots = slots
+        self.segment_size = min(self.SEGMENT_SIZE, max(self.MIN_SEGMENT_SIZE, -(-size // self.connections)))
+        self._done = set()  # 已完成的段序号
+        self._pending = None
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._invalid = False  # 服务器内容已变化，已下载的段作废
+    
+    @staticmethod
+    def plan(status, headers, threshold):
+        """
+        根据完整响应（200）的响应头判断是否值得分段下载
+        
+        参数:
+            status: HTTP状态码
+            headers: 响应头
+            threshold: 启用分段下载的最小文件长度（字节）
+        返回:
+            可以分段时返回 {"size": 总长度, "validator": 校验值}，否则返回None
+        """
+        length = headers.get('content-length', '')
+        if status != 200 or 'bytes' not in headers.get('accept-ranges', '').lower() or not length.isdigit():
+            return None
+        if headers.get('content-encoding', 'identity').lower() not in ('', 'identity') or int(length) < threshold:
+            return None
+        etag = headers.get('etag')
+        # 弱ETag不能用于If-Range
+        validator = etag if etag and not etag.startswith('W/') else headers.get('last-modified')
+        return {"size": int(length), "validator": validator}
+    
+    @classmethod
+    def probe(cls, http, url, headers, threshold, rate=None):
+        """
+        用Range: bytes=0-0探测服务器是否支持分段下载
+        
+        返回:
+            可以分段时返回 {"size": 总长度, "validator": 校验值}，否则返回None
+        """
+        probe_headers = dict(headers, Range="bytes=0-0", **{"Accept-Encoding": "identity"})
+        response = http.fetch(url, rate=rate, headers=probe_headers, timeout=30, stream=True)
+        with response:
+            match = re.match(r'bytes 0-0/(\d+)', response.headers.get('content-range', ''))
+            if response.status_code != 206 or not match:
+                return None
+            size = int(match.group(1))
+            if size < threshold:
+                return None
+            etag = response.headers.get('etag')
+            validator = etag if etag and not etag.startswith('W/') else response.headers.get('last-modified')
+            return {"size": size, "validator": validator}
+    
+    def segment_range(self, index):
+        """
+        返回第index段的字节范围 (起点, 终点)，终点包含在内
+        """
+        start = index * self.segment_size
+        return start, min(start + self.segment_size, self.size) - 1
+    
+    def run(self):
+        """
+        下载全部未完成的段；失败时保留.part和元数据以便下次续传
+        
+        返回:
+            全部完成返回.part文件路径
+        异常:
+            IncompleteDownload: 服务器内容已变化或某段多次重试仍失败
+        """
+        count = -(-self.size // self.segment_size)
+        resumed = self._load()
+        if not resumed:
+            self._done = set()
+            with open(self.part_path, 'wb') as f:
+                # 预分配文件，各段写入各自的位置
+                f.truncate(self.size)
+                if hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, self.size)
+                    except OSError:
+                        pass
+            self._save()
+        
+        self._pending = [i for i in range(count) if i not in self._done]
+        self._pending.reverse()  # pop()从末尾取，保持从前往后下载
+        workers = min(self.connections, len(self._pending))
+        if workers:
+            # 调用线程本身算一路；下载线程池里同时有多个大文件时，额外的线程受共享slots限制
+            helpers = 0
+            while helpers < workers - 1 and (self.slots is None or self.slots.try_acquire()):
+                helpers += 1
+            errors = []
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, helpers)) as executor:
+                    futures = [executor.submit(self._worker) for _ in range(helpers)]
+                    try:
+                        self._worker()
+                    except Exception as e:
+                        errors.append(e)
+                    errors += [f.exception() for f in futures]
+            finally:
+                if self.slots is not None:
+                    for _ in range(helpers):
+                        self.slots.release()
+            errors = [e for e in errors if e is not None]
+            if errors:
+                raise errors[0]
+        
+        try:
+            os.remove(self.meta_path)
+        except OSError:
+            pass
+        return self.part_path
+    
+    def _worker(self):
+        """
+        下载线程：不断领取未完成的段，直到全部领完或出错
+        """
+        with open(self.part_path, 'r+b') as f:
+            while not self._abort.is_set():
+                with self._lock:
+                    if not self._pending:
+                        return
+                    index = self._pending.pop()
+                try:
+                    self._fetch_segment(f, index)
+                except Exception:
+                    self._abort.set()
+                    raise
+                with self._lock:
+                    self._done.add(index)
+                    self._save()
+                    done_bytes = sum(self.segment_range(i)[1] - self.segment_range(i)[0] + 1 for i in self._done)
+                if self.on_progress:
+                    self.on_progress(done_bytes, self.size)
+    
+    def _fetch_segment(self, f, index):
+        """
+        下载一段并写入文件的对应位置，传输中断时从该段已写入的位置继续
+        """
+        start, end = self.segment_range(index)
+        position = start
+        attempt = 0
+        while True:
+            headers = dict(self.headers, Range=f"bytes={position}-{end}", **{"Accept-Encoding": "identity"})
+            if self.validator:
+                headers["If-Range"] = self.validator
+            response = None
+            try:
+                self.http.admit(self.url, self.rate)  # 先等令牌再占用并发名额
+                with self.controller.track() if self.controller else nullcontext() as sample:
+                    response = self.http.get(self.url, admitted=True, headers=headers, timeout=60, stream=True)
+                    if sample:
+                        sample.responded(response.status_code)
+                    with response:
+                        response.raise_for_status()
+                        match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', response.headers.get('content-range', ''))
+                        if response.status_code != 206 or not match or int(match.group(1)) != position \
+                                or int(match.group(2)) != end or match.group(3) not in ('*', str(self.size)):
+                            # 服务器内容已变化或不再支持分段：已下载的段不可信
+                            self._discard()
+                            raise IncompleteDownload(f"分段响应不一致: {response.status_code} {response.headers.get('content-range')}")
+                        f.seek(position)
+                        for chunk in response.iter_content(chunk_size=ResumableFile.CHUNK_SIZE):
+                            if self._invalid:
+                                raise IncompleteDownload("分段下载已中止")
+                            if chunk:
+                                chunk = chunk[:end + 1 - position]
+                                f.write(chunk)
+                                position += len(chunk)
+                if position > end:
+                    return
+                raise IncompleteDownload(f"分段传输中断: {position - start}/{end - start + 1} 字节")
+            except Exception as e:
+                if response is not None:
+                    self.http.breaker.record_error(self.url, e)  # 读取响应体时出错，get()没有记录
+                # 按共享的重试策略从该段已写入的位置重试
+                if self._invalid or not self.http.retry.wait(self.url, e, attempt):
+                    raise
+                attempt += 1
+    
+    def _load(self):
+        """
+        读取上次中断时的分段记录，URL、长度、校验值和分段大小都一致才续传
+        
+        返回:
+            可以续传返回True
+        """
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if (meta.get("url") == self.url and meta.get("length") == self.size
+                    and meta.get("validator") == self.validator and meta.get("segment_size") == self.segment_size
+                    and os.path.getsize(self.part_path) == self.size):
+                self._done = set(meta.get("done", []))
+                return True
+        except (OSError, ValueError):
+            pass
+        return False
+    
+    def _save(self):
+        """
+        保存分段记录（调用方持有锁或尚未启动下载线程）
+        """
+        if self._invalid:
+            return
+        meta = {
+            "url": self.url,
+            "length": self.size,
+            "validator": self.validator,
+            "segment_size": self.segment_size,
+            "done": sorted(self._done),
+        }
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+    
+    def _discard(self):
+        """
+        放弃分段记录；.part文件由下次下载从头覆盖
+        """
+        self._abort.set()
+        with self._lock:
+            self._invalid = True
+            self._done.clear()
+            self._pending = []
+            try:
+                os.remove(self.meta_path)
+            except OSError:
+                pass
+
+
+COPY_BUFFER_SIZE = 1024 * 1024  # 缓冲区拷贝方式每次读写的字节数
+
+# 文件拼接方式，按优先顺序排列；当前平台没有的方式自动跳过
+COPY_METHODS = ("copy_file_range", "sendfile", "buffered")
+
+
+def append_file(dst, src_path, method=None):
+    """
+    把src_path的全部内容追加到已打开的输出文件dst末尾
+    优先用os.copy_file_range在内核中拷贝（部分文件系统直接共享数据块），
+    不支持时退回os.sendfile，最后用固定大小的缓冲区循环读写；
+    数据不经过Python的bytes对象，内存占用与文件大小无关。
+    某种方式中途失败时，后面的方式从已拷贝的位置继续
+    
+    参数:
+        dst: 以二进制写模式打开的文件对象
+        src_path: 源文件路径
+        method: 指定拷贝方式（COPY_METHODS中的名称），为None时按优先顺序自动选择
+    返回:
+        (拷贝的字节数, 最后使用的拷贝方式)
+    异常:
+        OSError: 拷贝失败；所有方式都没能拷贝完整时为IncompleteDownload
+    """
+    dst.flush()  # 先写出dst缓冲区中的数据，下面直接操作文件描述符
+    dst_fd = dst.fileno()
+    copied = 0
+    with open(src_path, 'rb') as src:
+        src_fd = src.fileno()
+        size = os.fstat(src_fd).st_size
+        for name in ((method,) if method else COPY_METHODS):
+            try:
+                if name == "copy_file_range" and hasattr(os, "copy_file_range"):
+                    while copied < size:
+                        n = os.copy_file_range(src_fd, dst_fd, size - copied, copied)
+                        if n == 0:
+                            break
+                        copied += n
+                elif name == "sendfile" and hasattr(os, "sendfile"):
+                    while copied < size:
+                        n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+                        if n == 0:
+                            break
+                        copied += n
+                elif name == "buffered":
+                    buffer = bytearray(COPY_BUFFER_SIZE)
+                    view = memoryview(buffer)
+                    src.seek(copied)
+                    while True:
+                        n = src.readinto(buffer)
+                        if not n:
+                            break
+                        written = 0
+                        while written < n:
+                            written += os.write(dst_fd, view[written:n])
+                        copied += n
+                else:
+                    continue
+            except OSError:
+                if method or name == COPY_METHODS[-1]:
+                    raise
+                continue  # 文件系统或内核不支持（EXDEV/ENOSYS/EINVAL等），换下一种方式
+            if copied < size:
+                continue  # 提前返回0（拷贝不完整），由下一种方式从已拷贝的位置继续
+            dst.seek(0, os.SEEK_END)  # 让文件对象的位置与描述符同步
+            return copied, name
+    if method and method not in COPY_METHODS:
+        raise OSError(f"不支持的拷贝方式: {method}")
+    raise IncompleteDownload(f"拷贝不完整: {src_path} {copied}/{size} 字节")
+
+
+def format_ranges(numbers):
+    """
+    把升序的整数列表压缩成区间文本，如 [1, 2, 3, 7] -> "1-3, 7"
+    """
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+class TsStreamAssembler:
+    """
+    按播放列表顺序流式拼接TS片段
+    片段可以乱序到达：轮到的片段直接追加到输出文件，提前到达的片段先放在内存缓冲区，
+    缓冲超过上限后才写入临时目录，轮到时再拷回输出。每个字节只写一次输出文件，
+    下载结束时也不再需要整体合并。输出先写到.part文件，拼接进度记录在.part.json中，
+    中断后重新运行同一批片段时从上次拼接到的位置继续。
+    片段以播放列表序号标识（而不是文件名），临时文件也按序号命名，
+    不同目录下同名的片段不会互相覆盖
+    """
+    
+    def __init__(self, output_path, segments, max_buffer_bytes=64 * 1024 * 1024):
+        """
+        参数:
+            output_path: 输出文件路径
+            segments: [(播放列表序号, 片段URL), ...]，按序号升序排列
+            max_buffer_bytes: 内存中乱序缓冲的最大字节数，超过后写入临时目录
+        """
+        self.output_path = output_path
+        self.part_path = output_path + ".part"
+        self.meta_path = self.part_path + ".json"
+        self.spill_dir = self.part_path + ".spill"
+        self.indices = [index for index, _ in segments]
+        self.count = len(segments)
+        self.max_buffer_bytes = max_buffer_bytes
+        self.next_index = 0  # 下一个要写入输出的片段在segments中的位置
+        self.missing = []  # 下载失败被跳过的片段序号
+        self.spilled = 0  # 写入过临时目录的片段数（统计用）
+        self._position = {index: position for position, index in enumerate(self.indices)}
+        self._digest = hashlib.sha1("\n".join(f"{index} {url}" for index, url in segments).encode("utf-8")).hexdigest()
+        self._memory = {}  # 位置 -> 片段内容（None表示下载失败）
+        self._spill_paths = {}  # 位置 -> 临时文件路径
+        self._spilling = set()  # 正在写入临时目录的位置
+        self._buffered = 0
+        self._gap = None  # 第一个缺失片段之前的拼接进度 [位置, 输出长度]，续接时退回到这里
+        self._writing = False  # 是否有线程正在写输出
+        self._lock = threading.Lock()  # 只保护上面的状态，文件读写都在锁外进行
+        self._file = self._open()
+    
+    def _open(self):
+        """
+        打开输出的.part文件；元数据与本批片段一致时截断到上次记录的长度后继续。
+        上次有缺失的片段时退回到第一个缺口处，缺失的片段和其后的片段重新下载
+        """
+        shutil.rmtree(self.spill_dir, ignore_errors=True)  # 上次中断留下的乱序片段会重新下载
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            next_index, size = meta["gap"] if meta.get("missing") else (meta["next"], meta["size"])
+            if meta.get("digest") == self._digest and os.path.getsize(self.part_path) >= size:
+                out = open(self.part_path, 'r+b')
+                out.truncate(size)
+                out.seek(size)
+                self.next_index = next_index
+                return out
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return open(self.part_path, 'wb')
+    
+    @property
+    def resumed(self):
+        """
+        续接上次运行时已经拼接的片段数
+        """
+        return self.next_index
+    
+    def needed(self, index):
+        """
+        序号为index的片段是否还需要下载（续接时已拼接的片段不需要）
+        """
+        return self._position[index] >= self.next_index
+    
+    def add(self, index, data):
+        """
+        交付一个片段（线程安全）
+        
+        参数:
+            index: 片段的播放列表序号
+            data: 片段内容；None表示下载失败，拼接时跳过并记入missing
+        """
+        position = self._position[index]
+        with self._lock:
+            if position < self.next_index or position in self._memory or position in self._spill_paths \
+                    or position in self._spilling:
+                return  # 重复交付
+            spill = position != self.next_index and data is not None \
+                and self._buffered + len(data) > self.max_buffer_bytes
+            if spill:
+                self._spilling.add(position)
+            else:
+                self._memory[position] = data
+                self._buffered += len(data) if data else 0
+        if spill:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, f"{index:06d}.ts")
+            with open(path, 'wb') as f:
+                f.write(data)
+            with self._lock:
+                self._spilling.discard(position)
+                self._spill_paths[position] = path
+                self.spilled += 1
+        self._drain()
+    
+    def _claim(self):
+        """
+        取出从next_index开始已经连续到达的片段（调用方持有锁）
+        
+        返回:
+            [(位置, 片段内容, 临时文件路径), ...]，下载失败的片段内容和路径都是None
+        """
+        batch = []
+        while True:
+            position = self.next_index
+            if position in self._memory:
+                data = self._memory.pop(position)
+                self._buffered -= len(data) if data else 0
+                if data is None:
+                    self.missing.append(self.indices[position])
+                batch.append((position, data, None))
+            elif position in self._spill_paths:
+                batch.append((position, None, self._spill_paths.pop(position)))
+            else:
+                return batch
+            self.next_index = position + 1
+    
+    def _drain(self):
+        """
+        写出已经连续的片段并记录拼接进度。同一时间只有一个线程写输出，
+        其他线程交付的片段由它在下一轮取走
+        """
+        while True:
+            with self._lock:
+                if self._writing:
+                    return
+                batch = self._claim()
+                if not batch:
+                    return
+                self._writing = True
+                next_index, missing = self.next_index, list(self.missing)
+            try:
+                for position, data, path in batch:
+                    if path:
+                        append_file(self._file, path)  # 内核内拷贝，不经过Python内存
+                        os.remove(path)
+                    elif data is not None:
+                        self._file.write(data)
+                    elif self._gap is None:
+                        self._gap = [position, self._file.tell()]
+                self._save_meta(next_index, missing)
+            finally:
+                with self._lock:
+                    self._writing = False
+    
+    def _save_meta(self, next_index, missing):
+        self._file.flush()
+        meta = {"digest": self._digest, "next": next_index, "size": self._file.tell(), "missing": missing, "gap": self._gap}
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+    
+    def close(self):
+        """
+        结束拼接：仍未交付的片段记为缺失，输出改名为最终文件（所有add()返回后调用）
+        
+        返回:
+            缺失片段的播放列表序号（升序）
+        """
+        with self._lock:
+            for position in range(self.next_index, self.count):
+                if position not in self._spill_paths:
+                    self._memory.setdefault(position, None)
+        self._drain()
+        self._file.close()
+        os.replace(self.part_path, self.output_path)
+        os.remove(self.meta_path)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        return list(self.missing)
+    
+    def abort(self):
+        """
+        中途出错时关闭输出，保留.part文件和拼接进度以便下次续接
+        """
+        with self._lock:
+            self._file.close()
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+    
+    def discard(self):
+        """
+        放弃输出（没有任何可用片段时）
+        """
+        self.abort()
+        for path in (self.part_path, self.meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class ConcurrentHashSet:
+    """
+    线程安全的集合
+    add_if_absent 把“检查+添加”合并为一个原子操作；
+    临界区只有一次集合操作，一把锁在GIL下比分段加锁更快（见benchmarks/bench_dedup.py）
+    """
+    
+    def __init__(self):
+        self._items = set()
+        self._lock = threading.Lock()
+    
+    def add_if_absent(self, item):
+        """
+        元素不存在时添加
+        
+        返回:
+            本次添加成功返回True，元素已存在返回False
+        """
+        with self._lock:
+            if item in self._items:
+                return False
+            self._items.add(item)
+            return True
+    
+    def discard(self, item):
+        """
+        删除元素（不存在时忽略）
+        """
+        with self._lock:
+            self._items.discard(item)
+    
+    def __contains__(self, item):
+        with self._lock:
+            return item in self._items
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def clear(self):
+        """
+        清空集合
+        """
+        with self._lock:
+            self._items.clear()
+
+
+class AtomicCounter:
+    """
+    线程安全的计数器，用于多个下载线程共同更新的进度计数
+    """
+    
+    def __init__(self, value=0):
+        self._value = value
+        self._lock = threading.Lock()
+    
+    def increment(self, amount=1):
+        """
+        计数加amount
+        
+        返回:
+            增加后的值（每个调用方拿到的值各不相同，可直接用于进度显示）
+        """
+        with self._lock:
+            self._value += amount
+            return self._value
+    
+    @property
+    def value(self):
+        return self._value
+
+
+class LinkStore:
+    """
+    有序、去重的链接存储
+    按发现顺序保存链接及其元数据（来源页面、发现时间），界面上的列表只是它的显示视图；
+    可以保存为JSON Lines文件并重新加载，几十万条链接也只占用几十MB内存
+    """
+    
+    def __init__(self):
+        self._urls = []  # 按发现顺序排列的链接
+        self._meta = {}  # 链接 -> {"source": 来源页面, "added": 发现时间}
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._urls)
+    
+    def __getitem__(self, index):
+        return self._urls[index]
+    
+    def __contains__(self, url):
+        return url in self._meta
+    
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._urls))
+    
+    def add_many(self, urls, source=None):
+        """
+        按顺序添加链接，已存在的链接被忽略
+        
+        参数:
+            urls: 链接列表
+            source: 发现这些链接的页面
+        返回:
+            新添加的链接列表（按添加顺序，可直接追加到显示视图）
+        """
+        added = []
+        now = time.time()
+        with self._lock:
+            for url in urls:
+                if url in self._meta:
+                    continue
+                self._meta[url] = {"source": source, "added": now}
+                self._urls.append(url)
+                added.append(url)
+        return added
+    
+    def meta(self, url):
+        """
+        返回链接的元数据，不存在时返回None
+        """
+        return self._meta.get(url)
+    
+    def clear(self):
+        """
+        清空所有链接
+        """
+        with self._lock:
+            self._urls = []
+            self._meta = {}
+    
+    def save(self, path):
+        """
+        保存为JSON Lines文件（每行一个链接及其元数据），先写临时文件再替换
+        
+        参数:
+            path: 文件路径
+        返回:
+            保存的链接数
+        """
+        with self._lock:
+            rows = [(url, self._meta[url]) for url in self._urls]
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for url, meta in rows:
+                f.write(json.dumps(dict(meta, url=url), ensure_ascii=False) + "\n")
+        os.replace(temp_path, path)
+        return len(rows)
+    
+    def load(self, path):
+        """
+        从JSON Lines文件加载链接，追加到现有链接之后（去重）
+        每行也可以是纯文本链接
+        
+        参数:
+            path: 文件路径
+        返回:
+            新添加的链接列表
+        """
+        added = []
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = []
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('{'):
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        continue
+                else:
+                    rows.append({"url": line})
+        with self._lock:
+            for row in rows:
+                url = row.get("url")
+                if not url or url in self._meta:
+                    continue
+                self._meta[url] = {"source": row.get("source"), "added": row.get("added", time.time())}
+                self._urls.append(url)
+                added.append(url)
+        return added
+
+
+class HashIndex:
+    """
+    持久化的图片内容哈希索引（SQLite）
+    保存在下载根目录下，记录每张已保存图片的哈希、大小、URL和文件路径，
+    重新下载同一图集时即使程序重启也能识别已有图片；
+    另有URL索引记录每个图片URL的ETag/Last-Modified/长度和内容哈希，
+    已知URL可以不发请求直接跳过，或用条件请求确认未变化（304）后跳过
+    """
+    
+    FILENAME = ".picget_index.sqlite3"
+    
+    def __init__(self, root):
+        """
+        打开（或创建）下载根目录下的索引数据库
+        
+        参数:
+            root: 下载根目录（用户设置的保存路径）
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.path = os.path.join(root, self.FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")  # 多线程写入时读不阻塞
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                "hash TEXT PRIMARY KEY, size INTEGER, url TEXT, path TEXT, added REAL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, length INTEGER, hash TEXT, checked REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS phash (path TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS near_duplicates ("
+                "path TEXT PRIMARY KEY, match_path TEXT, distance INTEGER, found REAL)")
+            # 早期版本保存的是不带算法前缀的MD5摘要，统一补上前缀
+            self._conn.execute("UPDATE images SET hash = 'md5:' || hash WHERE hash NOT LIKE '%:%'")
+            self._conn.execute("UPDATE urls SET hash = 'md5:' || hash WHERE hash NOT LIKE '%:%'")
+            self._conn.commit()
+    
+    def lookup(self, image_hash):
+        """
+        查询哈希对应的已保存图片
+        
+        参数:
+            image_hash: 图片内容哈希（"算法:摘要"）
+        返回:
+            文件仍然存在时返回其绝对路径，否则返回None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM images WHERE hash = ?", (image_hash,)).fetchone()
+        if row is None:
+            return None
+        path = os.path.join(self.root, row[0])
+        return path if os.path.exists(path) else None
+    
+    def record(self, image_hash, size, url, path):
+        """
+        记录（或更新）一张已保存的图片
+        
+        参数:
+            image_hash: 图片内容哈希
+            size: 文件大小（字节）
+            url: 图片URL
+            path: 文件绝对路径（以相对下载根目录的路径保存，目录整体移动后仍然有效）
+        """
+        rel_path = os.path.relpath(path, self.root)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (hash, size, url, path, added) VALUES (?, ?, ?, ?, ?)",
+                (image_hash, size, url, rel_path, time.time()))
+            self._conn.commit()
+    
+    def repoint(self, image_hash, path):
+        """
+        把内容哈希对应的文件改为另一个已有文件（近似重复图片被删除后使用）
+        """
+        with self._lock:
+            self._conn.execute("UPDATE images SET path = ? WHERE hash = ?",
+                               (os.path.relpath(path, self.root), image_hash))
+            self._conn.commit()
+    
+    def load_phashes(self):
+        """
+        读取所有已登记的感知哈希指纹
+        
+        返回:
+            [(文件绝对路径, 64位指纹), ...]
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT path, value FROM phash").fetchall()
+        return [(os.path.join(self.root, path), int(value, 16)) for path, value in rows]
+    
+    def remove_phash(self, path):
+        """
+        删除一条指纹记录（对应的文件已不存在）
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM phash WHERE path = ?", (os.path.relpath(path, self.root),))
+            self._conn.commit()
+    
+    def record_phash(self, path, value):
+        """
+        登记一张图片的感知哈希指纹（以十六进制保存，避免超出SQLite有符号整数范围）
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO phash (path, value) VALUES (?, ?)",
+                               (os.path.relpath(path, self.root), f"{value:016x}"))
+            self._conn.commit()
+    
+    def record_near_duplicate(self, path, match_path, distance):
+        """
+        记录一张近似重复的图片及其匹配到的已有图片
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO near_duplicates (path, match_path, distance, found) VALUES (?, ?, ?, ?)",
+                (os.path.relpath(path, self.root), os.path.relpath(match_path, self.root), distance, time.time()))
+            self._conn.commit()
+    
+    def lookup_url(self, url):
+        """
+        查询URL上次下载时的缓存验证信息
+        只有对应内容的文件仍然存在时才返回，文件被删除后该URL会重新下载
+        
+        参数:
+            url: 图片URL
+        返回:
+            字典 {"etag", "last_modified", "length", "hash"}；未知URL返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, length, hash FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None or not self.lookup(row[3]):
+            return None
+        return {"etag": row[0], "last_modified": row[1], "length": row[2], "hash": row[3]}
+    
+    def record_url(self, url, etag, last_modified, length, image_hash):
+        """
+        记录URL的缓存验证信息和内容哈希
+        
+        参数:
+            url: 图片URL
+            etag: 响应的ETag（可为None）
+            last_modified: 响应的Last-Modified（可为None）
+            length: 内容长度（字节）
+            image_hash: 内容哈希
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, etag, last_modified, length, hash, checked) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, length, image_hash, time.time()))
+            self._conn.commit()
+
+
+class AsyncDownloadEngine:
+    """
+    基于asyncio的下载引擎
+    在一个常驻事件循环上并发处理成千上万个图片/TS请求，
+    总并发和每主机并发都有上限，适合线程池难以支撑的大型图集
+    """
+    
+    def __init__(self):
+        """
+        初始化引擎（事件循环在首次使用时才创建）
+        """
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._limits = None
+        self._active_runs = 0  # 正在执行的任务批次数，会话在使用中时不重建
+        self._lock = threading.Lock()
+    
+    def _ensure_loop(self):
+        """
+        启动常驻事件循环线程，使各标签页的请求复用同一个连接池
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+    
+    async def _get_session(self, max_in_flight, per_host):
+        """
+        获取aiohttp会话；并发上限变化且没有进行中的批次时重建连接器
+        """
+        limits = (max_in_flight, per_host)
+        if self._session is None or (self._limits != limits and self._active_runs == 0):
+            if self._session is not None:
+                await self._session.close()
+            connector = aiohttp.TCPConnector(limit=max_in_flight, limit_per_host=per_host)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._limits = limits
+        return self._session
+    
+    def run(self, items, handler, max_in_flight=1000, per_host=16, on_result=None, controller=None):
+        """
+        执行一批异步下载任务，阻塞调用线程直到全部完成
+        
+        参数:
+            items: 任务参数列表
+            handler: 协程函数 handler(session, item)，返回是否成功
+            max_in_flight: 同时进行中的请求上限
+            per_host: 每个主机的并发连接上限
+            on_result: 每个任务完成后的回调 on_result(item, ok)，在事件循环线程中调用
+            controller: 可选的AdaptiveConcurrency，按其上限动态限制进行中的请求数
+        返回:
+            与items顺序一致的结果列表
+        """
+        batch = self.open_batch(max_in_flight, per_host, controller)
+        try:
+            futures = [batch.submit(handler, item, on_result) for item in items]
+            return [future.result() for future in futures]
+        finally:
+            batch.close()
+    
+    def open_batch(self, max_in_flight=1000, per_host=16, controller=None):
+        """
+        打开一个可以持续提交任务的批次，适合边解析页面边下载的流水线
+        
+        参数:
+            同run()
+        返回:
+            AsyncBatch对象，用完后必须调用close()
+        """
+        self._ensure_loop()
+        session = asyncio.run_coroutine_threadsafe(self._open(max_in_flight, per_host), self._loop).result()
+        return AsyncBatch(self, session, max_in_flight, controller)
+    
+    async def _open(self, max_in_flight, per_host):
+        """
+        在事件循环中获取会话并登记一个进行中的批次
+        """
+        session = await self._get_session(max_in_flight, per_host)
+        self._active_runs += 1
+        return session
+    
+    def _release(self):
+        """
+        批次结束（由AsyncBatch.close调用）
+        """
+        def release():
+            self._active_runs -= 1
+        self._loop.call_soon_threadsafe(release)
+
+
+class AsyncBatch:
+    """
+    AsyncDownloadEngine上的一批任务
+    任何线程都可以随时提交任务；同一批次的请求共用一个并发闸门，
+    进行中的请求数不超过max_in_flight（启用自适应并发时不超过控制器的当前上限）。
+    闸门只在请求发出时占用，任务在限速器上等待时不占名额，慢主机不会挡住其他主机
+    """
+    
+    def __init__(self, engine, session, max_in_flight, controller=None):
+        self._engine = engine
+        self._session = session
+        self.max_in_flight = max_in_flight
+        self.controller = controller
+        self._gate = None  # 在事件循环中首次使用时创建
+        self._in_flight = 0
+        self._futures = []
+        self._lock = threading.Lock()
+    
+    def _current_limit(self):
+        if self.controller:
+            return max(1, min(self.max_in_flight, int(self.controller.limit)))
+        return self.max_in_flight
+    
+    def _has_room(self):
+        return self._in_flight < self._current_limit()
+    
+    def submit(self, handler, item, on_result=None):
+        """
+        提交一个任务（线程安全）
+        
+        参数:
+            handler: 协程函数 handler(session, item)，返回是否成功；
+                session只提供get()，每个请求经过本批次的并发闸门
+            item: 任务参数
+            on_result: 可选回调 on_result(item, ok)，在事件循环线程中调用
+        返回:
+            concurrent.futures.Future，结果为handler的返回值（出错时为False）
+        """
+        future = asyncio.run_coroutine_threadsafe(self._run_one(handler, item, on_result), self._engine._loop)
+        with self._lock:
+            self._futures.append(future)
+        return future
+    
+    async def _run_one(self, handler, item, on_result):
+        """
+        执行一个任务（请求由get()经过闸门）
+        """
+        try:
+            ok = await handler(self, item)
+        except Exception:
+            ok = False
+        if on_result:
+            on_result(item, ok)
+        return ok
+    
+    @asynccontextmanager
+    async def get(self, url, **kwargs):
+        """
+        与aiohttp会话的get()用法相同：等待闸门放行后发送请求，响应处理完后释放名额
+        """
+        if self._gate is None:
+            self._gate = asyncio.Condition()
+        gate = self._gate
+        async with gate:
+            await gate.wait_for(self._has_room)
+            self._in_flight += 1
+        try:
+            async with self._session.get(url, **kwargs) as response:
+                yield response
+        finally:
+            async with gate:
+                self._in_flight -= 1
+                # 自适应上限可能已经增大，按空出的名额数唤醒等待者
+                gate.notify(max(1, self._current_limit() - self._in_flight))
+    
+    def close(self):
+        """
+        等待已提交的任务全部完成并结束批次
+        """
+        with self._lock:
+            futures, self._futures = self._futures, []
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            self._engine._release()
+
+
+class LogArchive:
+    """
+    完整日志的磁盘归档
+    界面上的日志框只保留最近的若干行，所有日志同时写入~/.picget/logs下按大小轮转的文件；
+    search()用mmap + bytes.find在全部归档中查找，不逐行解码，几十MB的日志也能瞬间搜完
+    """
+    
+    FILENAME = "picget.log"
+    
+    def __init__(self, directory=None, max_bytes=10 * 1024 * 1024, backup_count=5):
+        """
+        参数:
+            directory: 日志目录，为None时使用~/.picget/logs
+            max_bytes: 单个日志文件的最大字节数，超过后轮转
+            backup_count: 保留的旧日志文件数量
+        """
+        self.directory = directory or os.path.join(os.path.expanduser("~"), ".picget", "logs")
+        self.path = os.path.join(self.directory, self.FILENAME)
+        self.backup_count = backup_count
+        self.error = None  # 日志目录不可写时的错误信息，此时只在界面显示日志
+        self._logger = logging.Logger("picget")  # 独立的logger，不影响根logger的配置
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backup_count,
+                                          encoding="utf-8", delay=True)
+        except OSError as e:
+            self.error = str(e)
+            return
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self._logger.addHandler(handler)
+    
+    def write(self, channel, message):
+        """
+        写入一条日志（线程安全），多行消息合并为一行以便按行搜索
+        
+        参数:
+            channel: 日志来源（标签页名称）
+            message: 日志消息
+        """
+        if self.error is None:
+            self._logger.info("[%s] %s", channel, " ".join(message.split("\n")).strip())
+    
+    def files(self):
+        """
+        按从旧到新的顺序返回现有的日志文件
+        """
+        paths = [f"{self.path}.{i}" for i in range(self.backup_count, 0, -1)] + [self.path]
+        return [path for path in paths if os.path.exists(path)]
+    
+    def search(self, text, limit=1000):
+        """
+        在全部日志文件中查找包含text的行
+        
+        参数:
+            text: 要查找的文本（区分大小写）
+            limit: 最多返回的行数，超过时保留最新的
+        返回:
+            匹配的行列表，按时间从旧到新排列
+        """
+        needle = text.encode("utf-8")
+        matches = deque(maxlen=limit)
+        if not needle:
+            return []
+        for path in self.files():
+            try:
+                with open(path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        continue
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        pos = mm.find(needle)
+                        while pos != -1:
+                            start = mm.rfind(b"\n", 0, pos) + 1
+                            end = mm.find(b"\n", pos)
+                            if end == -1:
+                                end = len(mm)
+                            matches.append(mm[start:end].decode("utf-8", "replace").rstrip("\r"))
+                            pos = mm.find(needle, end)
+            except OSError:
+                continue  # 搜索期间文件被轮转
+        return list(matches)
+
+
+class UiEventBus:
+    """
+    工作线程到Tk主循环的事件总线
+    工作线程只往deque里追加事件（append/popleft在CPython中是原子操作，无需加锁），
+    主循环按固定节拍（默认20 Hz）一次性取出：同一个文本框的日志合并成一次Text.insert，
+    进度条只应用最新的值。这样下载吞吐不再受Tk重绘速度限制，事件队列也不会被淹没
+    """
+    
+    def __init__(self, root, interval_ms=50, max_events=20000, max_lines=2000):
+        """
+        参数:
+            root: tkinter根窗口对象
+            interval_ms: 刷新间隔（毫秒）
+            max_events: 每个节拍最多处理的事件数，积压的事件留到下个节拍
+            max_lines: 每个日志框保留的最大行数，超出时删除最早的行（完整日志见LogArchive）
+        """
+        self.root = root
+        self.interval_ms = interval_ms
+        self.max_events = max_events
+        self.max_lines = max_lines
+        self._events = deque()  # (文本框, 文本) 或 (None, 可调用对象)
+        self._progress = {}  # 进度条 -> 最新值，只保留最后一次更新
+        self._running = False
+    
+    def start(self):
+        """
+        开始按节拍刷新（在主线程中调用）
+        """
+        if not self._running:
+            self._running = True
+            self.root.after(self.interval_ms, self._tick)
+    
+    def stop(self):
+        self._running = False
+    
+    def log(self, widget, message):
+        """
+        向文本框追加一行日志（线程安全）
+        """
+        self._events.append((widget, message))
+    
+    def progress(self, widget, value):
+        """
+        设置进度条的值（线程安全），一个节拍内的多次更新只应用最后一次
+        """
+        self._progress[widget] = value
+    
+    def call(self, func):
+        """
+        在主线程中执行func（线程安全），与日志保持提交顺序
+        """
+        self._events.append((None, func))
+    
+    def _tick(self):
+        try:
+            self.flush()
+        finally:
+            if self._running:
+                self.root.after(self.interval_ms, self._tick)
+    
+    def flush(self):
+        """
+        处理积压的事件（在主线程中调用）
+        """
+        pending = {}  # 文本框 -> 待插入的行，dict保持首次出现的顺序
+        events = self._events
+        for _ in range(min(len(events), self.max_events)):
+            widget, payload = events.popleft()
+            if widget is None:
+                # 先写出之前的日志，保证回调看到的界面状态与提交顺序一致
+                self._write(pending)
+                pending = {}
+                payload()
+            else:
+                pending.setdefault(widget, []).append(payload)
+        self._write(pending)
+        
+        while self._progress:
+            widget, value = self._progress.popitem()
+            widget.configure(value=value)
+    
+    def _write(self, pending):
+        for widget, lines in pending.items():
+            widget.insert(tk.END, "\n".join(lines) + "\n")
+            # 环形缓冲：只保留最后max_lines行，长时间运行时内存和滚动速度保持稳定
+            count = int(widget.index("end-1c").split(".")[0])
+            if count > self.max_lines:
+                widget.delete("1.0", f"{count - self.max_lines}.0")
+            widget.see(tk.END)  # 自动滚动到底部
+
+
+class VirtualListbox(tk.Frame):
+    """
+    虚拟化列表控件
+    数据保存在后端模型（默认是list，也可以是任何支持len()和下标访问的对象，如LinkStore）里，
+    界面上只渲染当前可见的几十行，几万条数据一次性插入也不会卡住界面。
+    提供与tk.Listbox相同的常用方法（insert/delete/get/size/curselection/select_set/
+    selection_clear/see/yview/config），选择状态按模型下标保存，
+    单击、Ctrl/Shift多选、拖动、方向键和Ctrl+A全选都作用于整个模型
+    """
+    
+    def __init__(self, master, model=None, height=8, **kwargs):
+        """
+        参数:
+            master: 父控件
+            model: 后端数据模型，为None时使用内部list（可用insert/delete修改）
+            height: 初始可见行数
+            kwargs: 传给内部tk.Listbox的其他选项
+        """
+        super().__init__(master)
+        self.model = model if model is not None else []
+        self._top = 0  # 第一行可见数据在模型中的下标
+        self._rows = height  # 完整可见的行数
+        self._selected = set()  # 选中的模型下标
+        self._anchor = None  # Shift选择的起点
+        self._active = 0  # 键盘操作的当前行
+        self._yscrollcommand = None
+        
+        # 内部Listbox只作为显示表面，默认的鼠标/键盘行为全部由本类接管
+        self._listbox = tk.Listbox(self, height=height, selectmode=tk.EXTENDED,
+                                   exportselection=False, activestyle=tk.NONE, **kwargs)
+        self._listbox.pack(fill=tk.BOTH, expand=True)
+        
+        lb = self._listbox
+        lb.bind("<Configure>", self._on_configure)
+        lb.bind("<Button-1>", self._on_click)
+        lb.bind("<Control-Button-1>", self._on_ctrl_click)
+        lb.bind("<Shift-Button-1>", self._on_shift_click)
+        lb.bind("<B1-Motion>", self._on_drag)
+        lb.bind("<ButtonRelease-1>", lambda e: "break")
+        lb.bind("<Double-Button-1>", lambda e: "break")
+        lb.bind("<MouseWheel>", self._on_wheel)
+        lb.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        lb.bind("<Button-5>", lambda e: self._scroll_by(3))
+        lb.bind("<Up>", lambda e: self._move_active(-1, False))
+        lb.bind("<Down>", lambda e: self._move_active(1, False))
+        lb.bind("<Shift-Up>", lambda e: self._move_active(-1, True))
+        lb.bind("<Shift-Down>", lambda e: self._move_active(1, True))
+        lb.bind("<Prior>", lambda e: self._move_active(-self._rows, False))
+        lb.bind("<Next>", lambda e: self._move_active(self._rows, False))
+        lb.bind("<Home>", lambda e: self._move_active(-len(self.model), False))
+        lb.bind("<End>", lambda e: self._move_active(len(self.model), False))
+        lb.bind("<Control-a>", self._on_select_all)
+        lb.bind("<Control-A>", self._on_select_all)
+    
+    # ---------- 与tk.Listbox兼容的方法 ----------
+    
+    def _index(self, index, for_insert=False):
+        """
+        把tk.END/"end"或数字转换成模型下标
+        """
+        if index in (tk.END, "end"):
+            return len(self.model) if for_insert else len(self.model) - 1
+        return int(index)
+    
+    def _range(self, first, last):
+        first = max(0, self._index(first))
+        last = first if last is None else min(self._index(last), len(self.model) - 1)
+        return first, last
+    
+    def insert(self, index, *items):
+        """
+        批量插入数据（只适用于list模型），插入位置之后的选择会被清除
+        """
+        if not items:
+            return
+        position = self._index(index, for_insert=True)
+        if position < len(self.model):
+            self._selected = {i for i in self._selected if i < position}
+        self.model[position:position] = items
+        self.refresh()
+    
+    def delete(self, first, last=None):
+        """
+        删除first到last（含）之间的数据（只适用于list模型），同时清除选择
+        """
+        first, last = self._range(first, last)
+        if last >= first:
+            del self.model[first:last + 1]
+        self._selected.clear()
+        self._anchor = None
+        self.refresh()
+    
+    def get(self, first, last=None):
+        if last is None:
+            return self.model[self._index(first)]
+        first, last = self._range(first, last)
+        return tuple(self.model[i] for i in range(first, last + 1))
+    
+    def size(self):
+        return len(self.model)
+    
+    def curselection(self):
+        return tuple(sorted(self._selected))
+    
+    def select_set(self, first, last=None):
+        first, last = self._range(first, last)
+        if last >= first:
+            self._selected.update(range(first, last + 1))
+        self._render()
+    
+    selection_set = select_set
+    
+    def selection_clear(self, first, last=None):
+        first, last = self._range(first, last)
+        if last - first + 1 >= len(self._selected):
+            self._selected = {i for i in self._selected if not first <= i <= last}
+        else:
+            self._selected.difference_update(range(first, last + 1))
+        self._render()
+    
+    select_clear = selection_clear
+    
+    def selection_includes(self, index):
+        return self._index(index) in self._selected
+    
+    def see(self, index):
+        index = self._index(index)
+        if index < self._top:
+            self._top = index
+        elif index >= self._top + self._rows:
+            self._top = index - self._rows + 1
+        self._render()
+    
+    def yview(self, *args):
+        """
+        滚动条接口：无参数时返回(first, last)可见比例，否则处理moveto/scroll命令
+        """
+        total = len(self.model)
+        if not args:
+            if not total:
+                return 0.0, 1.0
+            return self._top / total, min(1.0, (self._top + self._rows) / total)
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= max(1, self._rows - 1)
+            self._top += amount
+        self._render()
+    
+    def configure(self, **kwargs):
+        if "yscrollcommand" in kwargs:
+            self._yscrollcommand = kwargs.pop("yscrollcommand")
+            self._notify_scroll()
+        if kwargs:
+            self._listbox.configure(**kwargs)
+    
+    config = configure
+    
+    def refresh(self):
+        """
+        后端模型变化后重新渲染（模型变短时去掉越界的选择）
+        """
+        total = len(self.model)
+        if self._selected and max(self._selected) >= total:
+            self._selected = {i for i in self._selected if i < total}
+        self._render()
+    
+    # ---------- 渲染 ----------
+    
+    def _render(self):
+        """
+        只把可见窗口内的数据放进内部Listbox，并按模型选择状态标记选中行
+        """
+        total = len(self.model)
+        self._top = max(0, min(self._top, total - self._rows))
+        end = min(total, self._top + self._rows + 1)  # 多放一行填满底部的半行
+        lb = self._listbox
+        lb.delete(0, tk.END)
+        if end > self._top:
+            lb.insert(tk.END, *(self.model[i] for i in range(self._top, end)))
+            for i in range(self._top, end):
+                if i in self._selected:
+                    lb.selection_set(i - self._top)
+        lb.yview_moveto(0)
+        self._notify_scroll()
+    
+    def _notify_scroll(self):
+        if self._yscrollcommand:
+            first, last = self.yview()
+            self._yscrollcommand(first, last)
+    
+    def _on_configure(self, event):
+        """
+        控件大小变化时重新计算可见行数
+        """
+        lb = self._listbox
+        line = tkfont.Font(font=lb.cget("font")).metrics("linespace") + 2 * int(lb.cget("selectborderwidth"))
+        border = 2 * (int(lb.cget("borderwidth")) + int(lb.cget("highlightthickness")))
+        self._rows = max(1, (event.height - border) // max(1, line))
+        self._render()
+    
+    def _scroll_by(self, rows):
+        self._top += rows
+        self._render()
+        return "break"
+    
+    # ---------- 鼠标和键盘 ----------
+    
+    def _index_at(self, y):
+        """
+        返回y坐标处的模型下标，列表为空时返回None
+        """
+        if not len(self.model):
+            return None
+        return min(self._top + self._listbox.nearest(y), len(self.model) - 1)
+    
+    def _select_range(self, start, end):
+        low, high = min(start, end), max(start, end)
+        self._selected = set(range(low, high + 1))
+    
+    def _on_click(self, event):
+        self._listbox.focus_set()
+        index = self._index_at(event.y)
+        self._selected.clear()
+        if index is not None:
+            self._selected.add(index)
+            self._anchor = self._active = index
+        self._render()
+        return "break"
+    
+    def _on_ctrl_click(self, event):
+        self._listbox.focus_set()
+        index = self._index_at(event.y)
+        if index is not None:
+            self._selected ^= {index}
+            self._anchor = self._active = index
+            self._render()
+        return "break"
+    
+    def _on_shift_click(self, event):
+        self._listbox.focus_set()
+        index = self._index_at(event.y)
+        if index is not None:
+            if self._anchor is None:
+                self._anchor = index
+            self._select_range(self._anchor, index)
+            self._active = index
+            self._render()
+        return "break"
+    
+    def _on_drag(self, event):
+        if self._anchor is None:
+            return "break"
+        # 拖出控件上下边缘时自动滚动
+        if event.y < 0:
+            self._top -= 1
+        elif event.y > self._listbox.winfo_height():
+            self._top += 1
+        self._top = max(0, min(self._top, len(self.model) - self._rows))
+        index = self._index_at(min(max(event.y, 0), self._listbox.winfo_height()))
+        if index is not None:
+            self._select_range(self._anchor, index)
+            self._active = index
+        self._render()
+        return "break"
+    
+    def _on_wheel(self, event):
+        # Windows上delta为120的倍数，macOS上为较小的整数
+        step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll_by(-step * 3)
+    
+    def _move_active(self, delta, extend):
+        total = len(self.model)
+        if not total:
+            return "break"
+        self._active = max(0, min(total - 1, self._active + delta))
+        if extend and self._anchor is not None:
+            self._select_range(self._anchor, self._active)
+        else:
+            self._selected = {self._active}
+            self._anchor = self._active
+        self.see(self._active)
+        return "break"
+    
+    def _on_select_all(self, event):
+        self.select_set(0, tk.END)
+        return "break"
 
 
 class PicGetApp:
@@ -38,10 +3051,38 @@ class PicGetApp:
         
         # 初始化成员变量
         self.driver = None  # Selenium WebDriver（预留，当前未使用）
-        self.downloaded_images = set()  # 存储已下载图片的MD5哈希值，用于去重
+        self.downloaded_images = ConcurrentHashSet()  # 存储已下载图片的哈希值，用于去重（多线程安全）
+        self.active_parts = ConcurrentHashSet()  # 正在写入的.part文件，防止同一URL被两个线程同时下载
+        self.detail_links = LinkStore()  # 批量分析得到的详情页链接，图片链接列表是它的视图
         self.stop_analysis = False  # 停止分析标志位
+        self.http = HttpSessionPool()  # 所有标签页共享的HTTP连接池
+        self.async_engine = AsyncDownloadEngine()  # asyncio下载引擎（在高级设置中选择）
+        self.hash_indexes = {}  # 下载根目录 -> HashIndex，跨运行持久化的去重索引
+        self.url_skip_mode = "off"  # 已知链接处理方式: off 正常下载 / skip 直接跳过 / revalidate 条件请求验证
+        self.hash_algorithm = "md5"  # 去重哈希算法（HASH_BACKENDS中的名称）
+        self.perceptual_mode = "off"  # 近似重复检测: off 关闭 / flag 标记 / drop 删除
+        self.perceptual_threshold = 6  # 近似重复的汉明距离阈值
+        self.perceptual = {}  # 下载根目录 -> PerceptualDeduper
+        self.segment_connections = 4  # 大文件分段下载的连接数，1表示不分段
+        self.segment_threshold = 16 * 1024 * 1024  # 启用分段下载的最小文件长度（字节）
+        self.segment_slots = SegmentSlots(self.segment_connections - 1)  # 所有分段下载共用的额外线程名额
+        self._hash_index_lock = threading.Lock()
+        self.ui = UiEventBus(root)  # 工作线程的日志和进度按节拍批量刷新到界面
+        self.log_archive = LogArchive()  # 完整日志写入~/.picget/logs下的轮转文件
         
         self.setup_ui()  # 设置用户界面
+        self.ui.start()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+    
+    def on_close(self):
+        """
+        关闭主窗口：先停止近似重复检测的工作进程，再销毁窗口
+        """
+        with self._hash_index_lock:
+            dedupers = list(self.perceptual.values())
+        for deduper in dedupers:
+            deduper.close()
+        self.root.destroy()
     
     def setup_ui(self):
         """
@@ -64,10 +3105,15 @@ class PicGetApp:
         self.tab_video = ttk.Frame(self.notebook, padding="20")
         self.notebook.add(self.tab_video, text="视频下载")
         
+        # 创建高级设置标签页
+        self.tab_advanced = ttk.Frame(self.notebook, padding="20")
+        self.notebook.add(self.tab_advanced, text="高级设置")
+        
         # 调用各标签页的UI设置方法
         self.setup_single_download_ui()
         self.setup_batch_download_ui()
         self.setup_video_download_ui()
+        self.setup_advanced_ui()
     
     def setup_single_download_ui(self):
         """
@@ -185,8 +3231,8 @@ class PicGetApp:
         list_frame = ttk.LabelFrame(self.tab_batch, text="页面列表 (支持Ctrl/Shift多选)", padding="10")
         list_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
         
-        # 页面列表框（支持多选）
-        self.url_listbox = tk.Listbox(list_frame, selectmode=tk.EXTENDED, height=8)
+        # 页面列表框（虚拟化列表，支持多选）
+        self.url_listbox = VirtualListbox(list_frame, height=8)
         self.url_listbox.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
         
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.url_listbox.yview)
@@ -203,13 +3249,14 @@ class PicGetApp:
         ttk.Button(button_frame, text="停止分析", command=self.stop_analyze).pack(side=tk.LEFT, padx=(5, 5))
         ttk.Button(button_frame, text="清空页面列表", command=self.clear_url_list).pack(side=tk.LEFT, padx=(5, 5))
         ttk.Button(button_frame, text="下载选中网址图片", command=self.download_selected_images).pack(side=tk.RIGHT, padx=(5, 0))
+        ttk.Button(button_frame, text="分析并下载选中页面", command=self.start_pipeline_download).pack(side=tk.RIGHT, padx=(5, 0))
         
         # ========== 图片链接区域 ==========
         img_list_frame = ttk.LabelFrame(self.tab_batch, text="图片链接", padding="10")
         img_list_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
         
-        # 图片链接列表框
-        self.img_listbox = tk.Listbox(img_list_frame, selectmode=tk.EXTENDED, height=8)
+        # 图片链接列表框（直接显示链接存储中的数据）
+        self.img_listbox = VirtualListbox(img_list_frame, model=self.detail_links, height=8)
         self.img_listbox.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
         
         img_scrollbar = ttk.Scrollbar(img_list_frame, orient=tk.VERTICAL, command=self.img_listbox.yview)
@@ -223,6 +3270,8 @@ class PicGetApp:
         ttk.Button(img_button_frame, text="全选图片", command=self.select_all_images).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(img_button_frame, text="取消全选", command=self.deselect_all_images).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(img_button_frame, text="清空列表", command=self.clear_img_list).pack(side=tk.LEFT, padx=(20, 5))
+        ttk.Button(img_button_frame, text="保存链接", command=self.save_detail_links).pack(side=tk.LEFT, padx=(5, 5))
+        ttk.Button(img_button_frame, text="加载链接", command=self.load_detail_links).pack(side=tk.LEFT, padx=(5, 5))
         ttk.Button(img_button_frame, text="下载选中网址图片", command=self.download_selected_images).pack(side=tk.RIGHT, padx=(5, 0))
         
         # ========== 下载进度区域 ==========
@@ -236,6 +3285,267 @@ class PicGetApp:
         batch_scrollbar.pack(fill=tk.Y, side=tk.RIGHT)
         self.batch_progress_text.config(yscrollcommand=batch_scrollbar.set)
     
+    def setup_advanced_ui(self):
+        """
+        设置高级设置标签页的UI
+        包含各下载标签页共用的下载引擎等设置
+        """
+        # ========== 下载引擎区域 ==========
+        engine_frame = ttk.LabelFrame(self.tab_advanced, text="下载引擎", padding="10")
+        engine_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        # 引擎选择（线程池 / asyncio）
+        ttk.Label(engine_frame, text="下载引擎:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.engine_combo = ttk.Combobox(engine_frame, values=["线程池", "asyncio"], state="readonly", width=12)
+        self.engine_combo.grid(row=0, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.engine_combo.set("线程池")
+        if aiohttp is None:
+            ttk.Label(engine_frame, text="(asyncio引擎需要安装 aiohttp)").grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        
+        # asyncio引擎的总并发上限
+        ttk.Label(engine_frame, text="异步最大并发:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.async_limit_entry = ttk.Entry(engine_frame, width=10)
+        self.async_limit_entry.grid(row=1, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.async_limit_entry.insert(0, "1000")
+        
+        # asyncio引擎的每主机并发上限
+        ttk.Label(engine_frame, text="每主机并发:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.async_per_host_entry = ttk.Entry(engine_frame, width=10)
+        self.async_per_host_entry.grid(row=2, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.async_per_host_entry.insert(0, "16")
+        
+        # 自适应并发：线程数量（或异步最大并发）作为上限，按延迟和错误自动调整
+        self.adaptive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(engine_frame, text="自适应并发（线程数量/异步最大并发作为上限，遇到429/503/超时自动回退）",
+                        variable=self.adaptive_var).grid(row=3, column=0, columnspan=3, sticky=tk.W, pady=5)
+        
+        # 大文件（MP4直链、超大图片）按字节范围分段，多连接并发下载
+        ttk.Label(engine_frame, text="大文件分段连接数:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        self.segment_connections_entry = ttk.Entry(engine_frame, width=10)
+        self.segment_connections_entry.grid(row=4, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.segment_connections_entry.insert(0, "4")
+        ttk.Label(engine_frame, text="(1表示不分段；服务器需支持Range请求)").grid(row=4, column=2, sticky=tk.W, padx=(10, 0))
+        
+        ttk.Label(engine_frame, text="分段阈值(MB):").grid(row=5, column=0, sticky=tk.W, pady=5)
+        self.segment_threshold_entry = ttk.Entry(engine_frame, width=10)
+        self.segment_threshold_entry.grid(row=5, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.segment_threshold_entry.insert(0, "16")
+        
+        # ========== 去重索引区域 ==========
+        index_frame = ttk.LabelFrame(self.tab_advanced, text="去重索引", padding="10")
+        index_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        # 已下载过的图片URL如何处理（索引保存在保存路径下）
+        ttk.Label(index_frame, text="已知链接:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.url_skip_combo = ttk.Combobox(index_frame, values=list(self.URL_SKIP_MODES), state="readonly", width=12)
+        self.url_skip_combo.grid(row=0, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.url_skip_combo.set("关闭")
+        ttk.Label(index_frame, text="(直接跳过: 不发请求; 条件请求验证: 服务器返回304时跳过)").grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        
+        # 去重哈希算法；更换算法后，旧算法登记的图片不会与新算法的结果混淆
+        ttk.Label(index_frame, text="哈希算法:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.hash_combo = ttk.Combobox(index_frame, values=list(HASH_BACKENDS), state="readonly", width=12)
+        self.hash_combo.grid(row=1, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.hash_combo.set("md5")
+        ttk.Label(index_frame, text="(各算法在本机的速度可用 benchmarks/bench_hash.py 测试)").grid(row=1, column=2, sticky=tk.W, padx=(10, 0))
+        
+        # 近似重复检测（感知哈希），识别重新压缩/缩放过的同一张图片
+        ttk.Label(index_frame, text="近似重复检测:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.perceptual_combo = ttk.Combobox(index_frame, values=list(self.PERCEPTUAL_MODES), state="readonly", width=12)
+        self.perceptual_combo.grid(row=2, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.perceptual_combo.set("关闭")
+        if Image is None:
+            ttk.Label(index_frame, text="(需要安装 Pillow)").grid(row=2, column=2, sticky=tk.W, padx=(10, 0))
+        
+        ttk.Label(index_frame, text="汉明距离阈值:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.perceptual_threshold_entry = ttk.Entry(index_frame, width=10)
+        self.perceptual_threshold_entry.grid(row=3, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.perceptual_threshold_entry.insert(0, "6")
+        ttk.Label(index_frame, text="(0-64，越小越严格)").grid(row=3, column=2, sticky=tk.W, padx=(10, 0))
+        
+        # ========== 请求限速区域 ==========
+        rate_frame = ttk.LabelFrame(self.tab_advanced, text="请求限速", padding="10")
+        rate_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        # 默认每主机速率（0表示按各标签页的请求延时和线程数量推算）
+        ttk.Label(rate_frame, text="默认速率(请求/秒):").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.rate_entry = ttk.Entry(rate_frame, width=10)
+        self.rate_entry.grid(row=0, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.rate_entry.insert(0, "0")
+        ttk.Label(rate_frame, text="(0表示按请求延时和线程数量推算)").grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        
+        # 默认突发数
+        ttk.Label(rate_frame, text="突发数:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.burst_entry = ttk.Entry(rate_frame, width=10)
+        self.burst_entry.grid(row=1, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.burst_entry.insert(0, "5")
+        
+        # 按主机单独配置速率，每行一个：主机=速率[,突发数]
+        ttk.Label(rate_frame, text="主机速率:").grid(row=2, column=0, sticky=tk.NW, pady=5)
+        self.host_rates_text = tk.Text(rate_frame, height=4, width=50)
+        self.host_rates_text.grid(row=2, column=1, columnspan=2, sticky=tk.W, padx=(5, 0), pady=5)
+        ttk.Label(rate_frame, text="每行一个，例如: cdn.example.com=20,10").grid(row=3, column=1, columnspan=2, sticky=tk.W, padx=(5, 0))
+        
+        # ========== 故障主机熔断区域 ==========
+        breaker_frame = ttk.LabelFrame(self.tab_advanced, text="故障主机熔断", padding="10")
+        breaker_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        # 同一主机连续失败（连接失败/超时/5xx）达到该次数后，冷却期内的请求直接失败
+        ttk.Label(breaker_frame, text="连续失败次数:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.breaker_threshold_entry = ttk.Entry(breaker_frame, width=10)
+        self.breaker_threshold_entry.grid(row=0, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.breaker_threshold_entry.insert(0, "5")
+        ttk.Label(breaker_frame, text="(0表示不熔断)").grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        
+        ttk.Label(breaker_frame, text="冷却时间(秒):").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.breaker_cooldown_entry = ttk.Entry(breaker_frame, width=10)
+        self.breaker_cooldown_entry.grid(row=1, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.breaker_cooldown_entry.insert(0, "30")
+        ttk.Label(breaker_frame, text="(冷却后放行一个探测请求，失败则冷却时间加倍)").grid(row=1, column=2, sticky=tk.W, padx=(10, 0))
+        
+        # ========== 日志区域 ==========
+        log_frame = ttk.LabelFrame(self.tab_advanced, text="日志", padding="10")
+        log_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        # 各标签页的日志框只保留最近的行，完整日志保存在日志目录中
+        ttk.Label(log_frame, text="日志目录:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        log_location = self.log_archive.directory
+        if self.log_archive.error:
+            log_location += f" (不可写: {self.log_archive.error})"
+        ttk.Label(log_frame, text=log_location).grid(row=0, column=1, columnspan=2, sticky=tk.W, padx=(5, 0))
+        
+        ttk.Label(log_frame, text="搜索日志:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.log_search_entry = ttk.Entry(log_frame, width=40)
+        self.log_search_entry.grid(row=1, column=1, sticky=tk.W, padx=(5, 0), pady=5)
+        self.log_search_entry.bind("<Return>", lambda e: self.search_logs())
+        ttk.Button(log_frame, text="搜索", command=self.search_logs).grid(row=1, column=2, sticky=tk.W, padx=(10, 0))
+    
+    URL_SKIP_MODES = {"关闭": "off", "直接跳过": "skip", "条件请求验证": "revalidate"}
+    
+    PERCEPTUAL_MODES = {"关闭": "off", "标记": "flag", "删除": "drop"}
+    
+    def apply_index_settings(self):
+        """
+        读取去重索引设置（需在UI线程中调用），设置无效时弹出错误提示
+        下载线程通过self.url_skip_mode、self.hash_algorithm和self.perceptual_*读取
+        
+        返回:
+            设置有效返回True，否则返回False
+        """
+        perceptual_mode = self.PERCEPTUAL_MODES.get(self.perceptual_combo.get(), "off")
+        if perceptual_mode != "off" and Image is None:
+            messagebox.showerror("错误", "未安装Pillow，无法使用近似重复检测")
+            return False
+        try:
+            threshold = int(self.perceptual_threshold_entry.get())
+        except ValueError:
+            threshold = -1
+        if threshold < 0 or threshold > 64:
+            messagebox.showerror("错误", "汉明距离阈值必须是0-64之间的整数")
+            return False
+        
+        self.url_skip_mode = self.URL_SKIP_MODES.get(self.url_skip_combo.get(), "off")
+        self.hash_algorithm = self.hash_combo.get() if self.hash_combo.get() in HASH_BACKENDS else "md5"
+        self.perceptual_mode = perceptual_mode
+        self.perceptual_threshold = threshold
+        return True
+    
+    def apply_segment_settings(self):
+        """
+        读取大文件分段下载设置（需在UI线程中调用），设置无效时弹出错误提示
+        下载线程通过self.segment_connections、self.segment_threshold和self.segment_slots读取
+        
+        返回:
+            设置有效返回True，否则返回False
+        """
+        try:
+            connections = int(self.segment_connections_entry.get())
+            threshold = float(self.segment_threshold_entry.get())
+        except ValueError:
+            connections = threshold = -1
+        if connections < 1 or connections > 32 or threshold < 1:
+            messagebox.showerror("错误", "分段连接数必须是1-32之间的整数，分段阈值必须不小于1MB")
+            return False
+        self.segment_connections = connections
+        self.segment_threshold = int(threshold * 1024 * 1024)
+        # 下载线程池里的每个线程都可能遇到大文件，额外的分段线程总共不超过一个文件的连接数
+        self.segment_slots.resize(connections - 1)
+        return True
+    
+    def create_controller(self, thread_count, engine=None):
+        """
+        按高级设置创建本次下载使用的自适应并发控制器（需在UI线程中调用）
+        
+        参数:
+            thread_count: 线程数量设置
+            engine: asyncio引擎设置，使用asyncio引擎时以异步最大并发作为上限
+        返回:
+            AdaptiveConcurrency对象；未启用自适应并发时返回None
+        """
+        if not self.adaptive_var.get():
+            return None
+        return AdaptiveConcurrency(engine["max_in_flight"] if engine else thread_count)
+    
+    def apply_rate_settings(self):
+        """
+        读取限速和熔断设置并应用到共享限速器和熔断器（需在UI线程中调用）
+        设置无效时弹出错误提示
+        
+        返回:
+            设置有效返回True，否则返回False
+        """
+        try:
+            default_rate = float(self.rate_entry.get())
+            default_burst = int(self.burst_entry.get())
+            host_rates = {}
+            for line in self.host_rates_text.get(1.0, tk.END).splitlines():
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                host, value = line.split('=', 1)
+                parts = value.split(',')
+                rate = float(parts[0])
+                burst = int(parts[1]) if len(parts) > 1 else default_burst
+                host_rates[host.strip().lower()] = (rate, max(1, burst))
+        except ValueError:
+            messagebox.showerror("错误", "限速设置无效：速率必须是数字，突发数必须是整数，主机速率格式为 主机=速率[,突发数]")
+            return False
+        
+        try:
+            breaker_threshold = int(self.breaker_threshold_entry.get())
+            breaker_cooldown = float(self.breaker_cooldown_entry.get())
+        except ValueError:
+            breaker_threshold = breaker_cooldown = -1
+        if breaker_threshold < 0 or breaker_cooldown <= 0:
+            messagebox.showerror("错误", "熔断设置无效：连续失败次数必须是非负整数，冷却时间必须大于0")
+            return False
+        
+        self.http.limiter.configure(default_rate, default_burst, host_rates)
+        self.http.breaker.configure(breaker_threshold, breaker_cooldown)
+        return True
+    
+    def get_engine_settings(self):
+        """
+        读取并验证下载引擎设置（需在UI线程中调用）
+        
+        返回:
+            使用asyncio引擎时返回 {"max_in_flight": n, "per_host": m}，使用线程池时返回None
+        异常:
+            ValueError: 设置无效，异常消息可直接显示给用户
+        """
+        if self.engine_combo.get() != "asyncio":
+            return None
+        if aiohttp is None:
+            raise ValueError("未安装aiohttp，无法使用asyncio下载引擎")
+        try:
+            max_in_flight = int(self.async_limit_entry.get())
+            per_host = int(self.async_per_host_entry.get())
+        except ValueError:
+            raise ValueError("异步最大并发和每主机并发必须是整数")
+        if max_in_flight < 1 or max_in_flight > 10000 or per_host < 1 or per_host > max_in_flight:
+            raise ValueError("异步最大并发必须在1-10000之间，每主机并发不能超过最大并发")
+        return {"max_in_flight": max_in_flight, "per_host": per_host}
+    
     def browse_folder(self):
         """
         单页下载：弹出文件夹选择对话框
@@ -289,7 +3599,7 @@ class PicGetApp:
         m3u8_content_frame = ttk.LabelFrame(self.tab_video, text="M3U8内容列表", padding="10")
         m3u8_content_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
         
-        self.m3u8_content_listbox = tk.Listbox(m3u8_content_frame, selectmode=tk.EXTENDED, height=6)
+        self.m3u8_content_listbox = VirtualListbox(m3u8_content_frame, height=6)
         self.m3u8_content_listbox.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
         
         m3u8_content_scrollbar = ttk.Scrollbar(m3u8_content_frame, orient=tk.VERTICAL, command=self.m3u8_content_listbox.yview)
@@ -386,6 +3696,9 @@ class PicGetApp:
             messagebox.showerror("错误", "请输入网址URL")
             return
         
+        if not self.apply_rate_settings():
+            return
+        
         # 清空列表并显示分析中提示
         self.m3u8_listbox.delete(0, tk.END)
         self.m3u8_listbox.insert(tk.END, "正在分析...")
@@ -405,8 +3718,7 @@ class PicGetApp:
         try:
             # 获取HTTP请求头
             headers = self.get_headers()
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()  # 检查请求是否成功
+            response = self.http.fetch(url, headers=headers, timeout=30)
             
             # 尝试解码响应内容（某些网站使用双重URL编码）
             match = re.search(r'var _h="([^"]+)"', response.text)
@@ -529,6 +3841,9 @@ class PicGetApp:
             messagebox.showerror("错误", "没有有效的M3U8链接")
             return
         
+        if not self.apply_rate_settings():
+            return
+        
         # 启动后台线程分析
         thread = threading.Thread(target=self.analyze_m3u8_content_thread, args=(m3u8_urls,))
         thread.daemon = True
@@ -555,8 +3870,7 @@ class PicGetApp:
             """
             try:
                 headers = self.get_headers()
-                response = requests.get(url, headers=headers, timeout=30)
-                response.raise_for_status()
+                response = self.http.fetch(url, headers=headers, timeout=30)
                 
                 lines = response.text.split('\n')
                 base_url = url.rsplit('/', 1)[0] + '/'  # 基础URL用于相对路径
@@ -599,27 +3913,32 @@ class PicGetApp:
             except Exception as e:
                 return []
         
-        # 解析每个M3U8文件
+        # 解析每个M3U8文件，片段按播放列表顺序依次编号（多个M3U8按选择顺序连续编号）
         for m3u8_url in m3u8_urls:
+            if urlparse(m3u8_url).path.lower().endswith('.mp4'):
+                # MP4直链不需要解析，直接加入下载列表
+                all_segments.append(m3u8_url)
+                self.video_log_message(f"{m3u8_url}: MP4直链")
+                continue
             try:
                 segments = parse_m3u8(m3u8_url)
                 
                 if segments:
                     all_segments.extend(segments)
-                    self.root.after(0, lambda u=m3u8_url, c=len(segments): self.video_progress_text.insert(tk.END, f"{u}: {c} 个TS切片\n"))
+                    self.video_log_message(f"{m3u8_url}: {len(segments)} 个TS切片")
                 else:
-                    self.root.after(0, lambda u=m3u8_url: self.video_progress_text.insert(tk.END, f"{u}: 未找到切片\n"))
+                    self.video_log_message(f"{m3u8_url}: 未找到切片")
                 
             except Exception as e:
-                self.root.after(0, lambda msg=str(e): self.video_progress_text.insert(tk.END, f"分析失败: {msg}\n"))
-        
-        # 更新内容列表
-        self.root.after(0, lambda: self.m3u8_content_listbox.delete(0, tk.END))
+                self.video_log_message(f"分析失败: {str(e)}")
         
-        for segment in all_segments:
-            self.root.after(0, lambda s=segment: self.m3u8_content_listbox.insert(tk.END, s))
+        # 更新内容列表（一次性批量插入），每行为 "序号 | URL"，序号决定拼接顺序
+        def update_list():
+            self.m3u8_content_listbox.delete(0, tk.END)
+            self.m3u8_content_listbox.insert(tk.END, *(f"{index:05d} | {url}" for index, url in enumerate(all_segments)),
+                                             f"--- 共找到 {len(all_segments)} 个TS切片 ---")
         
-        self.root.after(0, lambda c=len(all_segments): self.m3u8_content_listbox.insert(tk.END, f"--- 共找到 {c} 个TS切片 ---"))
+        self.root.after(0, update_list)
     
     def start_video_download(self):
         """
@@ -648,39 +3967,58 @@ class PicGetApp:
             messagebox.showerror("错误", "线程数量必须在1-100之间")
             return
         
+        try:
+            engine = self.get_engine_settings()
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        
+        if not self.apply_rate_settings():
+            return
+        
+        if not self.apply_segment_settings():
+            return
+        
         # 禁用开始按钮防止重复点击
         self.video_start_button.config(state=tk.DISABLED)
         self.downloaded_images.clear()
+        self.http.resize(thread_count)
         
-        # 收集选中的TS片段URL
-        ts_urls = []
+        # 收集选中的TS片段：(播放列表序号, URL)
+        segments = []
         for idx in selected_indices:
             item = self.m3u8_content_listbox.get(idx)
             if item.startswith("---") or item.startswith("正在分析"):
                 continue
-            ts_urls.append(item)
+            number, _, url = item.partition(" | ")
+            if url and number.isdigit():
+                segments.append((int(number), url))
         
-        if not ts_urls:
+        if not segments:
             messagebox.showerror("错误", "没有有效的TS片段")
             return
         
         # 启动下载线程
-        thread = threading.Thread(target=self.download_ts_thread, args=(ts_urls, save_path, delay, thread_count))
+        controller = self.create_controller(thread_count, engine)
+        thread = threading.Thread(target=self.download_ts_thread, args=(segments, save_path, delay, thread_count, engine, controller))
         thread.daemon = True
         thread.start()
     
-    def download_ts_thread(self, ts_urls, save_path, delay, thread_count):
+    def download_ts_thread(self, segments, save_path, delay, thread_count, engine=None, controller=None):
         """
-        在后台线程中下载TS片段并合并为MP4
+        在后台线程中下载TS片段，并按播放列表序号流式拼接为MP4
         
         参数:
-            ts_urls: TS片段URL列表
+            segments: [(播放列表序号, TS片段URL), ...]
             save_path: 保存路径
             delay: 请求延时
             thread_count: 下载线程数
+            engine: asyncio引擎设置，None表示使用线程池
+            controller: 自适应并发控制器，None表示固定并发
         """
         try:
-            self.root.after(0, lambda: self.video_progress_text.insert(tk.END, f"开始下载 {len(ts_urls)} 个TS片段...\n"))
+            segments = sorted(segments)
+            self.video_log_message(f"开始下载 {len(segments)} 个TS片段...")
             
             video_url = self.video_url_entry.get().strip()
             custom_filename = self.video_filename_entry.get().strip()
@@ -691,8 +4029,7 @@ class PicGetApp:
             else:
                 # 如果没有自定义文件名，从网页提取标题
                 headers = self.get_headers()
-                response = requests.get(video_url, headers=headers, timeout=30)
-                response.raise_for_status()
+                response = self.http.fetch(video_url, headers=headers, timeout=30)
                 
                 match = re.search(r'var _h="([^"]+)"', response.text)
                 if match:
@@ -743,80 +4080,155 @@ class PicGetApp:
             page_save_path = os.path.join(save_path, title)
             os.makedirs(page_save_path, exist_ok=True)
             
-            self.root.after(0, lambda t=title: self.video_progress_text.insert(tk.END, f"保存文件夹: {t}\n"))
+            self.video_log_message(f"保存文件夹: {title}")
             
-            # 下载计数器和文件列表
-            downloaded_count = [0]
-            total_count = len(ts_urls)
-            ts_files = []
+            # 下载计数器
+            downloaded_count = AtomicCounter()
+            total_count = len(segments)
+            rate = self.delay_to_rate(delay, thread_count)
+            assembler = None  # TS片段的流式拼接器，MP4直链下载完后创建
             
-            def download_one(ts_url):
+            def on_downloaded():
                 """
-                下载单个TS片段
+                一个TS片段下载完成后更新进度
+                """
+                n = downloaded_count.increment()
+                self.video_log_message(f"已下载 {n}/{total_count}")
+            
+            def download_one(item):
+                """
+                下载单个TS片段并交给拼接器
                 
                 参数:
-                    ts_url: TS片段URL
+                    item: (播放列表序号, TS片段URL)
                 """
+                index, ts_url = item
+                if not assembler.needed(index):
+                    return  # 上次运行已经拼接
                 try:
-                    headers = self.get_headers()
-                    resp = requests.get(ts_url, headers=headers, timeout=60, stream=True)
-                    resp.raise_for_status()
-                    
-                    # 生成文件名（去除查询参数）
-                    filename = os.path.basename(ts_url.split('?')[0]) or f"ts_{downloaded_count[0]}.ts"
-                    file_path = os.path.join(page_save_path, filename)
-                    
-                    # 流式写入文件
-                    with open(file_path, 'wb') as f:
-                        for chunk in resp.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                    
-                    ts_files.append(file_path)
-                    downloaded_count[0] += 1
-                    self.root.after(0, lambda n=downloaded_count[0], t=total_count: self.video_progress_text.insert(tk.END, f"已下载 {n}/{t}\n"))
-                
+                    data = self.fetch_segment(ts_url, rate, controller)
                 except Exception as e:
-                    self.root.after(0, lambda msg=str(e): self.video_progress_text.insert(tk.END, f"下载失败: {msg}\n"))
-                
-                time.sleep(delay)
+                    assembler.add(index, None)
+                    self.video_log_message(f"下载失败: {str(e)}")
+                    return
+                assembler.add(index, data)
+                on_downloaded()
+            
+            used_names = set()
             
-            # 使用线程池并发下载
-            with ThreadPoolExecutor(max_workers=min(thread_count, total_count)) as executor:
-                list(executor.map(download_one, ts_urls))
+            def download_direct_video(index, video_url):
+                """
+                下载MP4直链，文件足够大且服务器支持Range时多连接分段下载
+                
+                参数:
+                    index: 播放列表序号，不同目录下的同名文件用它区分
+                    video_url: MP4文件URL
+                """
+                filename = os.path.basename(urlparse(video_url).path) or f"{title}.mp4"
+                if filename in used_names:
+                    stem, ext = os.path.splitext(filename)
+                    filename = f"{stem}_{index:05d}{ext}"
+                used_names.add(filename)
+                file_path = os.path.join(page_save_path, filename)
+                reported = [0]
+                
+                def on_progress(done, total):
+                    percent = done * 100 // total
+                    if percent >= reported[0] + 10:
+                        reported[0] = percent - percent % 10
+                        self.video_log_message(f"{filename}: {reported[0]}%")
+                
+                try:
+                    if self.download_file(video_url, file_path, rate, controller, segmented=True, on_progress=on_progress):
+                        self.video_log_message(f"视频下载完成: {filename}")
+                except Exception as e:
+                    self.video_log_message(f"下载失败 {filename}: {str(e)}")
             
-            # 合并TS文件为MP4
-            if ts_files:
-                mp4_path = os.path.join(page_save_path, f"{title}.mp4")
-                self.root.after(0, lambda: self.video_progress_text.insert(tk.END, f"正在合并TS文件...\n"))
+            async def download_one_async(session, item):
+                """
+                asyncio引擎下载单个TS片段并交给拼接器，限速等待期间不占用线程
                 
-                # 按文件名排序后合并
-                with open(mp4_path, 'wb') as outfile:
-                    for ts_file in sorted(ts_files):
-                        try:
-                            with open(ts_file, 'rb') as infile:
-                                outfile.write(infile.read())
-                        except Exception as e:
-                            self.root.after(0, lambda msg=str(e): self.video_progress_text.insert(tk.END, f"读取文件失败: {msg}\n"))
+                参数:
+                    session: AsyncBatch（请求经过批次的并发闸门）
+                    item: (播放列表序号, TS片段URL)
+                """
+                index, ts_url = item
+                if not assembler.needed(index):
+                    return True
+                # 拼接器会写.part文件、暂存片段和进度文件，放到线程池执行
+                io = partial(asyncio.get_running_loop().run_in_executor, None)
                 
-                # 删除TS临时文件
-                self.root.after(0, lambda: self.video_progress_text.insert(tk.END, f"正在删除TS文件...\n"))
+                segment = SegmentBuffer()
                 
-                deleted_count = 0
-                for ts_file in ts_files:
-                    try:
-                        if os.path.exists(ts_file):
-                            os.remove(ts_file)
-                            deleted_count += 1
-                    except Exception as e:
-                        self.root.after(0, lambda msg=str(e), ts=ts_file: self.video_progress_text.insert(tk.END, f"删除失败 {ts}: {msg}\n"))
+                async def receive(resp):
+                    resp.raise_for_status()
+                    segment.begin(resp.status, resp.headers)
+                    async for chunk in resp.content.iter_chunked(ResumableFile.CHUNK_SIZE):
+                        segment.write(chunk)
+                    return segment.finish()
                 
-                self.root.after(0, lambda t=title, c=deleted_count: self.video_progress_text.insert(tk.END, f"\n合并完成: {t}.mp4 (删除 {c} 个TS文件)\n"))
+                try:
+                    # 传输中断时从已收到的位置续传
+                    data = await self.http.transfer_async(
+                        session, ts_url, receive, headers=lambda: dict(self.get_headers(), **segment.request_headers()),
+                        rate=rate, controller=controller, timeout=aiohttp.ClientTimeout(total=60))
+                except Exception as e:
+                    await io(assembler.add, index, None)
+                    self.video_log_message(f"下载失败: {str(e)}")
+                    return False
+                await io(assembler.add, index, data)
+                on_downloaded()
+                return True
+            
+            # MP4直链逐个下载，不参与TS合并
+            direct_videos = [(i, u) for i, u in segments if urlparse(u).path.lower().endswith('.mp4')]
+            if direct_videos:
+                segments = [(i, u) for i, u in segments if not urlparse(u).path.lower().endswith('.mp4')]
+                total_count = len(segments)
+                for index, video_url in direct_videos:
+                    download_direct_video(index, video_url)
+                if not segments:
+                    self.video_log_message(self.http.stats_message())
+                    return
+            
+            # 拼接前检查：选中的片段序号有缺口时，输出的视频会跳过这些片段
+            indices = [index for index, _ in segments]
+            gaps = sorted(set(range(indices[0], indices[-1] + 1)).difference(indices))
+            if gaps:
+                self.video_log_message(f"注意: 选中的片段不连续，缺少 {len(gaps)} 个序号: {format_ranges(gaps)}")
+            
+            # 片段一边下载一边按序号拼接到 {title}.mp4，不再落地为单独的TS文件
+            mp4_path = os.path.join(page_save_path, f"{title}.mp4")
+            assembler = TsStreamAssembler(mp4_path, segments)
+            if assembler.resumed:
+                self.video_log_message(f"续接上次进度: 已拼接 {assembler.resumed}/{total_count} 个片段")
+            try:
+                if engine:
+                    # asyncio引擎：所有TS片段在同一个事件循环上并发
+                    self.async_engine.run(segments, download_one_async, controller=controller, **engine)
+                else:
+                    # 使用线程池并发下载
+                    with ThreadPoolExecutor(max_workers=min(thread_count, total_count)) as executor:
+                        list(executor.map(download_one, segments))
+            except BaseException:
+                assembler.abort()
+                raise
+            
+            if downloaded_count.value or assembler.resumed:
+                missing = assembler.close()
+                summary = f"\n合并完成: {title}.mp4"
+                if assembler.spilled:
+                    summary += f" ({assembler.spilled} 个乱序片段曾暂存到磁盘)"
+                self.video_log_message(summary)
+                if missing:
+                    self.video_log_message(f"缺失 {len(missing)} 个片段，序号: {format_ranges(missing)}")
             else:
-                self.root.after(0, lambda: self.video_progress_text.insert(tk.END, f"\n未下载任何文件\n"))
+                assembler.discard()
+                self.video_log_message(f"\n未下载任何文件")
+            self.video_log_message(self.http.stats_message())
         
         except Exception as e:
-            self.root.after(0, lambda msg=str(e): self.video_progress_text.insert(tk.END, f"错误: {msg}\n"))
+            self.video_log_message(f"错误: {str(e)}")
         
         finally:
             # 重新启用开始按钮
@@ -850,7 +4262,57 @@ class PicGetApp:
         """
         清空图片列表
         """
-        self.img_listbox.delete(0, tk.END)
+        self.detail_links.clear()
+        self.img_listbox.refresh()
+    
+    def add_detail_links(self, urls, source=None):
+        """
+        把详情页链接加入链接存储，并刷新图片链接列表（可在后台线程中调用）
+        
+        参数:
+            urls: 详情页链接列表
+            source: 发现这些链接的列表页
+        返回:
+            新添加的链接列表
+        """
+        added = self.detail_links.add_many(urls, source)
+        if added:
+            self.ui.call(self.img_listbox.refresh)
+        return added
+    
+    def save_detail_links(self):
+        """
+        把图片链接列表保存为文件
+        """
+        if not len(self.detail_links):
+            messagebox.showerror("错误", "没有可保存的链接")
+            return
+        path = filedialog.asksaveasfilename(title="保存链接", defaultextension=".jsonl",
+                                            filetypes=[("JSON Lines", "*.jsonl"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            count = self.detail_links.save(path)
+        except OSError as e:
+            messagebox.showerror("错误", f"保存失败: {e}")
+            return
+        self.batch_log_message(f"已保存 {count} 个链接: {path}")
+    
+    def load_detail_links(self):
+        """
+        从文件加载链接，追加到图片链接列表（重复的链接被忽略）
+        """
+        path = filedialog.askopenfilename(title="加载链接",
+                                          filetypes=[("JSON Lines", "*.jsonl"), ("文本文件", "*.txt"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            added = self.detail_links.load(path)
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("错误", f"加载失败: {e}")
+            return
+        self.img_listbox.refresh()
+        self.batch_log_message(f"已加载 {len(added)} 个新链接，共 {len(self.detail_links)} 个")
     
     def clear_url_list(self):
         """
@@ -866,23 +4328,54 @@ class PicGetApp:
     
     def log_message(self, message):
         """
-        向单页下载标签页的进度文本框添加日志
+        向单页下载标签页的进度文本框添加日志（线程安全，由UiEventBus按节拍批量写入）
         
         参数:
             message: 要显示的日志消息
         """
-        self.root.after(0, lambda: self.progress_text.insert(tk.END, message + "\n"))
-        self.root.after(0, lambda: self.progress_text.see(tk.END))  # 自动滚动到底部
+        self.log_archive.write("单页", message)
+        self.ui.log(self.progress_text, message)
     
     def batch_log_message(self, message):
         """
-        向批量下载标签页的进度文本框添加日志
+        向批量下载标签页的进度文本框添加日志（线程安全，由UiEventBus按节拍批量写入）
+        
+        参数:
+            message: 要显示的日志消息
+        """
+        self.log_archive.write("批量", message)
+        self.ui.log(self.batch_progress_text, message)
+    
+    def video_log_message(self, message):
+        """
+        向视频下载标签页的进度文本框添加日志（线程安全，由UiEventBus按节拍批量写入）
         
         参数:
             message: 要显示的日志消息
         """
-        self.root.after(0, lambda: self.batch_progress_text.insert(tk.END, message + "\n"))
-        self.root.after(0, lambda: self.batch_progress_text.see(tk.END))
+        self.log_archive.write("视频", message)
+        self.ui.log(self.video_progress_text, message)
+    
+    def search_logs(self):
+        """
+        在完整日志归档中搜索，结果显示在新窗口中（最多显示最新的1000行）
+        """
+        text = self.log_search_entry.get().strip()
+        if not text:
+            messagebox.showerror("错误", "请输入要搜索的内容")
+            return
+        lines = self.log_archive.search(text)
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"日志搜索: {text} ({len(lines)} 行)")
+        window.geometry("900x500")
+        result_text = tk.Text(window, wrap=tk.NONE)
+        result_text.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=result_text.yview)
+        scrollbar.pack(fill=tk.Y, side=tk.RIGHT)
+        result_text.config(yscrollcommand=scrollbar.set)
+        result_text.insert(tk.END, "\n".join(lines) if lines else "未找到匹配的日志")
+        result_text.see(tk.END)
     
     def clear_log(self):
         """
@@ -942,17 +4435,21 @@ class PicGetApp:
             "Referer": referer if referer else ""
         }
     
-    def random_delay(self, base_delay):
+    def delay_to_rate(self, delay, thread_count):
         """
-        执行随机延时
-        在基础延时上增加0-1秒的随机值，模拟人类行为
+        把标签页的“请求延时”换算成后备限速
+        原先每个线程请求后休眠delay秒，聚合速率约为 线程数/延时，
+        这里改为由共享令牌桶按同样的速率放行，线程不再在请求之间休眠
         
         参数:
-            base_delay: 基础延时秒数
+            delay: 请求延时秒数
+            thread_count: 线程数量
+        返回:
+            (速率, 突发数) 元组；延时为0时返回None（不限速）
         """
-        import random
-        delay = base_delay + random.uniform(0, 1)
-        time.sleep(delay)
+        if delay <= 0:
+            return None
+        return thread_count / delay, thread_count
     
     def sanitize_folder_name(self, name):
         """
@@ -1008,75 +4505,368 @@ class PicGetApp:
         
         return list(set(img_urls)), title  # 去重后返回
     
-    def download_image(self, url, folder_name, save_path, headers=None):
+    def fetch_segment(self, url, rate=None, controller=None):
+        """
+        把一个TS片段下载到内存（片段通常只有几MB），失败时按重试策略从已收到的位置续传
+        
+        参数:
+            url: 片段URL
+            rate: 没有配置限速时使用的后备 (速率, 突发数)
+            controller: 可选的自适应并发控制器
+        返回:
+            片段内容
+        异常:
+            requests.exceptions.RequestException或IncompleteDownload: 重试后仍然失败
+        """
+        segment = SegmentBuffer()
+        
+        def receive(response):
+            response.raise_for_status()
+            segment.begin(response.status_code, response.headers)
+            for chunk in response.iter_content(chunk_size=ResumableFile.CHUNK_SIZE):
+                segment.write(chunk)
+            return segment.finish()
+        
+        # 传输中断时从已收到的位置续传，不必重新下载整个片段
+        return self.http.transfer(url, receive, headers=lambda: dict(self.get_headers(), **segment.request_headers()),
+                                  rate=rate, controller=controller, timeout=60, stream=True)
+    
+    def download_file(self, url, file_path, rate=None, controller=None, segmented=False, on_progress=None):
+        """
+        下载单个文件：先写入.part文件，完整后改名为file_path；传输中断时从断点续传
+        
+        参数:
+            url: 文件URL
+            file_path: 保存路径（已存在时视为上次运行已完整下载）
+            rate: 没有配置限速时使用的后备 (速率, 突发数)
+            controller: 可选的自适应并发控制器
+            segmented: 为True时，文件超过分段阈值且服务器支持Range则多连接分段下载
+            on_progress: 分段下载的进度回调 on_progress(已完成字节数, 总字节数)
+        返回:
+            下载完成返回True；响应为空返回False
+        异常:
+            网络错误或IncompleteDownload，.part文件保留以便下次续传
+        """
+        if os.path.exists(file_path):
+            return True
+        part_path = file_path + ".part"
+        headers = self.get_headers()
+        
+        if segmented and self.segment_connections > 1:
+            plan = SegmentedDownload.probe(self.http, url, headers, self.segment_threshold, rate)
+            if plan:
+                SegmentedDownload(self.http, url, part_path, headers=headers, connections=self.segment_connections,
+                                  rate=rate, controller=controller, on_progress=on_progress,
+                                  slots=self.segment_slots, **plan).run()
+                os.replace(part_path, file_path)
+                return True
+        
+        part = ResumableFile(url, part_path)
+        
+        def receive(response):
+            if response.status_code == 416 and part.offset:
+                part.discard()  # 续传起点超出文件长度：从头下载
+                return HttpSessionPool.RETRY
+            response.raise_for_status()
+            # 流式写入.part文件，中断后从断点续传
+            part.begin(response.status_code, response.headers)
+            for chunk in response.iter_content(chunk_size=part.CHUNK_SIZE):
+                part.write(chunk)
+            part.check_complete()
+        
+        # 启用自适应并发时，整个传输期间占用一个并发名额；
+        # 传输中断或服务器暂时不可用时保留.part文件，按重试策略退避后从断点继续
+        self.http.transfer(url, receive, headers=lambda: dict(headers, **part.request_headers()), rate=rate,
+                           controller=controller, on_error=part.suspend, timeout=60, stream=True)
+        
+        if not part.finish():
+            return False
+        os.replace(part_path, file_path)
+        return True
+    
+    def download_image(self, url, folder_name, save_path, headers=None, rate=None, controller=None, index=None):
+        """
+        下载单张图片
+        
+        参数:
+            url: 图片URL
+            folder_name: 文件夹名称（用于日志）
+            save_path: 保存路径
+            headers: HTTP请求头（可选）
+            rate: 没有配置限速时使用的后备 (速率, 突发数)
+            controller: 可选的自适应并发控制器，请求结果会反馈给它
+            index: 可选的持久化哈希索引，跨运行识别已保存的图片
+        返回:
+            下载成功返回True，否则返回False
+        """
+        try:
+            # 设置请求头
+            if headers is None:
+                headers = {
+                    "User-Agent": self.get_random_user_agent(),
+                    "Referer": url
+                }
+            else:
+                headers["Referer"] = url
+            
+            # 已知链接：直接跳过，或附加条件请求头
+            skip, conditional = self.check_known_url(url, index)
+            if skip:
+                return False
+            if conditional:
+                headers = dict(headers, **conditional)
+            
+            writer = JpegStreamWriter(url, save_path, self.hash_algorithm)
+            plan = None  # 分段下载计划（超大图片）
+            
+            def receive(response):
+                """
+                处理一次响应，返回响应头；不需要保存时返回None
+                """
+                nonlocal plan
+                if response.status_code == 304:
+                    return None  # 服务器确认内容未变化
+                if response.status_code == 416 and writer.offset:
+                    writer.discard()  # 续传起点超出文件长度：从头下载
+                    return HttpSessionPool.RETRY
+                response.raise_for_status()
+                # 超大图片：关闭这个连接，改为多连接分段下载
+                if self.segment_connections > 1 and writer.offset == 0:
+                    plan = SegmentedDownload.plan(response.status_code, response.headers, self.segment_threshold)
+                    if plan and writer.accept_headers(response.headers):
+                        return response.headers
+                # 状态码、响应头或首字节不符合要求时直接关闭连接，不再下载剩余内容
+                if not writer.begin(response.status_code, response.headers):
+                    writer.discard()
+                    return None
+                for chunk in response.iter_content(chunk_size=writer.CHUNK_SIZE):
+                    if not writer.write(chunk):
+                        writer.discard()
+                        return None
+                writer.check_complete()
+                return response.headers
+            
+            # 同一URL同时只允许一个线程写它的.part文件
+            if not self.active_parts.add_if_absent(writer.part_path):
+                return False
+            try:
+                # 有.part文件时从断点续传；传输中断或服务器暂时不可用时保留.part文件，退避后从断点继续
+                response_headers = self.http.transfer(url, receive, headers=lambda: dict(headers, **writer.request_headers()),
+                                                      rate=rate, controller=controller, on_error=writer.suspend,
+                                                      timeout=30, stream=True)
+                if response_headers is None:
+                    return False
+                if plan:
+                    SegmentedDownload(self.http, url, writer.part_path, headers=headers, connections=self.segment_connections,
+                                      rate=rate, controller=controller, slots=self.segment_slots, **plan).run()
+                    writer.adopt()
+                temp_path = writer.finish()
+            except Exception as e:
+                # 可重试的错误保留.part文件，下次运行时续传
+                if not self.http.retry.is_retryable(e):
+                    writer.discard()
+                raise
+            finally:
+                self.active_parts.discard(writer.part_path)
+            
+            return self.store_image_file(url, temp_path, writer.content_hash(), save_path, index, response_headers)
+            
+        except Exception as e:
+            return False
+    
+    async def download_image_async(self, session, url, save_path, headers, rate=None, controller=None, index=None):
+        """
+        asyncio引擎下载单张图片，筛选/去重/保存逻辑与download_image一致
+        
+        参数:
+            session: AsyncBatch（请求经过批次的并发闸门）
+            url: 图片URL
+            save_path: 保存路径
+            headers: HTTP请求头
+            rate: 没有配置限速时使用的后备 (速率, 突发数)
+            controller: 可选的自适应并发控制器，请求结果会反馈给它
+            index: 可选的持久化哈希索引，跨运行识别已保存的图片
+        返回:
+            下载成功返回True，否则返回False
+        """
+        # 查索引、读写.part文件、改名和去重都放到线程池，避免阻塞事件循环
+        io = partial(asyncio.get_running_loop().run_in_executor, None)
+        headers = dict(headers)
+        headers["Referer"] = url
+        skip, conditional = await io(self.check_known_url, url, index)
+        if skip:
+            return False
+        if conditional:
+            headers.update(conditional)
+        writer = await io(JpegStreamWriter, url, save_path, self.hash_algorithm)
+        if not self.active_parts.add_if_absent(writer.part_path):
+            return False
+        
+        async def receive(response):
+            """
+            处理一次响应，返回响应头；不需要保存时返回None
+            """
+            if response.status == 304:
+                return None  # 服务器确认内容未变化
+            if response.status == 416 and writer.offset:
+                await io(writer.discard)  # 续传起点超出文件长度：从头下载
+                return HttpSessionPool.RETRY
+            response.raise_for_status()
+            if not await io(writer.begin, response.status, response.headers):
+                await io(writer.discard)
+                return None
+            async for chunk in response.content.iter_chunked(writer.CHUNK_SIZE):
+                if not await io(writer.write, chunk):
+                    await io(writer.discard)
+                    return None
+            await io(writer.check_complete)
+            return response.headers
+        
+        try:
+            response_headers = await self.http.transfer_async(
+                session, url, receive, headers=lambda: dict(headers, **writer.request_headers()), rate=rate,
+                controller=controller, on_error=partial(io, writer.suspend), timeout=aiohttp.ClientTimeout(total=30))
+            if response_headers is None:
+                return False
+            temp_path = await io(writer.finish)
+            return await io(self.store_image_file, url, temp_path, writer.content_hash(), save_path, index, response_headers)
+        except Exception as e:
+            # 可重试的错误保留.part文件，下次运行时续传
+            if not self.http.retry.is_retryable(e):
+                await io(writer.discard)
+            return False
+        finally:
+            self.active_parts.discard(writer.part_path)
+    
+    def check_known_url(self, url, index):
+        """
+        按“已知链接”设置检查URL索引
+        
+        参数:
+            url: 图片URL
+            index: 持久化哈希索引（None表示不使用索引）
+        返回:
+            (是否直接跳过, 条件请求头字典或None) 元组
+        """
+        if index is None or self.url_skip_mode == "off":
+            return False, None
+        known = index.lookup_url(url)
+        if known is None:
+            return False, None
+        if self.url_skip_mode == "skip":
+            return True, None
+        conditional = {}
+        if known["etag"]:
+            conditional["If-None-Match"] = known["etag"]
+        if known["last_modified"]:
+            conditional["If-Modified-Since"] = known["last_modified"]
+        return False, conditional or None
+    
+    def store_image_file(self, url, temp_path, image_hash, save_path, index=None, response_headers=None):
         """
-        下载单张图片
+        对流式写入的临时文件去重：新哈希改名为最终文件名，重复则删除
         
         参数:
-            url: 图片URL
-            folder_name: 文件夹名称（用于日志）
+            url: 图片URL（用于生成文件名）
+            temp_path: JpegStreamWriter写入的临时文件路径，None表示内容为空
+            image_hash: 下载过程中增量计算的哈希（"算法:摘要"）
             save_path: 保存路径
-            headers: HTTP请求头（可选）
+            index: 可选的持久化哈希索引；以前的运行已保存过（且文件仍在）的图片视为重复
+            response_headers: 响应头，用于在URL索引中记录ETag/Last-Modified
         返回:
-            下载成功返回True，否则返回False
+            保存成功返回True，重复或内容为空返回False
         """
-        try:
-            # 设置请求头
-            if headers is None:
-                headers = {
-                    "User-Agent": self.get_random_user_agent(),
-                    "Referer": url
-                }
-            else:
-                headers["Referer"] = url
-            
-            # 发送请求
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            # 检查内容是否为空
-            if not response.content:
-                return False
-            
-            # 检查内容类型（仅下载JPG/JPEG图片）
-            if not url.lower().endswith('.jpg') and not url.lower().endswith('.jpeg'):
-                if 'image/jpeg' not in response.headers.get('content-type', ''):
-                    return False
-            
-            # 计算MD5哈希用于去重
-            image_hash = self.get_image_hash(response.content)
-            if image_hash in self.downloaded_images:
-                return False
-            
-            self.downloaded_images.add(image_hash)
-            
-            # 生成文件名
-            filename = os.path.basename(url.split('?')[0]) or f"image_{len(self.downloaded_images)}.jpg"
-            if not filename.lower().endswith(('.jpg', '.jpeg')):
-                filename += ".jpg"
-            
-            file_path = os.path.join(save_path, filename)
-            
-            # 保存文件
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            
-            return True
-            
-        except Exception as e:
+        # 检查内容是否为空
+        if not temp_path:
+            return False
+        
+        size = os.path.getsize(temp_path)
+        
+        # 记录URL -> 内容哈希，重复内容的URL下次同样可以跳过
+        if index is not None and response_headers is not None:
+            index.record_url(url, response_headers.get('etag'), response_headers.get('last-modified'), size, image_hash)
+        
+        # 按下载时计算的哈希去重（检查和登记是同一个原子操作）
+        if not self.downloaded_images.add_if_absent(image_hash):
+            os.remove(temp_path)
+            return False
+        
+        # 查询持久化索引，之前的运行已保存过的图片不再重复保存
+        if index is not None and index.lookup(image_hash):
+            os.remove(temp_path)
             return False
+        
+        # 生成文件名
+        filename = os.path.basename(url.split('?')[0]) or f"image_{len(self.downloaded_images)}.jpg"
+        if not filename.lower().endswith(('.jpg', '.jpeg')):
+            filename += ".jpg"
+        
+        file_path = os.path.join(save_path, filename)
+        
+        # 临时文件改名为最终文件；失败时撤销登记，让其他URL上的相同图片还能保存
+        try:
+            os.replace(temp_path, file_path)
+        except OSError:
+            self.downloaded_images.discard(image_hash)
+            raise
+        
+        if index is not None:
+            index.record(image_hash, size, url, file_path)
+            # 近似重复检测在进程池中异步进行，不阻塞下载线程
+            if self.perceptual_mode != "off":
+                self.get_perceptual_deduper(index).submit(file_path, image_hash)
+        
+        return True
+    
+    def open_hash_index(self, save_path):
+        """
+        获取下载根目录对应的持久化哈希索引（同一目录只打开一次）
+        
+        参数:
+            save_path: 下载根目录
+        返回:
+            HashIndex对象
+        """
+        root = os.path.abspath(save_path)
+        with self._hash_index_lock:
+            index = self.hash_indexes.get(root)
+            if index is None:
+                index = HashIndex(root)
+                self.hash_indexes[root] = index
+            return index
     
-    def get_image_hash(self, image_data):
+    def get_perceptual_deduper(self, index):
         """
-        计算图片数据的MD5哈希值
-        用于图片去重
+        获取下载根目录对应的近似重复检测器，并同步当前的阈值和处理方式
         
         参数:
-            image_data: 图片二进制数据
+            index: 下载根目录的HashIndex
         返回:
-            MD5哈希字符串
+            PerceptualDeduper对象
         """
-        return hashlib.md5(image_data).hexdigest()
+        with self._hash_index_lock:
+            deduper = self.perceptual.get(index.root)
+            if deduper is None:
+                deduper = PerceptualDeduper(index)
+                self.perceptual[index.root] = deduper
+        deduper.threshold = self.perceptual_threshold
+        deduper.action = self.perceptual_mode
+        return deduper
+    
+    def finish_perceptual(self, index):
+        """
+        等待近似重复检测完成（在下载线程结束时调用）
+        
+        参数:
+            index: 下载根目录的HashIndex（可为None）
+        返回:
+            结果日志文本；未启用检测时返回None
+        """
+        if index is None or self.perceptual_mode == "off":
+            return None
+        deduper = self.get_perceptual_deduper(index)
+        deduper.wait()
+        return deduper.summary()
     
     def start_download(self):
         """
@@ -1104,16 +4894,33 @@ class PicGetApp:
             messagebox.showerror("错误", "线程数量必须在1-100之间")
             return
         
+        try:
+            engine = self.get_engine_settings()
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        
+        if not self.apply_rate_settings():
+            return
+        
+        if not self.apply_index_settings():
+            return
+        
+        if not self.apply_segment_settings():
+            return
+        
         # 禁用开始按钮并清空已下载集合
         self.start_button.config(state=tk.DISABLED)
         self.downloaded_images.clear()
+        self.http.resize(thread_count)  # 连接池大小与线程数量一致
         
         # 启动下载线程
-        thread = threading.Thread(target=self.download_thread, args=(url, save_path, delay, thread_count))
+        controller = self.create_controller(thread_count, engine)
+        thread = threading.Thread(target=self.download_thread, args=(url, save_path, delay, thread_count, engine, controller))
         thread.daemon = True
         thread.start()
     
-    def download_thread(self, url, save_path, delay, thread_count):
+    def download_thread(self, url, save_path, delay, thread_count, engine=None, controller=None):
         """
         单页下载的后台线程
         
@@ -1122,6 +4929,8 @@ class PicGetApp:
             save_path: 保存路径
             delay: 请求延时
             thread_count: 下载线程数
+            engine: asyncio引擎设置，None表示使用线程池
+            controller: 自适应并发控制器，None表示固定并发
         """
         try:
             self.log_message(f"开始处理网站: {url}")
@@ -1129,8 +4938,7 @@ class PicGetApp:
             
             # 获取页面内容
             headers = {"User-Agent": self.get_random_user_agent()}
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
+            response = self.http.fetch(url, headers=headers, timeout=30)
             
             self.log_message("正在解析页面内容...")
             
@@ -1143,6 +4951,7 @@ class PicGetApp:
             os.makedirs(page_save_path, exist_ok=True)
             
             self.log_message(f"保存文件夹: {folder_name}")
+            index = self.open_hash_index(save_path)  # 跨运行的去重索引
             
             # 筛选JPG图片
             image_urls = [img for img in img_urls if str(img).lower().endswith(('.jpg', '.jpeg')) or 'image' in str(img).lower()]
@@ -1152,7 +4961,16 @@ class PicGetApp:
             # 设置进度条
             total_count = len(image_urls)
             self.progress_bar['maximum'] = total_count
-            downloaded_count = 0
+            downloaded_count = AtomicCounter()
+            rate = self.delay_to_rate(delay, thread_count)
+            
+            def on_downloaded():
+                """
+                一张图片下载成功后更新计数和进度
+                """
+                n = downloaded_count.increment()
+                self.ui.progress(self.progress_bar, n)
+                self.log_message(f"已下载 {n}/{total_count}")
             
             def download_one(img_url):
                 """
@@ -1161,26 +4979,41 @@ class PicGetApp:
                 参数:
                     img_url: 图片URL
                 """
-                nonlocal downloaded_count
                 # 将相对URL转换为绝对URL
                 full_url = img_url if str(img_url).startswith('http') else urljoin(url, str(img_url))
-                if self.download_image(full_url, folder_name, page_save_path):
-                    downloaded_count += 1
-                    self.root.after(0, lambda: self.progress_bar.configure(value=downloaded_count))
-                    self.root.after(0, lambda: self.log_message(f"已下载 {downloaded_count}/{total_count}"))
-                time.sleep(delay)
+                if self.download_image(full_url, folder_name, page_save_path, rate=rate, controller=controller, index=index):
+                    on_downloaded()
             
-            # 使用线程池并发下载
-            with ThreadPoolExecutor(max_workers=min(thread_count, total_count)) as executor:
-                list(executor.map(download_one, image_urls))
+            if engine:
+                # asyncio引擎：所有图片请求在同一个事件循环上并发
+                full_urls = [img if str(img).startswith('http') else urljoin(url, str(img)) for img in image_urls]
+                img_headers = {"User-Agent": self.get_random_user_agent()}
+                def on_result(img_url, ok):
+                    if ok:
+                        on_downloaded()
+                
+                self.async_engine.run(
+                    full_urls,
+                    lambda session, img_url: self.download_image_async(session, img_url, page_save_path, img_headers, rate, controller, index),
+                    on_result=on_result,
+                    controller=controller,
+                    **engine)
+            else:
+                # 使用线程池并发下载
+                with ThreadPoolExecutor(max_workers=min(thread_count, total_count)) as executor:
+                    list(executor.map(download_one, image_urls))
             
             # 显示完成信息
-            if downloaded_count > 0:
+            if downloaded_count.value > 0:
                 self.log_message(f"\n下载完成!")
-                self.log_message(f"总共下载: {downloaded_count} 张图片")
+                self.log_message(f"总共下载: {downloaded_count.value} 张图片")
             else:
                 self.log_message(f"\n下载完成!")
                 self.log_message(f"未找到任何图片")
+            summary = self.finish_perceptual(index)
+            if summary:
+                self.log_message(summary)
+            self.log_message(self.http.stats_message())
             
         except Exception as e:
             self.log_message(f"错误: {str(e)}")
@@ -1200,6 +5033,9 @@ class PicGetApp:
             messagebox.showerror("错误", "请输入起始网址")
             return
         
+        if not self.apply_rate_settings():
+            return
+        
         # 清空列表并显示分析中
         self.url_listbox.delete(0, tk.END)
         self.url_listbox.insert(tk.END, "正在分析...")
@@ -1224,8 +5060,7 @@ class PicGetApp:
         
         try:
             # 获取页面内容
-            response = requests.get(base_url, headers=headers, timeout=15)
-            response.raise_for_status()
+            response = self.http.fetch(base_url, headers=headers, timeout=15)
             
             # 尝试提取图片和标题
             img_urls, title = self.extract_images_from_encoded_html(response.text)
@@ -1325,9 +5160,8 @@ class PicGetApp:
             """
             self.url_listbox.delete(0, tk.END)
             if results:
-                for url, name in results:
-                    self.url_listbox.insert(tk.END, f"{name} | {url}")
-                self.url_listbox.insert(tk.END, f"--- 共找到 {len(results)} 页 ---")
+                self.url_listbox.insert(tk.END, *(f"{name} | {url}" for url, name in results),
+                                        f"--- 共找到 {len(results)} 页 ---")
             else:
                 self.url_listbox.insert(tk.END, f"分析失败: {error_msg}")
         
@@ -1343,6 +5177,9 @@ class PicGetApp:
             messagebox.showerror("错误", "请选择要分析的页面")
             return
         
+        if not self.apply_rate_settings():
+            return
+        
         # 重置停止标志并启动分析线程
         self.stop_analysis = False
         thread = threading.Thread(target=self.analyze_images_thread, args=(selected_indices,))
@@ -1363,88 +5200,145 @@ class PicGetApp:
         except:
             base_delay = 2
         
-        found_count = 0
-        
-        # 遍历选中的页面
+        # 收集选中页面的URL
+        urls = []
         for idx in selected_indices:
-            # 检查是否被要求停止
-            if self.stop_analysis:
-                self.root.after(0, lambda: self.batch_log_message("\n=== 已停止分析 ==="))
-                return
-            
             item = self.url_listbox.get(idx)
             if item.startswith("---") or item.startswith("正在分析"):
                 continue
             # 从"名称 | URL"格式中提取URL
             if " | " in item:
-                url = item.split(" | ", 1)[1]
+                urls.append(item.split(" | ", 1)[1])
             else:
-                url = item
+                urls.append(item)
+        
+        found_count = 0
+        
+        # 并发分析选中的页面，结果按页面顺序返回
+        for url, page_urls, error in self.analyze_listings(urls, base_delay):
+            if error is not None:
+                self.batch_log_message(f"分析失败 {url}: {str(error)}")
+                continue
             
-            try:
-                # 获取页面内容
-                headers = self.get_headers()
-                response = requests.get(url, headers=headers, timeout=15)
-                response.raise_for_status()
-                
-                # 尝试解码内容
-                match = re.search(r'var _h="([^"]+)"', response.text)
-                page_urls = []  # 存储详情页URL
-                
-                if match:
-                    encoded = match.group(1)
-                    decoded = unquote(unquote(encoded))
-                    
-                    # 查找详情页链接（如 /art/toupaizipai/764307/）
-                    # 模式：/art/分类名/数字/
-                    category = re.search(r'/art/([^/]+)/', url)
-                    if category:
-                        category_name = category.group(1)
-                        # 查找该分类下的详情页链接
-                        links = re.findall(r'<a[^>]+href="(/art/' + category_name + r'/\d+/)"', decoded)
-                        
-                        for link in links:
-                            full_url = 'https://www.v6491h.com' + link
-                            page_urls.append(full_url)
-                    
-                    # 如果上面的模式没匹配，尝试通用模式
-                    if not page_urls:
-                        # 查找所有 /art/数字/ 模式的链接
-                        links = re.findall(r'<a[^>]+href="(/art/\d{6,}/)"', decoded)
-                        for link in links:
-                            full_url = 'https://www.v6491h.com' + link
-                            if full_url not in page_urls:
-                                page_urls.append(full_url)
-                
-                # 没有 var_h，从原始HTML查找详情页链接
-                if not page_urls:
-                    # 查找 /art/分类名/数字/ 模式
-                    category = re.search(r'/art/([^/]+)/', url)
-                    if category:
-                        category_name = category.group(1)
-                        links = re.findall(r'href="(/art/' + category_name + r'/\d+/)"', response.text)
-                        for link in links:
-                            full_url = 'https://www.v6491h.com' + link
-                            page_urls.append(full_url)
-                
-                # 去重
-                page_urls = list(set(page_urls))
-                
-                # 添加到列表
-                for page_url in page_urls[:100]:  # 限制数量
-                    self.root.after(0, lambda u=page_url: self.img_listbox.insert(tk.END, u))
-                
-                found_count = len(page_urls)
-                self.root.after(0, lambda c=found_count, u=url: self.batch_log_message(f"提取 {c} 个详情页: {u}"))
-                
-                # 随机延时
-                self.random_delay(base_delay)
-                        
-            except Exception as e:
-                self.root.after(0, lambda msg=f"分析失败 {url}: {str(e)}": self.batch_log_message(msg))
+            # 添加到链接存储（去重），新链接同时显示在列表中
+            added = self.add_detail_links(page_urls, url)
+            
+            found_count += len(added)
+            self.batch_log_message(f"提取 {len(page_urls)} 个详情页（新增 {len(added)}）: {url}")
+        
+        # 检查是否被要求停止
+        if self.stop_analysis:
+            self.batch_log_message("\n=== 已停止分析 ===")
+            return
         
         # 显示完成信息
-        self.root.after(0, lambda c=found_count: self.batch_log_message(f"\n=== 共提取 {c} 个页面 ==="))
+        self.batch_log_message(f"\n=== 共提取 {found_count} 个新页面，列表共 {len(self.detail_links)} 个 ===")
+    
+    LISTING_WORKERS = 4  # 同时分析的列表页数量
+    
+    def analyze_listings(self, urls, delay):
+        """
+        并发分析列表页，按urls的顺序逐个产出结果
+        最多LISTING_WORKERS个页面同时请求，按 线程数/延时 的后备速率经过每主机限速器；
+        设置stop_analysis后立即结束，尚未开始的请求被取消
+        
+        参数:
+            urls: 列表页URL列表
+            delay: 请求延时
+        返回:
+            生成器，产出 (列表页URL, 详情页URL列表, 异常) 元组；成功时异常为None
+        """
+        rate = self.delay_to_rate(delay, self.LISTING_WORKERS)
+        executor = ThreadPoolExecutor(max_workers=self.LISTING_WORKERS)
+        pending = deque()  # 按顺序排列的 (URL, Future)
+        urls = iter(urls)
+        
+        def fill():
+            # 提交的页面数保持在线程数的两倍以内，限速等待不会提前占满整个列表
+            while len(pending) < self.LISTING_WORKERS * 2 and not self.stop_analysis:
+                url = next(urls, None)
+                if url is None:
+                    return
+                pending.append((url, executor.submit(self.extract_detail_pages, url, rate)))
+        
+        try:
+            fill()
+            while pending:
+                if self.stop_analysis:
+                    return
+                url, future = pending[0]
+                try:
+                    page_urls = future.result(timeout=0.2)
+                    error = None
+                except FutureTimeoutError:
+                    continue  # 定期检查停止标志
+                except Exception as e:
+                    page_urls, error = [], e
+                pending.popleft()
+                fill()
+                yield url, page_urls, error
+        finally:
+            # 不等待进行中的请求，取消尚未开始的请求
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def extract_detail_pages(self, url, rate=None):
+        """
+        抓取一个列表页，提取其中的详情页链接
+        
+        参数:
+            url: 列表页URL
+            rate: 没有配置限速时使用的后备 (速率, 突发数)
+        返回:
+            去重后的详情页URL列表
+        """
+        # 获取页面内容
+        headers = self.get_headers()
+        response = self.http.fetch(url, rate=rate, headers=headers, timeout=15)
+        
+        # 尝试解码内容
+        match = re.search(r'var _h="([^"]+)"', response.text)
+        page_urls = []  # 存储详情页URL
+        
+        if match:
+            encoded = match.group(1)
+            decoded = unquote(unquote(encoded))
+            
+            # 查找详情页链接（如 /art/toupaizipai/764307/）
+            # 模式：/art/分类名/数字/
+            category = re.search(r'/art/([^/]+)/', url)
+            if category:
+                category_name = category.group(1)
+                # 查找该分类下的详情页链接
+                links = re.findall(r'<a[^>]+href="(/art/' + category_name + r'/\d+/)"', decoded)
+                
+                for link in links:
+                    full_url = 'https://www.v6491h.com' + link
+                    page_urls.append(full_url)
+            
+            # 如果上面的模式没匹配，尝试通用模式
+            if not page_urls:
+                # 查找所有 /art/数字/ 模式的链接
+                links = re.findall(r'<a[^>]+href="(/art/\d{6,}/)"', decoded)
+                for link in links:
+                    full_url = 'https://www.v6491h.com' + link
+                    if full_url not in page_urls:
+                        page_urls.append(full_url)
+        
+        # 没有 var_h，从原始HTML查找详情页链接
+        if not page_urls:
+            # 查找 /art/分类名/数字/ 模式
+            category = re.search(r'/art/([^/]+)/', url)
+            if category:
+                category_name = category.group(1)
+                links = re.findall(r'href="(/art/' + category_name + r'/\d+/)"', response.text)
+                for link in links:
+                    full_url = 'https://www.v6491h.com' + link
+                    page_urls.append(full_url)
+        
+        # 去重，保持链接在页面中的顺序
+        page_urls = list(dict.fromkeys(page_urls))
+        
+        return page_urls
     
     def download_selected_images(self):
         """
@@ -1462,32 +5356,200 @@ class PicGetApp:
             return
         
         # 验证输入
+        settings = self.read_batch_settings()
+        if settings is None:
+            return
+        delay, thread_count = settings
+        
+        # 从链接存储中取出选中的详情页URL（列表只是存储的视图）
+        img_urls = [self.detail_links[idx] for idx in selected_indices if idx < len(self.detail_links)]
+        
+        if not img_urls:
+            messagebox.showerror("错误", "没有有效的网址")
+            return
+        
+        try:
+            engine = self.get_engine_settings()
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        
+        if not self.apply_rate_settings():
+            return
+        
+        if not self.apply_index_settings():
+            return
+        
+        if not self.apply_segment_settings():
+            return
+        self.http.resize(thread_count)
+        
+        # 启动下载线程
+        controller = self.create_controller(thread_count, engine)
+        thread = threading.Thread(target=self.download_images_thread, args=(img_urls, save_path, delay, thread_count, engine, controller))
+        thread.daemon = True
+        thread.start()
+    
+    def read_batch_settings(self):
+        """
+        读取批量下载页的请求延时和线程数量（需在UI线程中调用），设置无效时弹出错误提示
+        
+        返回:
+            (请求延时, 线程数量) 元组；设置无效时返回None
+        """
         try:
             delay = float(self.batch_delay_entry.get())
             thread_count = int(self.batch_thread_entry.get())
         except ValueError:
             messagebox.showerror("错误", "请求延时必须是数字，线程数量必须是整数")
+            return None
+        
+        if thread_count < 1 or thread_count > 100:
+            messagebox.showerror("错误", "线程数量必须在1-100之间")
+            return None
+        return delay, thread_count
+    
+    def start_pipeline_download(self):
+        """
+        流水线下载：分析选中的列表页，边提取详情页边下载图片
+        验证输入后启动流水线线程
+        """
+        selected_indices = self.url_listbox.curselection()
+        if not selected_indices:
+            messagebox.showerror("错误", "请选择要分析的页面")
             return
         
-        # 收集选中的图片URL
-        img_urls = []
+        save_path = self.batch_save_path_entry.get().strip()
+        if not save_path:
+            messagebox.showerror("错误", "请选择保存路径")
+            return
+        
+        settings = self.read_batch_settings()
+        if settings is None:
+            return
+        delay, thread_count = settings
         
+        # 收集选中的列表页URL
+        listing_urls = []
         for idx in selected_indices:
-            item = self.img_listbox.get(idx)
+            item = self.url_listbox.get(idx)
             if item.startswith("---") or item.startswith("正在分析"):
                 continue
-            img_urls.append(item)
+            # 从"名称 | URL"格式中提取URL
+            listing_urls.append(item.split(" | ", 1)[1] if " | " in item else item)
         
-        if not img_urls:
+        if not listing_urls:
             messagebox.showerror("错误", "没有有效的网址")
             return
         
-        # 启动下载线程
-        thread = threading.Thread(target=self.download_images_thread, args=(img_urls, save_path, delay, thread_count))
+        try:
+            engine = self.get_engine_settings()
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        
+        if not self.apply_rate_settings():
+            return
+        
+        if not self.apply_index_settings():
+            return
+        
+        if not self.apply_segment_settings():
+            return
+        self.http.resize(thread_count)
+        
+        # 重置停止标志并启动流水线线程
+        self.stop_analysis = False
+        controller = self.create_controller(thread_count, engine)
+        thread = threading.Thread(target=self.pipeline_download_thread, args=(listing_urls, save_path, delay, thread_count, engine, controller))
         thread.daemon = True
         thread.start()
     
-    def download_images_thread(self, img_urls, save_path, delay, thread_count):
+    PIPELINE_QUEUE_SIZE = 200  # 列表页分析与详情页抓取之间的队列容量
+    
+    def pipeline_download_thread(self, listing_urls, save_path, delay, thread_count, engine=None, controller=None):
+        """
+        流水线下载的后台线程
+        列表页分析 → 详情页抓取 → 图片下载 三个阶段同时进行，阶段之间用有界队列连接，
+        前一个阶段产出的第一个结果就可以开始下一个阶段，总耗时接近最慢的阶段而不是各阶段之和
+        
+        参数:
+            listing_urls: 列表页URL列表
+            save_path: 保存路径
+            delay: 请求延时
+            thread_count: 下载线程数
+            engine: asyncio引擎设置，None表示使用线程池
+            controller: 自适应并发控制器，None表示固定并发
+        """
+        downloaded_count = AtomicCounter()
+        self.batch_log_message(f"开始流水线下载: {len(listing_urls)} 个列表页...")
+        
+        try:
+            index = self.open_hash_index(save_path)  # 跨运行的去重索引
+        except Exception as e:
+            self.batch_log_message(f"✗ 无法打开去重索引: {str(e)}")
+            index = None
+        
+        detail_queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        found_count = AtomicCounter()
+        
+        def crawl_listings():
+            """
+            第一阶段：并发分析列表页，按顺序把新发现的详情页放入队列（队列满时等待下游）
+            """
+            seen = set()
+            try:
+                for url, extracted, error in self.analyze_listings(listing_urls, delay):
+                    if error is not None:
+                        self.batch_log_message(f"分析失败 {url}: {str(error)}")
+                        continue
+                    page_urls = []
+                    for page_url in extracted:
+                        if page_url not in seen:
+                            seen.add(page_url)
+                            page_urls.append(page_url)
+                    found_count.increment(len(page_urls))
+                    self.batch_log_message(f"提取 {len(page_urls)} 个详情页: {url}")
+                    self.add_detail_links(page_urls, url)
+                    for page_url in page_urls:
+                        detail_queue.put(page_url)
+                if self.stop_analysis:
+                    self.batch_log_message("\n=== 已停止分析 ===")
+            finally:
+                detail_queue.put(None)  # 结束标记
+        
+        def detail_pages():
+            """
+            第二阶段的输入：从队列中逐个取出详情页；停止后不再领取新页面
+            """
+            while True:
+                page_url = detail_queue.get()
+                if page_url is None or self.stop_analysis:
+                    return
+                yield page_url
+        
+        crawler = threading.Thread(target=crawl_listings, daemon=True)
+        crawler.start()
+        try:
+            self.download_detail_pages(detail_pages(), save_path, delay, thread_count, engine, controller, index, downloaded_count)
+        finally:
+            # 停止时排空队列，让分析线程可以结束
+            while crawler.is_alive():
+                try:
+                    detail_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        
+        # 显示总下载完成信息
+        self.batch_log_message(f"\n=== 流水线完成: {found_count.value} 个详情页, 共 {downloaded_count.value} 张图片 ===")
+        summary = self.finish_perceptual(index)
+        if summary:
+            self.batch_log_message(summary)
+        self.batch_log_message(self.http.stats_message())
+    
+    PAGE_PREFETCH = 4  # 批量下载时同时抓取的详情页数量
+    
+    def download_images_thread(self, img_urls, save_path, delay, thread_count, engine=None, controller=None):
         """
         批量图片下载的后台线程
         
@@ -1496,27 +5558,69 @@ class PicGetApp:
             save_path: 保存路径
             delay: 请求延时
             thread_count: 下载线程数
+            engine: asyncio引擎设置，None表示使用线程池
+            controller: 自适应并发控制器，None表示固定并发
         """
         total = len(img_urls)
-        downloaded_count = 0
+        downloaded_count = AtomicCounter()
+        
+        self.batch_log_message(f"开始下载 {total} 个网址的图片...")
+        
+        try:
+            index = self.open_hash_index(save_path)  # 跨运行的去重索引
+        except Exception as e:
+            self.batch_log_message(f"✗ 无法打开去重索引: {str(e)}")
+            index = None
+        
+        self.download_detail_pages(img_urls, save_path, delay, thread_count, engine, controller, index, downloaded_count)
         
-        self.root.after(0, lambda: self.batch_log_message(f"开始下载 {total} 个网址的图片..."))
+        # 显示总下载完成信息
+        self.batch_log_message(f"\n=== 下载完成: 共 {downloaded_count.value} 张图片 ===")
+        summary = self.finish_perceptual(index)
+        if summary:
+            self.batch_log_message(summary)
+        self.batch_log_message(self.http.stats_message())
+    
+    def download_detail_pages(self, pages, save_path, delay, thread_count, engine, controller, index, downloaded_count):
+        """
+        抓取详情页并下载其中的图片，阻塞直到全部完成
         
+        参数:
+            pages: 详情页URL的可迭代对象；可以是逐个产生URL的生成器（流水线的上游阶段）
+            save_path: 保存路径
+            delay: 请求延时（详情页按 1/延时 的速率抓取）
+            thread_count: 下载线程数
+            engine: asyncio引擎设置，None表示使用线程池
+            controller: 自适应并发控制器，None表示固定并发
+            index: 持久化哈希索引（可为None）
+            downloaded_count: 已下载图片数的AtomicCounter
+        """
         # 缓存方法引用以提高性能
         download_image = self.download_image
         get_headers = self.get_headers
         
-        # 遍历每个图片页面
-        for page_url in img_urls:
+        # 所有页面的图片共用一个下载池（或一个asyncio批次），页面抓取在前面流水线进行；
+        # 已提交但未完成的图片数有上限，页面抓取过快时等待下载跟上
+        if engine:
+            batch = self.async_engine.open_batch(controller=controller, **engine)
+            slots = threading.Semaphore(engine["max_in_flight"] * 2)
+        else:
+            pool = ThreadPoolExecutor(max_workers=thread_count)
+            slots = threading.Semaphore(thread_count * 2)
+        page_rate = self.delay_to_rate(delay, 1)  # 详情页按请求延时限速，代替页面之间的随机延时
+        
+        def process_page(page_url):
+            """
+            抓取并解析一个详情页，把其中的图片提交到共享下载队列
+            """
             try:
                 # 跳过非HTTP链接
                 if not page_url.startswith('http'):
-                    continue
+                    return
                 
                 # 获取页面内容
                 headers = get_headers()
-                response = requests.get(page_url, headers=headers, timeout=30)
-                response.raise_for_status()
+                response = self.http.fetch(page_url, rate=page_rate, headers=headers, timeout=30)
                 
                 # 提取图片URL和标题
                 img_urls_on_page, page_title = self.extract_images_from_encoded_html(response.text)
@@ -1533,43 +5637,81 @@ class PicGetApp:
                 page_save_path = os.path.join(save_path, folder_name)
                 os.makedirs(page_save_path, exist_ok=True)
                 
-                self.root.after(0, lambda n=folder_name: self.batch_log_message(f"正在下载: {n}"))
-                
                 # 筛选JPG图片
                 image_urls = [img for img in img_urls_on_page if str(img).lower().endswith(('.jpg', '.jpeg')) or 'image' in str(img).lower()]
+                if not image_urls:
+                    self.batch_log_message(f"✗ {folder_name}: 未找到图片")
+                    return
+                
+                self.batch_log_message(f"正在下载: {folder_name}")
                 
-                page_downloaded = [0]
+                page_downloaded = AtomicCounter()
+                page_finished = AtomicCounter()
+                img_headers = get_headers(page_url)
+                
+                def on_result(img_url, ok):
+                    """
+                    一张图片处理完毕；本页最后一张完成时显示页面下载结果
+                    """
+                    slots.release()
+                    if ok:
+                        page_downloaded.increment()
+                        downloaded_count.increment()
+                    if page_finished.increment() == len(image_urls):
+                        if page_downloaded.value > 0:
+                            self.batch_log_message(f"✓ {folder_name}: {page_downloaded.value} 张图片")
+                        else:
+                            self.batch_log_message(f"✗ {folder_name}: 未找到图片")
                 
                 def download_one(img_url):
                     """
                     下载单张图片
                     """
-                    full_url = img_url if str(img_url).startswith('http') else urljoin(page_url, str(img_url))
-                    img_headers = get_headers(page_url)
-                    if download_image(full_url, folder_name, page_save_path, img_headers):
-                        page_downloaded[0] += 1
-                        nonlocal downloaded_count
-                        downloaded_count += 1
-                
-                # 使用线程池并发下载
-                if image_urls:
-                    with ThreadPoolExecutor(max_workers=min(thread_count, len(image_urls))) as executor:
-                        list(executor.map(download_one, image_urls))
-                
-                # 显示页面下载结果
-                if page_downloaded[0] > 0:
-                    self.root.after(0, lambda n=folder_name, c=page_downloaded[0]: self.batch_log_message(f"✓ {n}: {c} 张图片"))
-                else:
-                    self.root.after(0, lambda n=folder_name: self.batch_log_message(f"✗ {n}: 未找到图片"))
+                    ok = False
+                    try:
+                        ok = download_image(img_url, folder_name, page_save_path, dict(img_headers), controller=controller, index=index)
+                    finally:
+                        on_result(img_url, ok)
                 
-                # 随机延时
-                self.random_delay(delay)
+                for img in image_urls:
+                    full_url = img if str(img).startswith('http') else urljoin(page_url, str(img))
+                    slots.acquire()
+                    if engine:
+                        # asyncio引擎：所有页面的图片在同一个事件循环上并发
+                        batch.submit(
+                            lambda session, u, p=page_save_path: self.download_image_async(session, u, p, img_headers, controller=controller, index=index),
+                            full_url, on_result)
+                    else:
+                        pool.submit(download_one, full_url)
                 
             except Exception as e:
-                self.root.after(0, lambda msg=f"✗ 下载失败: {str(e)}": self.batch_log_message(msg))
+                self.batch_log_message(f"✗ 下载失败: {str(e)}")
         
-        # 显示总下载完成信息
-        self.root.after(0, lambda c=downloaded_count: self.batch_log_message(f"\n=== 下载完成: 共 {c} 张图片 ==="))
+        pages = iter(pages)
+        pages_lock = threading.Lock()
+        
+        def page_worker():
+            """
+            不断领取下一个详情页，直到没有更多页面
+            """
+            while True:
+                with pages_lock:
+                    page_url = next(pages, None)
+                if page_url is None:
+                    return
+                process_page(page_url)
+        
+        try:
+            # 少量线程提前抓取详情页，下载线程始终有图片可下
+            with ThreadPoolExecutor(max_workers=self.PAGE_PREFETCH) as page_pool:
+                for future in [page_pool.submit(page_worker) for _ in range(self.PAGE_PREFETCH)]:
+                    future.result()
+        finally:
+            # 等待队列中的图片全部下载完成
+            if engine:
+                batch.close()
+            else:
+                pool.shutdown(wait=True)
 
 
 def main():
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+import requests
+
+import picget
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def controller(monkeypatch, limit=50):
+    clock = Clock()
+    monkeypatch.setattr(picget.time, "monotonic", clock)
+    return picget.AdaptiveConcurrency(limit, initial_limit=limit), clock
+
+
+def test_limit_stays_put_under_stable_latency(monkeypatch):
+    control, clock = controller(monkeypatch)
+    rng = random.Random(1)
+    for _ in range(5000):
+        clock.now += 0.01
+        control.record(rng.uniform(0.08, 0.12))
+    assert control.limit == 50
+
+
+def test_fast_outcomes_without_samples_do_not_lower_the_baseline(monkeypatch):
+    control, clock = controller(monkeypatch)
+    for _ in range(30):
+        clock.now += 0.01
+        control.record(None)  # 304、重复图片等不产生延迟采样
+    for _ in range(2000):
+        clock.now += 0.01
+        control.record(0.5)
+    assert control.limit == 50
+
+
+def test_baseline_follows_a_lasting_latency_shift(monkeypatch):
+    control, clock = controller(monkeypatch)
+    for _ in range(200):
+        clock.now += 0.01
+        control.record(0.05)
+    for _ in range(2000):
+        clock.now += 0.05
+        control.record(0.5)
+    assert control.limit > 40  # 旧的低延迟移出窗口后不再持续回退
+
+
+def test_queueing_backs_off_once_per_window(monkeypatch):
+    control, clock = controller(monkeypatch)
+    for _ in range(50):
+        clock.now += 0.01
+        control.record(0.1)
+    for _ in range(20):
+        clock.now += 0.01
+        control.record(1.0)
+    assert control.limit == 45
+
+
+def test_congestion_halves_the_limit(monkeypatch):
+    control, clock = controller(monkeypatch)
+    clock.now += 10
+    control.record(None, "congested")
+    assert control.limit == 25
+
+
+def test_track_measures_time_to_headers_for_2xx_only(monkeypatch):
+    control, clock = controller(monkeypatch, limit=4)
+    recorded = []
+    monkeypatch.setattr(control, "record", lambda latency, outcome="ok": recorded.append((latency, outcome)))
+    with control.track() as sample:
+        clock.now += 0.2
+        sample.responded(200)
+        clock.now += 5  # 响应体传输时间不计入
+    with control.track() as sample:
+        sample.responded(304)
+    try:
+        with control.track():
+            raise requests.exceptions.Timeout()
+    except requests.exceptions.Timeout:
+        pass
+    assert recorded[0][0] == pytest.approx(0.2)
+    assert [outcome for _, outcome in recorded] == ["ok", "ok", "congested"]
+    assert recorded[1][0] is None and recorded[2][0] is None
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import picget
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "src.ts"
+    path.write_bytes(os.urandom(3 * picget.COPY_BUFFER_SIZE + 17))
+    return path
+
+
+def append(tmp_path, source, method=None):
+    out_path = tmp_path / "out.mp4"
+    with open(out_path, "wb") as out:
+        out.write(b"head")
+        result = picget.append_file(out, str(source), method)
+        out.write(b"tail")
+        out.flush()
+        assert out.tell() == os.path.getsize(out_path)
+    assert out_path.read_bytes() == b"head" + source.read_bytes() + b"tail"
+    return result
+
+
+@pytest.mark.parametrize("method", [None] + list(picget.COPY_METHODS))
+def test_methods_copy_everything(tmp_path, source, method):
+    if method and method != "buffered" and not hasattr(os, method):
+        pytest.skip(f"os.{method} not available")
+    copied, _ = append(tmp_path, source, method)
+    assert copied == source.stat().st_size
+
+
+def short_copy(*args):
+    return 0  # 内核提前返回0
+
+
+def test_short_kernel_copy_falls_back_to_buffered(tmp_path, source, monkeypatch):
+    monkeypatch.setattr(os, "copy_file_range", short_copy, raising=False)
+    monkeypatch.setattr(os, "sendfile", short_copy, raising=False)
+    copied, method = append(tmp_path, source)
+    assert (copied, method) == (source.stat().st_size, "buffered")
+
+
+def test_partial_kernel_copy_resumes_from_offset(tmp_path, source, monkeypatch):
+    real = os.copy_file_range if hasattr(os, "copy_file_range") else None
+    if real is None:
+        pytest.skip("os.copy_file_range not available")
+    calls = []
+
+    def first_chunk_only(src, dst, count, offset_src=None):
+        calls.append(offset_src)
+        return real(src, dst, min(count, 1000), offset_src) if len(calls) == 1 else 0
+
+    monkeypatch.setattr(os, "copy_file_range", first_chunk_only)
+    monkeypatch.setattr(os, "sendfile", short_copy, raising=False)
+    copied, method = append(tmp_path, source)
+    assert method == "buffered"
+    assert copied == source.stat().st_size
+
+
+def test_forced_short_copy_raises(tmp_path, source, monkeypatch):
+    monkeypatch.setattr(os, "sendfile", short_copy, raising=False)
+    with open(tmp_path / "out.mp4", "wb") as out:
+        with pytest.raises(picget.IncompleteDownload):
+            picget.append_file(out, str(source), "sendfile")
@@ -0,0 +1,55 @@
+import asyncio
+
+import picget
+from test_download import FakeAioResponse, FakeAioSession
+
+
+async def status(response):
+    return response.status
+
+
+def test_waiting_on_a_slow_host_does_not_hold_the_gate():
+    async def run():
+        batch = picget.AsyncBatch(None, FakeAioSession(FakeAioResponse(200, b"", {})), max_in_flight=1)
+        pool = picget.HttpSessionPool()
+        pool.limiter.configure(0, 1, {"slow": (0.5, 1)})
+        pool.limiter.reserve("http://slow/0")  # 用掉突发令牌，下一个请求要等约2秒
+        slow = asyncio.create_task(pool.transfer_async(batch, "http://slow/1", status))
+        await asyncio.sleep(0.05)
+        try:
+            return await asyncio.wait_for(pool.transfer_async(batch, "http://fast/1", status), 0.5)
+        finally:
+            slow.cancel()
+
+    assert asyncio.run(run()) == 200
+
+
+def test_gate_limits_requests_in_flight():
+    async def run():
+        release = asyncio.Event()
+        peak = [0]
+
+        class Response(FakeAioResponse):
+            async def __aenter__(self):
+                peak[0] = max(peak[0], batch._in_flight)
+                await release.wait()
+                return self
+
+        class Session:
+            def get(self, url, **kwargs):
+                return Response(200, b"", {})
+
+        batch = picget.AsyncBatch(None, Session(), max_in_flight=2)
+
+        async def fetch(url):
+            async with batch.get(url) as response:
+                return response.status
+
+        tasks = [asyncio.create_task(fetch(f"http://h/{i}")) for i in range(5)]
+        await asyncio.sleep(0.05)
+        assert batch._in_flight == 2
+        release.set()
+        return await asyncio.gather(*tasks), peak[0]
+
+    results, peak = asyncio.run(run())
+    assert results == [200] * 5 and peak == 2
@@ -0,0 +1,64 @@
+import pytest
+import requests
+
+import picget
+
+
+def test_trips_after_consecutive_failures_per_host():
+    breaker = picget.HostCircuitBreaker(failure_threshold=3, cooldown=60)
+    for _ in range(2):
+        breaker.record_failure("http://a/x")
+    breaker.allow("http://a/x")
+    breaker.record_failure("http://a/y")
+    with pytest.raises(picget.CircuitOpenError):
+        breaker.allow("http://a/z")
+    breaker.allow("http://b/x")  # 其他主机不受影响
+    assert breaker.trips == 1 and breaker.rejected == 1
+    assert breaker.open_hosts() == ["a"]
+
+
+def test_success_resets_the_failure_count():
+    breaker = picget.HostCircuitBreaker(failure_threshold=2, cooldown=60)
+    breaker.record_failure("http://a/")
+    breaker.record_response("http://a/", 200)
+    breaker.record_failure("http://a/")
+    breaker.allow("http://a/")
+
+
+def test_half_open_probe_success_closes_the_circuit():
+    breaker = picget.HostCircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure("http://a/")
+    breaker.allow("http://a/")  # 冷却结束，作为探测请求放行
+    with pytest.raises(picget.CircuitOpenError):
+        breaker.allow("http://a/")  # 探测期间其他请求仍被拒绝
+    breaker.record_success("http://a/")
+    breaker.allow("http://a/")
+    assert breaker.open_hosts() == []
+
+
+def test_half_open_probe_failure_reopens_with_longer_cooldown(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(picget.time, "monotonic", lambda: now[0])
+    breaker = picget.HostCircuitBreaker(failure_threshold=1, cooldown=10)
+    breaker.record_failure("http://a/")
+    now[0] += 10
+    breaker.allow("http://a/")
+    breaker.record_failure("http://a/")  # 探测失败，冷却时间翻倍
+    now[0] += 10
+    with pytest.raises(picget.CircuitOpenError):
+        breaker.allow("http://a/")
+    now[0] += 10
+    breaker.allow("http://a/")
+
+
+def test_only_server_and_transport_errors_count():
+    breaker = picget.HostCircuitBreaker(failure_threshold=1, cooldown=60)
+    breaker.record_response("http://a/", 404)
+    breaker.record_error("http://a/", requests.exceptions.HTTPError())
+    breaker.allow("http://a/")
+    breaker.record_error("http://a/", requests.exceptions.ChunkedEncodingError())
+    with pytest.raises(picget.CircuitOpenError):
+        breaker.allow("http://a/")
+    breaker.record_response("http://b/", 503)
+    with pytest.raises(picget.CircuitOpenError):
+        breaker.allow("http://b/")
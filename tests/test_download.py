@@ -0,0 +1,179 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+
+import requests
+
+import picget
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None, fail_after=None):
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self._body = body
+        self._fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+    def iter_content(self, chunk_size=1):
+        if self._fail_after is not None:
+            yield self._body[:self._fail_after]
+            raise requests.exceptions.ChunkedEncodingError("connection broken")
+        yield self._body
+
+
+def make_app(responses):
+    app = picget.PicGetApp.__new__(picget.PicGetApp)
+    app.http = picget.HttpSessionPool()
+    app.http.retry.base_delay = 0
+    app.segment_connections = 1
+    app.get_headers = lambda: {}
+    sent = []
+
+    def fake_get(url, **kwargs):
+        sent.append(kwargs.get("headers", {}))
+        return responses.pop(0)
+
+    app.http.session.get = fake_get
+    return app, sent
+
+
+def test_body_error_counts_as_breaker_failure_and_resumes(tmp_path):
+    body = b"x" * 100
+    app, sent = make_app([
+        FakeResponse(200, body, {"Content-Length": "100", "ETag": '"v"'}, fail_after=40),
+        FakeResponse(206, body[40:], {"Content-Length": "60", "Content-Range": "bytes 40-99/100", "ETag": '"v"'}),
+    ])
+    failures = []
+    app.http.breaker.record_failure = failures.append
+
+    target = tmp_path / "video.mp4"
+    assert app.download_file("http://h/video.mp4", str(target))
+    assert target.read_bytes() == body
+    assert failures == ["http://h/video.mp4"]
+    assert sent[1]["Range"] == "bytes=40-"
+
+
+def test_rate_limiter_waits_before_taking_a_concurrency_slot(tmp_path):
+    body = b"y" * 10
+    app, _ = make_app([FakeResponse(200, body, {"Content-Length": "10"})])
+    events = []
+    acquire = app.http.limiter.acquire
+
+    def tracked_acquire(url, rate=None):
+        events.append("acquire")
+        return acquire(url, rate)
+
+    class Controller:
+        @contextmanager
+        def track(self):
+            events.append("enter")
+            yield
+            events.append("exit")
+
+    app.http.limiter.acquire = tracked_acquire
+    app.download_file("http://h/a.mp4", str(tmp_path / "a.mp4"), controller=Controller())
+    assert events == ["acquire", "enter", "exit"]
+
+
+class FakeAioResponse:
+    def __init__(self, status, body, headers):
+        self.status = status
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = self
+        self._body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+    async def iter_chunked(self, size):
+        yield self._body
+
+
+class FakeAioSession:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, **kwargs):
+        return self.response
+
+
+def test_async_image_download_writes_off_the_event_loop(tmp_path, monkeypatch):
+    body = b"\xff\xd8\xff" + b"z" * 100
+    app, _ = make_app([])
+    app.url_skip_mode = "off"
+    app.hash_algorithm = "md5"
+    app.active_parts = picget.ConcurrentHashSet()
+    app.downloaded_images = picget.ConcurrentHashSet()
+    loop_threads = []
+    write_threads = []
+    write = picget.JpegStreamWriter.write
+
+    def recording_write(self, chunk):
+        write_threads.append(threading.get_ident())
+        return write(self, chunk)
+
+    monkeypatch.setattr(picget.JpegStreamWriter, "write", recording_write)
+
+    async def run():
+        loop_threads.append(threading.get_ident())
+        session = FakeAioSession(FakeAioResponse(200, body, {"Content-Length": str(len(body))}))
+        return await app.download_image_async(session, "http://h/p.jpg", str(tmp_path), {})
+
+    assert asyncio.run(run())
+    assert (tmp_path / "p.jpg").read_bytes() == body
+    assert write_threads and loop_threads[0] not in write_threads
+
+
+def test_image_download_resumes_after_a_body_error(tmp_path):
+    body = b"\xff\xd8\xff" + b"j" * 97
+    app, sent = make_app([
+        FakeResponse(200, body, {"Content-Length": "100", "ETag": '"v"'}, fail_after=40),
+        FakeResponse(206, body[40:], {"Content-Length": "60", "Content-Range": "bytes 40-99/100", "ETag": '"v"'}),
+    ])
+    app.url_skip_mode = "off"
+    app.hash_algorithm = "md5"
+    app.active_parts = picget.ConcurrentHashSet()
+    app.downloaded_images = picget.ConcurrentHashSet()
+
+    assert app.download_image("http://h/q.jpg", "f", str(tmp_path), headers={})
+    assert (tmp_path / "q.jpg").read_bytes() == body
+    assert sent[1]["Range"] == "bytes=40-"
+
+
+def test_ts_segment_resumes_from_the_received_bytes():
+    body = b"t" * 100
+    app, sent = make_app([
+        FakeResponse(200, body, {"Content-Length": "100", "ETag": '"s"'}, fail_after=40),
+        FakeResponse(206, body[40:], {"Content-Length": "60", "Content-Range": "bytes 40-99/100", "ETag": '"s"'}),
+    ])
+    assert app.fetch_segment("http://h/1.ts") == body
+    assert "Range" not in sent[0]
+    assert sent[1]["Range"] == "bytes=40-" and sent[1]["If-Range"] == '"s"'
+
+
+def test_ts_segment_restarts_when_the_range_does_not_match():
+    body = b"u" * 100
+    app, sent = make_app([
+        FakeResponse(200, body, {"Content-Length": "100", "ETag": '"s"'}, fail_after=40),
+        FakeResponse(206, body[50:], {"Content-Range": "bytes 50-99/100"}),
+        FakeResponse(200, body, {"Content-Length": "100"}),
+    ])
+    assert app.fetch_segment("http://h/1.ts") == body
+    assert "Range" not in sent[2]
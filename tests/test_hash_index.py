@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+import picget
+
+
+def save_file(directory, name, data=b"\xff\xd8\xffdata"):
+    path = os.path.join(directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def make_app(mode):
+    app = picget.PicGetApp.__new__(picget.PicGetApp)
+    app.url_skip_mode = mode
+    return app
+
+
+@pytest.fixture
+def index(tmp_path):
+    return picget.HashIndex(str(tmp_path))
+
+
+def test_record_and_lookup(index, tmp_path):
+    path = save_file(str(tmp_path), os.path.join("album", "1.jpg"))
+    assert index.lookup("md5:abc") is None
+    index.record("md5:abc", 7, "http://x/1.jpg", path)
+    assert index.lookup("md5:abc") == path
+    os.remove(path)
+    assert index.lookup("md5:abc") is None
+
+
+def test_lookup_url_requires_the_saved_file(index, tmp_path):
+    path = save_file(str(tmp_path), "1.jpg")
+    index.record("md5:abc", 7, "http://x/1.jpg", path)
+    index.record_url("http://x/1.jpg", '"v1"', "Mon, 01 Jan 2024 00:00:00 GMT", 7, "md5:abc")
+    assert index.lookup_url("http://x/1.jpg") == {
+        "etag": '"v1"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT", "length": 7, "hash": "md5:abc"}
+    assert index.lookup_url("http://x/2.jpg") is None
+    os.remove(path)
+    assert index.lookup_url("http://x/1.jpg") is None
+
+
+def test_check_known_url_follows_the_skip_mode(index, tmp_path):
+    path = save_file(str(tmp_path), "1.jpg")
+    index.record("md5:abc", 7, "http://x/1.jpg", path)
+    index.record_url("http://x/1.jpg", '"v1"', "Mon, 01 Jan 2024 00:00:00 GMT", 7, "md5:abc")
+    index.record("md5:def", 7, "http://x/2.jpg", path)
+    index.record_url("http://x/2.jpg", None, None, 7, "md5:def")
+
+    assert make_app("off").check_known_url("http://x/1.jpg", index) == (False, None)
+    assert make_app("skip").check_known_url("http://x/1.jpg", index) == (True, None)
+    assert make_app("skip").check_known_url("http://x/3.jpg", index) == (False, None)
+    assert make_app("skip").check_known_url("http://x/1.jpg", None) == (False, None)
+    assert make_app("revalidate").check_known_url("http://x/1.jpg", index) == (False, {
+        "If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    # 没有任何验证信息时无法发条件请求，照常下载
+    assert make_app("revalidate").check_known_url("http://x/2.jpg", index) == (False, None)
+
+
+def test_records_persist_across_instances(tmp_path):
+    root = str(tmp_path)
+    path = save_file(root, os.path.join("album", "1.jpg"))
+    first = picget.HashIndex(root)
+    first.record("md5:abc", 7, "http://x/1.jpg", path)
+    first.record_url("http://x/1.jpg", '"v1"', None, 7, "md5:abc")
+    first.record_phash(path, 0xFFFF000000000001)
+
+    # 第一个连接仍然打开，写入还在WAL文件里
+    assert os.path.exists(first.path + "-wal")
+    second = picget.HashIndex(root)
+    assert second.lookup("md5:abc") == path
+    assert second.lookup_url("http://x/1.jpg")["etag"] == '"v1"'
+
+    # 两个连接都关闭后重新打开，WAL中的记录不会丢失
+    first._conn.close()
+    second._conn.close()
+    third = picget.HashIndex(root)
+    assert third.lookup("md5:abc") == path
+    assert third.load_phashes() == [(path, 0xFFFF000000000001)]
+    third._conn.close()
+
+
+def test_index_follows_a_moved_download_root(tmp_path):
+    old_root = str(tmp_path / "old")
+    path = save_file(old_root, os.path.join("album", "1.jpg"))
+    index = picget.HashIndex(old_root)
+    index.record("md5:abc", 7, "http://x/1.jpg", path)
+    index._conn.close()
+
+    new_root = str(tmp_path / "new")
+    os.rename(old_root, new_root)
+    moved = picget.HashIndex(new_root)
+    assert moved.lookup("md5:abc") == os.path.join(new_root, "album", "1.jpg")
+    moved._conn.close()
@@ -0,0 +1,42 @@
+import json
+
+import picget
+
+
+def test_links_keep_discovery_order():
+    store = picget.LinkStore()
+    assert store.add_many(["http://h/3", "http://h/1"], source="page1") == ["http://h/3", "http://h/1"]
+    assert store.add_many(["http://h/2"], source="page2") == ["http://h/2"]
+    assert list(store) == ["http://h/3", "http://h/1", "http://h/2"]
+    assert store[1] == "http://h/1" and len(store) == 3
+    assert store.meta("http://h/2")["source"] == "page2"
+
+
+def test_repeated_links_are_ignored():
+    store = picget.LinkStore()
+    store.add_many(["http://h/a", "http://h/b"], source="page1")
+    assert store.add_many(["http://h/b", "http://h/c", "http://h/a", "http://h/c"], source="page2") == ["http://h/c"]
+    assert list(store) == ["http://h/a", "http://h/b", "http://h/c"]
+    assert store.meta("http://h/b")["source"] == "page1"  # 保留第一次发现时的来源
+
+
+def test_reload_after_restart_restores_order_and_metadata(tmp_path):
+    path = str(tmp_path / "links.jsonl")
+    store = picget.LinkStore()
+    store.add_many([f"http://h/{i}" for i in (5, 2, 9)], source="列表页")
+    assert store.save(path) == 3
+    assert not (tmp_path / "links.jsonl.tmp").exists()
+
+    reloaded = picget.LinkStore()  # 模拟重新启动程序
+    assert reloaded.load(path) == ["http://h/5", "http://h/2", "http://h/9"]
+    assert reloaded.meta("http://h/2") == store.meta("http://h/2")
+    assert json.loads((tmp_path / "links.jsonl").read_text(encoding="utf-8").splitlines()[0])["source"] == "列表页"
+
+
+def test_load_appends_and_skips_known_links(tmp_path):
+    path = tmp_path / "links.txt"
+    path.write_text("http://h/1\n\nhttp://h/2\n{\"url\": \"http://h/3\"}\n{bad\nhttp://h/1\n", encoding="utf-8")
+    store = picget.LinkStore()
+    store.add_many(["http://h/2"])
+    assert store.load(str(path)) == ["http://h/1", "http://h/3"]
+    assert list(store) == ["http://h/2", "http://h/1", "http://h/3"]
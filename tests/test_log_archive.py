@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+import picget
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = picget.LogArchive(str(tmp_path), max_bytes=200, backup_count=3)
+    yield archive
+    for handler in archive._logger.handlers:
+        handler.close()
+
+
+def test_search_spans_rotated_files_oldest_first(archive):
+    for i in range(20):
+        archive.write("主页", f"line {i:02d} 图片")
+    files = archive.files()
+    assert len(files) > 1
+    assert files[-1] == archive.path
+    lines = archive.search("line")
+    numbers = [int(line.split("line ")[1][:2]) for line in lines]
+    # 超出backup_count的最早文件被删除，剩下的按时间顺序返回
+    assert numbers == sorted(numbers)
+    assert numbers[-1] == 19
+    assert all("[主页]" in line and line.endswith("图片") for line in lines)
+
+
+def test_search_matches_utf8_text_and_respects_limit(archive):
+    for i in range(10):
+        archive.write("图集", f"保存第{i}张")
+    assert [line.split("保存")[1] for line in archive.search("保存", limit=3)] == ["第7张", "第8张", "第9张"]
+    assert len(archive.search("第5张")) == 1
+    assert archive.search("不存在") == []
+    assert archive.search("") == []
+
+
+def test_multiline_messages_are_written_as_one_line(archive):
+    archive.write("主页", "first\nsecond\n")
+    assert len(archive.search("first second")) == 1
+
+
+def test_search_skips_empty_files(archive):
+    open(archive.path, "w").close()
+    assert archive.search("x") == []
+
+
+def test_unwritable_directory_disables_the_archive(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    archive = picget.LogArchive(os.path.join(str(blocker), "logs"))
+    assert archive.error
+    archive.write("主页", "ignored")
+    assert archive.search("ignored") == []
@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+import picget
+
+
+def test_bktree_search_and_remove():
+    tree = picget.BKTree()
+    tree.add(0b0000, "a")
+    tree.add(0b0011, "b")
+    tree.add(0b1111, "c")
+    assert tree.search(0b0001, 1) == [(1, "a"), (1, "b")]
+    tree.remove("a")
+    assert tree.search(0b0001, 1) == [(1, "b")]
+    assert tree.size == 2
+    tree.add(0b0000, "a")
+    assert (1, "a") in tree.search(0b0001, 1)
+
+
+def test_bktree_remove_ignores_unknown_payloads():
+    tree = picget.BKTree()
+    tree.add(0b0000, "a")
+    tree.remove("missing")
+    tree.remove("a")
+    tree.remove("a")
+    assert tree.size == 0
+    tree.add(0b0001, "missing")
+    assert tree.search(0b0001, 0) == [(0, "missing")]
+
+
+def hashed(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+@pytest.fixture
+def index(tmp_path):
+    return picget.HashIndex(str(tmp_path))
+
+
+def test_drop_keeps_new_file_when_match_is_gone(tmp_path, index):
+    old = tmp_path / "old" / "1.jpg"
+    old.parent.mkdir()
+    old.write_bytes(b"old")
+    index.record_phash(str(old), 0xFF)
+    old.unlink()  # 用户删除了原来的文件夹
+    new = tmp_path / "new.jpg"
+    new.write_bytes(b"new")
+
+    deduper = picget.PerceptualDeduper(index, threshold=6, action="drop")
+    deduper._on_hashed(hashed(0xFE), str(new), "md5:x", None)
+
+    assert new.exists()
+    assert deduper.dropped == 0
+    assert [path for path, _ in index.load_phashes()] == [str(new)]
+
+
+def test_drop_removes_new_file_when_match_exists(tmp_path, index):
+    old = tmp_path / "old.jpg"
+    old.write_bytes(b"old")
+    index.record_phash(str(old), 0xFF)
+    new = tmp_path / "new.jpg"
+    new.write_bytes(b"new")
+
+    deduper = picget.PerceptualDeduper(index, threshold=6, action="drop")
+    deduper._on_hashed(hashed(0xFE), str(new), "md5:x", None)
+
+    assert not new.exists()
+    assert deduper.dropped == 1
+
+
+def test_close_shuts_down_the_worker_pool(index):
+    deduper = picget.PerceptualDeduper(index)
+    shutdowns = []
+
+    class Pool:
+        def shutdown(self, wait=True, cancel_futures=False):
+            shutdowns.append((wait, cancel_futures))
+
+    deduper._pool = Pool()
+    deduper.close()
+    deduper.close()
+    assert shutdowns == [(False, True)]
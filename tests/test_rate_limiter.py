@@ -0,0 +1,42 @@
+import time
+
+import picget
+
+
+def test_burst_then_rate():
+    limiter = picget.HostRateLimiter()
+    waits = [limiter.reserve("http://h/x", (10.0, 3)) for _ in range(5)]
+    assert waits[:3] == [0, 0, 0]
+    assert 0.09 < waits[3] <= 0.1
+    assert 0.19 < waits[4] <= 0.2
+
+
+def test_alternating_fallbacks_share_one_bucket():
+    limiter = picget.HostRateLimiter()
+    granted = 0
+    deadline = time.monotonic() + 0.5
+    while time.monotonic() < deadline:
+        for fallback in ((1.0, 1), (2.0, 2)):
+            if limiter.reserve("http://h/a", fallback) == 0:
+                granted += 1
+    # 初始突发1个，0.5秒内最多再补充约1个
+    assert granted <= 3
+
+
+def test_configured_host_rate_wins():
+    limiter = picget.HostRateLimiter()
+    limiter.configure(0, 1, {"example.com": (1.0, 1)})
+    assert limiter.reserve("http://cdn.example.com/a", (1000.0, 1000)) == 0
+    assert limiter.reserve("http://img.example.com/b", (1000.0, 1000)) > 0.9
+    assert limiter.reserve("http://other.org/", None) == 0
+
+
+def test_first_rate_seen_for_a_host_sticks_until_configure():
+    limiter = picget.HostRateLimiter()
+    limiter.reserve("http://h/list", (4.0, 1))
+    # 同一主机的详情页请求给出更低的后备速率，不改变已有的令牌桶
+    assert 0.2 < limiter.reserve("http://h/detail", (1.0, 1)) <= 0.25
+    assert 0.45 < limiter.reserve("http://h/list", (4.0, 1)) <= 0.5
+    limiter.configure(0, 1, {})
+    assert limiter.reserve("http://h/detail", (1.0, 1)) == 0
+    assert 0.9 < limiter.reserve("http://h/detail", (4.0, 1)) <= 1.0
@@ -0,0 +1,79 @@
+import pytest
+import requests
+
+import picget
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.exceptions.HTTPError(response=response)
+
+
+def test_classifies_retryable_errors():
+    policy = picget.RetryPolicy()
+    assert policy.is_retryable(http_error(503))
+    assert policy.is_retryable(http_error(429))
+    assert not policy.is_retryable(http_error(404))
+    assert policy.is_retryable(requests.exceptions.ConnectionError())
+    assert policy.is_retryable(picget.IncompleteDownload("short"))
+    assert not policy.is_retryable(ValueError())
+
+
+def test_stops_after_max_attempts():
+    policy = picget.RetryPolicy(max_attempts=3)
+    error = requests.exceptions.Timeout()
+    assert policy.next_delay("http://h/", error, 0) is not None
+    assert policy.next_delay("http://h/", error, 1) is not None
+    assert policy.next_delay("http://h/", error, 2) is None
+    assert policy.retries == 2 and policy.gave_up == 1
+
+
+def test_open_circuit_is_not_retried():
+    policy = picget.RetryPolicy()
+    assert policy.next_delay("http://h/", picget.CircuitOpenError("open"), 0) is None
+
+
+def test_budget_is_per_host_and_earned_by_successes():
+    policy = picget.RetryPolicy(budget_initial=1, budget_per_second=0, budget_ratio=0.5)
+    error = requests.exceptions.ConnectionError()
+    assert policy.next_delay("http://a/", error, 0) is not None
+    assert policy.next_delay("http://a/", error, 0) is None  # 预算耗尽
+    assert policy.next_delay("http://b/", error, 0) is not None  # 其他主机不受影响
+    policy.succeeded("http://a/")
+    policy.succeeded("http://a/")
+    assert policy.next_delay("http://a/", error, 0) is not None
+
+
+def test_backoff_honours_retry_after():
+    policy = picget.RetryPolicy(base_delay=0.01, max_retry_after=5)
+    assert policy.backoff(0, http_error(503, {"Retry-After": "3"})) == 3
+    assert policy.backoff(0, http_error(503, {"Retry-After": "600"})) == 5
+    assert policy.backoff(0, http_error(503)) <= 0.01
+
+
+def test_call_retries_until_success():
+    policy = picget.RetryPolicy(base_delay=0)
+    results = [requests.exceptions.ConnectionError(), requests.exceptions.Timeout(), "ok"]
+
+    def attempt():
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert policy.call("http://h/", attempt) == "ok"
+
+
+def test_call_raises_non_retryable_errors_immediately():
+    policy = picget.RetryPolicy(base_delay=0)
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise http_error(404)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        policy.call("http://h/", attempt)
+    assert len(calls) == 1
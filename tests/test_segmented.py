@@ -0,0 +1,59 @@
+import re
+import threading
+
+import picget
+from test_download import FakeResponse
+
+
+class FakeHttp:
+    """按Range返回206分段响应，并记录发出请求的线程"""
+
+    def __init__(self, body):
+        self.body = body
+        self.threads = set()
+        self.retry = picget.RetryPolicy(base_delay=0)
+        self.breaker = picget.HostCircuitBreaker()
+
+    def admit(self, url, rate=None):
+        pass
+
+    def get(self, url, headers=None, **kwargs):
+        self.threads.add(threading.get_ident())
+        start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", headers["Range"]).groups())
+        return FakeResponse(206, self.body[start:end + 1], {
+            "Content-Range": f"bytes {start}-{end}/{len(self.body)}",
+        })
+
+
+def download(tmp_path, connections, slots):
+    body = bytes(range(256)) * 4 * 1024 * 3  # 3MB，按1MB分成3段
+    http = FakeHttp(body)
+    part = tmp_path / "big.bin.part"
+    picget.SegmentedDownload(http, "http://h/big.bin", str(part), len(body),
+                             connections=connections, slots=slots).run()
+    assert part.read_bytes() == body
+    return http.threads
+
+
+def test_without_spare_slots_runs_on_the_calling_thread(tmp_path):
+    slots = picget.SegmentSlots(0)
+    assert download(tmp_path, 3, slots) == {threading.get_ident()}
+
+
+def test_helper_threads_return_their_slots(tmp_path):
+    slots = picget.SegmentSlots(1)
+    threads = download(tmp_path, 3, slots)
+    assert threading.get_ident() in threads and len(threads) <= 2
+    assert slots.used == 0
+
+
+def test_shrinking_slots_keeps_the_cap_for_running_downloads():
+    slots = picget.SegmentSlots(3)
+    assert slots.try_acquire() and slots.try_acquire()
+    slots.resize(1)  # 新一次下载开始时调整上限，已领出的名额稍后归还
+    assert not slots.try_acquire()
+    slots.release()
+    assert not slots.try_acquire()
+    slots.release()
+    assert slots.try_acquire()
+    assert not slots.try_acquire()
@@ -0,0 +1,112 @@
+from contextlib import contextmanager
+
+import pytest
+import requests
+
+import picget
+
+
+def test_resize_grows_only_and_closes_retired_adapter(monkeypatch):
+    pool = picget.HttpSessionPool(pool_size=4)
+    old = pool.session.get_adapter("http://example.com/")
+    closed = []
+    monkeypatch.setattr(old, "close", lambda: closed.append(old))
+
+    pool.resize(2)  # 不缩小，保留现有连接
+    assert pool.session.get_adapter("http://example.com/") is old
+    assert closed == []
+
+    pool.resize(8)
+    assert pool.session.get_adapter("https://example.com/") is not old
+    assert pool.pool_size == 8
+    assert closed == [old]
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def test_only_successful_responses_earn_retry_budget(monkeypatch):
+    pool = picget.HttpSessionPool()
+    credited = []
+    monkeypatch.setattr(pool.retry, "succeeded", credited.append)
+    for status in (200, 304, 403, 404, 503):
+        monkeypatch.setattr(pool.session, "get", lambda url, status=status, **kwargs: FakeResponse(status))
+        pool.get(f"http://h/{status}")
+    assert credited == ["http://h/200", "http://h/304"]
+
+
+class StreamResponse(FakeResponse):
+    def __init__(self, status_code, error=None):
+        super().__init__(status_code)
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def transfer_pool(monkeypatch, responses):
+    pool = picget.HttpSessionPool()
+    pool.retry.base_delay = 0
+    sent = []
+
+    def fake_get(url, headers=None, **kwargs):
+        sent.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(pool.session, "get", fake_get)
+    return pool, sent
+
+
+def handle(response):
+    if response.error:
+        raise response.error
+    if response.status_code == 416:
+        return picget.HttpSessionPool.RETRY
+    return response.status_code
+
+
+def test_transfer_retries_body_errors_with_fresh_headers(monkeypatch):
+    body_error = requests.exceptions.ChunkedEncodingError()
+    pool, sent = transfer_pool(monkeypatch, [StreamResponse(200, body_error), StreamResponse(206)])
+    failures, suspended = [], []
+    monkeypatch.setattr(pool.breaker, "record_failure", failures.append)
+    offsets = iter(["bytes=0-", "bytes=40-"])
+
+    result = pool.transfer("http://h/f", handle, headers=lambda: {"Range": next(offsets)},
+                           on_error=lambda: suspended.append(1))
+    assert result == 206
+    assert [h["Range"] for h in sent] == ["bytes=0-", "bytes=40-"]
+    assert failures == ["http://h/f"] and suspended == [1]
+
+
+def test_transfer_reissues_on_retry_and_gives_up_after_max_attempts(monkeypatch):
+    pool, sent = transfer_pool(monkeypatch, [StreamResponse(416) for _ in range(4)])
+    assert pool.transfer("http://h/f", handle) is None
+    assert len(sent) == pool.retry.max_attempts
+
+
+def test_transfer_raises_non_retryable_errors(monkeypatch):
+    pool, sent = transfer_pool(monkeypatch, [StreamResponse(404, requests.exceptions.HTTPError("404"))])
+    with pytest.raises(requests.exceptions.HTTPError):
+        pool.transfer("http://h/f", handle)
+    assert len(sent) == 1
+
+
+def test_transfer_waits_for_the_limiter_before_the_controller(monkeypatch):
+    pool, _ = transfer_pool(monkeypatch, [StreamResponse(200)])
+    events = []
+    monkeypatch.setattr(pool.limiter, "acquire", lambda url, rate=None: events.append("acquire"))
+
+    class Controller:
+        @contextmanager
+        def track(self):
+            events.append("track")
+            yield
+
+    pool.transfer("http://h/f", handle, controller=Controller())
+    assert events == ["acquire", "track"]
@@ -0,0 +1,108 @@
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import picget
+
+
+def segments(count):
+    return [(i, f"http://h/{i}.ts") for i in range(count)]
+
+
+def payload(index):
+    return bytes([index]) * (10 + index)
+
+
+def test_out_of_order_segments_are_written_in_playlist_order(tmp_path):
+    out = tmp_path / "v.mp4"
+    assembler = picget.TsStreamAssembler(str(out), segments(5))
+    for index in (3, 1, 4, 0, 2):
+        assembler.add(index, payload(index))
+    assert assembler.close() == []
+    assert out.read_bytes() == b"".join(payload(i) for i in range(5))
+
+
+def test_spilled_segments_are_copied_back_outside_the_lock(tmp_path, monkeypatch):
+    out = tmp_path / "v.mp4"
+    assembler = picget.TsStreamAssembler(str(out), segments(4), max_buffer_bytes=12)
+    append_file = picget.append_file
+    copies = []
+
+    def unlocked_append_file(dst, src_path, method=None):
+        assert not assembler._lock.locked()
+        copies.append(src_path)
+        return append_file(dst, src_path, method)
+
+    monkeypatch.setattr(picget, "append_file", unlocked_append_file)
+    for index in (1, 2, 3, 0):
+        assembler.add(index, payload(index))
+    assert assembler.spilled == 2 and len(copies) == 2
+    assert assembler.close() == []
+    assert out.read_bytes() == b"".join(payload(i) for i in range(4))
+
+
+def test_failed_segments_are_reported_missing(tmp_path):
+    out = tmp_path / "v.mp4"
+    assembler = picget.TsStreamAssembler(str(out), segments(3))
+    assembler.add(0, payload(0))
+    assembler.add(1, None)
+    assert assembler.close() == [1, 2]
+    assert out.read_bytes() == payload(0)
+
+
+def test_resume_continues_after_the_last_written_segment(tmp_path):
+    out = tmp_path / "v.mp4"
+    assembler = picget.TsStreamAssembler(str(out), segments(4))
+    assembler.add(0, payload(0))
+    assembler.add(1, payload(1))
+    assembler.add(3, payload(3))  # 乱序缓冲，中断后丢失
+    assembler.abort()
+
+    resumed = picget.TsStreamAssembler(str(out), segments(4))
+    assert resumed.resumed == 2
+    assert [i for i in range(4) if resumed.needed(i)] == [2, 3]
+    resumed.add(2, payload(2))
+    resumed.add(3, payload(3))
+    assert resumed.close() == []
+    assert out.read_bytes() == b"".join(payload(i) for i in range(4))
+
+
+def test_resume_rewinds_to_the_first_missing_segment(tmp_path):
+    out = tmp_path / "v.mp4"
+    assembler = picget.TsStreamAssembler(str(out), segments(4))
+    assembler.add(0, payload(0))
+    assembler.add(1, None)
+    assembler.add(2, payload(2))
+    assembler.abort()
+    assert json.loads((tmp_path / "v.mp4.part.json").read_text())["missing"] == [1]
+
+    resumed = picget.TsStreamAssembler(str(out), segments(4))
+    assert resumed.resumed == 1
+    assert resumed.needed(1) and resumed.needed(2)
+    for index in (1, 2, 3):
+        resumed.add(index, payload(index))
+    assert resumed.close() == []
+    assert out.read_bytes() == b"".join(payload(i) for i in range(4))
+
+
+def test_resume_ignores_a_different_playlist(tmp_path):
+    out = tmp_path / "v.mp4"
+    assembler = picget.TsStreamAssembler(str(out), segments(3))
+    assembler.add(0, payload(0))
+    assembler.abort()
+
+    other = picget.TsStreamAssembler(str(out), segments(4))
+    assert other.resumed == 0
+    other.discard()
+
+
+def test_concurrent_delivery_keeps_playlist_order(tmp_path):
+    out = tmp_path / "v.mp4"
+    count = 200
+    assembler = picget.TsStreamAssembler(str(out), segments(count), max_buffer_bytes=500)
+    order = list(range(count))
+    random.Random(7).shuffle(order)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda i: assembler.add(i, payload(i)), order))
+    assert assembler.close() == []
+    assert out.read_bytes() == b"".join(payload(i) for i in range(count))
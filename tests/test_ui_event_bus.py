@@ -0,0 +1,104 @@
+import picget
+
+
+class FakeText:
+    """只实现UiEventBus用到的Text方法，不需要显示器"""
+    
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+        self.text = ""
+    
+    def insert(self, index, text):
+        self.calls.append((self.name, text))
+        self.text += text
+    
+    def index(self, index):
+        return f"{self.text.count(chr(10)) + 1}.0"
+    
+    def delete(self, first, last):
+        drop = int(last.split(".")[0]) - 1
+        self.text = "".join(self.text.splitlines(keepends=True)[drop:])
+    
+    def see(self, index):
+        pass
+
+
+class FakeProgress:
+    def __init__(self):
+        self.values = []
+    
+    def configure(self, value):
+        self.values.append(value)
+
+
+class FakeRoot:
+    def __init__(self):
+        self.scheduled = []
+    
+    def after(self, delay, func):
+        self.scheduled.append((delay, func))
+
+
+def test_logs_for_one_widget_coalesce_into_one_insert():
+    calls = []
+    a, b = FakeText("a", calls), FakeText("b", calls)
+    bus = picget.UiEventBus(FakeRoot())
+    bus.log(a, "1")
+    bus.log(b, "x")
+    bus.log(a, "2")
+    bus.log(a, "3")
+    bus.flush()
+    assert calls == [("a", "1\n2\n3\n"), ("b", "x\n")]
+    assert a.text == "1\n2\n3\n"
+
+
+def test_callbacks_run_in_submission_order():
+    calls = []
+    a = FakeText("a", calls)
+    bus = picget.UiEventBus(FakeRoot())
+    bus.log(a, "1")
+    bus.call(lambda: calls.append(("call", a.text)))
+    bus.log(a, "2")
+    bus.flush()
+    # 回调之前提交的日志已经写出，之后的日志在回调之后写出
+    assert calls == [("a", "1\n"), ("call", "1\n"), ("a", "2\n")]
+
+
+def test_progress_applies_only_the_latest_value():
+    bar = FakeProgress()
+    bus = picget.UiEventBus(FakeRoot())
+    for value in range(10):
+        bus.progress(bar, value)
+    bus.flush()
+    bus.flush()
+    assert bar.values == [9]
+
+
+def test_backlog_beyond_max_events_waits_for_the_next_tick():
+    calls = []
+    a = FakeText("a", calls)
+    root = FakeRoot()
+    bus = picget.UiEventBus(root, max_events=2)
+    for line in "1234":
+        bus.log(a, line)
+    bus.start()
+    _, tick = root.scheduled.pop()
+    tick()
+    assert a.text == "1\n2\n"
+    _, tick = root.scheduled.pop()
+    tick()
+    assert a.text == "1\n2\n3\n4\n"
+    _, tick = root.scheduled.pop()
+    bus.stop()
+    tick()
+    assert root.scheduled == []
+
+
+def test_text_keeps_only_the_last_max_lines():
+    a = FakeText("a", [])
+    bus = picget.UiEventBus(FakeRoot(), max_lines=3)
+    for line in "12345":
+        bus.log(a, line)
+    bus.flush()
+    assert a.text == "3\n4\n5\n"
@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import picget
+
+
+class FakeSurface:
+    """代替内部tk.Listbox的显示表面，每行高10像素，不需要显示器"""
+    
+    def __init__(self, rows):
+        self.rows = rows
+        self.items = []
+        self.selected = set()
+    
+    def delete(self, first, last):
+        self.items = []
+        self.selected = set()
+    
+    def insert(self, index, *items):
+        self.items.extend(items)
+    
+    def selection_set(self, index):
+        self.selected.add(index)
+    
+    def yview_moveto(self, fraction):
+        pass
+    
+    def nearest(self, y):
+        return min(y // 10, len(self.items) - 1)
+    
+    def winfo_height(self):
+        return self.rows * 10
+    
+    def focus_set(self):
+        pass
+    
+    def configure(self, **kwargs):
+        pass
+
+
+def make_listbox(model=None, rows=5):
+    # 跳过tk.Frame的初始化，只测试模型、选择和可见窗口的逻辑
+    box = picget.VirtualListbox.__new__(picget.VirtualListbox)
+    box.model = model if model is not None else []
+    box._top = 0
+    box._rows = rows
+    box._selected = set()
+    box._anchor = None
+    box._active = 0
+    box._yscrollcommand = None
+    box._listbox = FakeSurface(rows)
+    box.refresh()
+    return box
+
+
+def click(y):
+    return SimpleNamespace(y=y)
+
+
+def test_only_the_visible_window_is_rendered():
+    box = make_listbox()
+    box.insert("end", *[f"url{i}" for i in range(10000)])
+    assert box.size() == 10000
+    assert box._listbox.items == [f"url{i}" for i in range(6)]
+    box.see(5000)
+    assert box._listbox.items[0] == "url4996"
+    assert box.yview() == (0.4996, 0.5001)
+    box.yview("moveto", "1.0")
+    assert box._listbox.items == [f"url{i}" for i in range(9995, 10000)]
+
+
+def test_selection_is_kept_by_model_index():
+    box = make_listbox(list("abcdefghij"))
+    box.select_set(2, 7)
+    assert box.curselection() == (2, 3, 4, 5, 6, 7)
+    assert box._listbox.selected == {2, 3, 4, 5}
+    box.yview("scroll", "4", "units")
+    assert box._listbox.items == list("efghij")
+    assert box._listbox.selected == {0, 1, 2, 3}
+    box.selection_clear(0, "end")
+    assert box.curselection() == ()
+    assert box.get(1, 3) == ("b", "c", "d")
+
+
+def test_insert_and_delete_update_the_selection():
+    box = make_listbox(list("abcdef"))
+    box.select_set(1)
+    box.select_set(4)
+    box.insert(3, "x")
+    assert box.curselection() == (1,)
+    assert box.get(3) == "x"
+    box.delete(0, 2)
+    assert box.curselection() == ()
+    assert box.get(0, "end") == ("x", "d", "e", "f")
+
+
+def test_refresh_drops_selection_beyond_a_shrunk_model():
+    model = list("abcdef")
+    box = make_listbox(model)
+    box.select_set(2, 5)
+    del model[3:]
+    box.refresh()
+    assert box.curselection() == (2,)
+
+
+def test_click_ctrl_click_and_shift_click():
+    box = make_listbox(list("abcdefghij"))
+    box.yview("scroll", "2", "units")
+    box._on_click(click(15))  # 可见第2行 = 模型下标3
+    assert box.curselection() == (3,)
+    box._on_ctrl_click(click(35))
+    assert box.curselection() == (3, 5)
+    box._on_ctrl_click(click(35))
+    assert box.curselection() == (3,)
+    box._on_shift_click(click(45))
+    assert box.curselection() == (5, 6)
+
+
+def test_keyboard_moves_and_extends_across_the_whole_model():
+    box = make_listbox([str(i) for i in range(100)])
+    box._on_click(click(0))
+    box._move_active(1, True)
+    box._move_active(1, True)
+    assert box.curselection() == (0, 1, 2)
+    box._move_active(len(box.model), False)
+    assert box.curselection() == (99,)
+    assert box._listbox.items[-1] == "99"
+    box._on_select_all(None)
+    assert len(box.curselection()) == 100
+
+
+def test_yscrollcommand_receives_visible_fraction():
+    box = make_listbox([str(i) for i in range(20)])
+    calls = []
+    box.configure(yscrollcommand=lambda first, last: calls.append((first, last)))
+    box.see(19)
+    assert calls[0] == (0.0, 0.25)
+    assert calls[-1] == (0.75, 1.0)